@@ -0,0 +1,150 @@
+"""
+Maintenance commands.
+
+Usage (from backend/):
+    python -m app.cli reschedule [--daily-limit 10] [--dry-run]
+    python -m app.cli rebuild-stats [--learner-id UUID]
+    python -m app.cli purge-uploads [--days 7]
+"""
+import argparse
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, delete, select, union, update
+from app.core.db import async_session_maker, create_db_and_tables, engine
+from app.core.etags import bump_versions, learner_scope
+from app.core.logs import setup_logging
+from app.modules.ingest.models import IngestPage
+from app.modules.quiz.models import RemediationQueue, Revision, Score
+from app.modules.quiz.service import REMEDIATION_QUIZ_SIZE
+from app.modules.quiz.stats import rebuild_stats
+
+logger = logging.getLogger("app.cli")
+
+queue_table = RemediationQueue.__table__
+
+_reschedule_statement = (
+    update(queue_table)
+    .where(queue_table.c.id == bindparam("item_id"))
+    .values(
+        status="PENDING",
+        due_at=bindparam("due_at"),
+        repetitions=bindparam("repetitions"),
+        interval_days=bindparam("interval_days")
+    )
+)
+
+async def reschedule(daily_limit: int = REMEDIATION_QUIZ_SIZE, dry_run: bool = False) -> int:
+    """
+    Bulk (re)scheduling of the remediation queue:
+    - REVIEWED errors (reviewed once, before scheduling existed) rejoin the
+      schedule as passed once: due one day after they were last seen
+    - each learner's overdue backlog is spread over the following days,
+      at most `daily_limit` per day, most overdue (then most often failed) first
+    Returns the number of rows updated.
+    """
+    now = datetime.utcnow()
+    await create_db_and_tables() # Columns and due dates of older databases
+
+    async with engine.connect() as conn:
+        rows = (await conn.execute(
+            select(
+                queue_table.c.id, queue_table.c.learner_id, queue_table.c.status, queue_table.c.due_at,
+                queue_table.c.last_seen_at, queue_table.c.created_at, queue_table.c.repetitions, queue_table.c.interval_days,
+                queue_table.c.occurrences
+            ).where(queue_table.c.status.in_(["PENDING", "REVIEWED"]))
+        )).all()
+
+    per_learner: Dict[object, List[dict]] = defaultdict(list)
+    occurrences: Dict[object, int] = {}
+    for row in rows:
+        seen = row.last_seen_at or row.created_at
+        if row.status == "REVIEWED":
+            item = {"item_id": row.id, "due_at": seen + timedelta(days=1), "repetitions": 1, "interval_days": 1.0}
+        else:
+            item = {"item_id": row.id, "due_at": row.due_at or seen, "repetitions": row.repetitions or 0, "interval_days": row.interval_days or 0.0}
+        occurrences[row.id] = row.occurrences or 1
+        per_learner[row.learner_id].append(item)
+
+    updates = []
+    for items in per_learner.values():
+        overdue = sorted((item for item in items if item["due_at"] <= now), key=lambda item: (item["due_at"], -occurrences[item["item_id"]]))
+        for position, item in enumerate(overdue):
+            item["due_at"] = now + timedelta(days=position // daily_limit)
+        updates.extend(items)
+
+    logger.info("Rescheduling %d remediation items for %d learners", len(updates), len(per_learner))
+    if updates and not dry_run:
+        async with engine.begin() as conn:
+            await conn.execute(_reschedule_statement, updates)
+        # Revived errors are pending again (the rebuild also invalidates the learners' ETags)
+        await rebuild_learner_stats(per_learner.keys())
+    return len(updates)
+
+async def rebuild_learner_stats(learner_ids: Optional[Iterable[uuid.UUID]] = None) -> int:
+    """
+    Rebuilds the dashboard rollup (quiz.stats) of the given learners, or of
+    every learner with scores, revisions or remediation errors, and bumps
+    their ETag versions (shared with the app unless STATE_BACKEND is memory).
+    Returns the number of learners rebuilt.
+    """
+    await create_db_and_tables()
+    if learner_ids is None:
+        statement = union(
+            select(Score.learner_id).where(Score.learner_id.isnot(None)),
+            select(Revision.learner_id).where(Revision.learner_id.isnot(None)),
+            select(RemediationQueue.learner_id)
+        )
+        async with engine.connect() as conn:
+            learner_ids = (await conn.execute(statement)).scalars().all()
+
+    scopes = []
+    async with async_session_maker() as session:
+        for learner_id in learner_ids:
+            await rebuild_stats(session, learner_id)
+            scopes.append(learner_scope(learner_id))
+        await session.commit()
+    await bump_versions(*scopes)
+    logger.info("Rebuilt the stats of %d learners", len(scopes))
+    return len(scopes)
+
+async def purge_uploads(days: int = 7) -> int:
+    """Deletes the per-batch ingest results (ingest_pages) older than `days`. Returns the number of rows deleted."""
+    await create_db_and_tables()
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    async with engine.begin() as conn:
+        result = await conn.execute(delete(IngestPage.__table__).where(IngestPage.created_at < cutoff))
+    logger.info("Purged %d ingest batches older than %d days", result.rowcount, days)
+    return result.rowcount
+
+def main() -> None:
+    setup_logging()
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Reviflow maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    reschedule_parser = commands.add_parser("reschedule", help="Bulk (re)schedule the remediation queue")
+    reschedule_parser.add_argument("--daily-limit", type=int, default=REMEDIATION_QUIZ_SIZE, help="Overdue items made due per learner per day")
+    reschedule_parser.add_argument("--dry-run", action="store_true")
+
+    stats_parser = commands.add_parser("rebuild-stats", help="Rebuild the learner_stats dashboard rollup from the raw rows")
+    stats_parser.add_argument("--learner-id", type=uuid.UUID, default=None, help="Only this learner (default: all)")
+
+    purge_parser = commands.add_parser("purge-uploads", help="Delete old per-batch ingest results (no longer resumable)")
+    purge_parser.add_argument("--days", type=int, default=7, help="Keep uploads younger than this")
+
+    args = parser.parse_args()
+    if args.command == "reschedule":
+        count = asyncio.run(reschedule(args.daily_limit, args.dry_run))
+        print(f"{count} remediation items rescheduled{' (dry run)' if args.dry_run else ''}")
+    elif args.command == "rebuild-stats":
+        count = asyncio.run(rebuild_learner_stats([args.learner_id] if args.learner_id else None))
+        print(f"Stats rebuilt for {count} learners")
+    elif args.command == "purge-uploads":
+        count = asyncio.run(purge_uploads(args.days))
+        print(f"{count} ingest batches purged")
+
+if __name__ == "__main__":
+    main()
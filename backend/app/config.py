@@ -5,6 +5,23 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "SECRET_KEY_CHANGE_ME_IN_PROD"
     DATABASE_URL: str = "sqlite+aiosqlite:///./reviflow.db"
     OPENROUTER_API_KEY: str = ""
+    PASSWORD_HASH_WORKERS: int = 4 # Threads dedicated to password/PIN hashing
+    AUTH_CACHE_TTL_SECONDS: int = 30 # Authenticated-user cache lifetime (0 disables it)
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json" # json | text
+    REQUEST_LOG_SAMPLE_RATE: float = 0.01 # Share of successful requests logged (errors always are)
+    USAGE_FLUSH_INTERVAL_SECONDS: float = 5.0 # How often buffered token/cost usage is written to users
+    LLM_METRICS_TOKEN: str = "" # Bearer token to scrape /api/llm/metrics (cost and token counters); empty disables it
+    LLM_CACHE_TTL_SECONDS: int = 3600 # Identical quiz prompts answered from the shared cache (0 disables it)
+    STATE_BACKEND: str = "memory" # Caches/locks/rate limits shared by workers: memory | sql | redis://host:6379/0
+    STATE_MEMORY_MAX_ENTRIES: int = 4096
+    STATIC_DIR: str = "" # React build served by the SPA catch-all (default: backend/static)
+    COMPRESS_RESPONSES: bool = False # gzip/brotli for API responses (off when a proxy already compresses)
+    COMPRESS_MIN_BYTES: int = 1024
+    INGEST_BATCH_MAX_IMAGES: int = 10 # Ceilings of one vision call (the image count in between is learned)
+    INGEST_BATCH_MAX_BYTES: int = 12_000_000 # base64 payload
+    INGEST_BATCH_MAX_IMAGE_TOKENS: int = 8000 # Estimated from the image dimensions
+    DB_INIT_ON_STARTUP: bool = True # Turned off in workers when gunicorn already ran it (see gunicorn.conf.py)
 
     model_config = SettingsConfigDict(env_file=".env", env_ignore_empty=True)
 
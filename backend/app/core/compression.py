@@ -0,0 +1,89 @@
+"""
+On-the-fly compression of API responses (opt-in: COMPRESS_RESPONSES).
+
+A plain ASGI middleware, like MetricsMiddleware. Only single-body responses
+are compressed (every JSON response): streamed bodies, including the
+analysis SSE stream, go through untouched so events are never held back in
+a compressor buffer. Bodies under COMPRESS_MIN_BYTES, non-text types and
+already encoded responses (precompressed static files) are left alone too.
+
+Brotli (when installed) is used at a low quality: at maximum quality it is
+far too slow for per-request work.
+"""
+import gzip
+from typing import Callable, Dict
+from app.core.static import COMPRESSIBLE_TYPES, negotiate_encoding
+
+try:
+    import brotli
+except ImportError: # Optional dependency: gzip only
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors = {"gzip": lambda body: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        compressors["br"] = lambda body: brotli.compress(body, quality=BROTLI_QUALITY)
+    return compressors
+
+class CompressionMiddleware:
+    def __init__(self, app, min_size: int = 1024):
+        self.app = app
+        self.min_size = min_size
+        self.compressors = _compressors()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate_encoding(accept_encoding, self.compressors)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if message["type"] == "http.response.start":
+                # Held until the body shows whether it is worth compressing
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            passthrough = True # Decided on the first body chunk
+            if message.get("more_body", False) or not self._should_compress(start_message, body):
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self.compressors[encoding](body)
+            headers = [(name, value) for name, value in start_message["headers"] if name != b"content-length"]
+            headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, start_message, body: bytes) -> bool:
+        if len(body) < self.min_size:
+            return False
+        headers = dict(start_message["headers"])
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith("text/event-stream")
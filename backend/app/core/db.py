@@ -1,14 +1,36 @@
+import importlib
 from collections.abc import AsyncGenerator
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlmodel import SQLModel
 from app.config import settings
+from app.core.migrations import upgrade_schema
 
 engine = create_async_engine(settings.DATABASE_URL)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+# Modules declaring tables or registering backfills: imported before the schema is
+# created and upgraded, whatever the entry point (app, gunicorn master, cli)
+SCHEMA_MODULES = (
+    "app.core.state",
+    "app.modules.auth.models",
+    "app.modules.ingest.models",
+    "app.modules.llm.models",
+    "app.modules.quiz.models",
+    "app.modules.quiz.service",
+)
+
 async def create_db_and_tables():
+    for module in SCHEMA_MODULES:
+        importlib.import_module(module)
     async with engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+def dialect_insert(session: AsyncSession, table):
+    """An INSERT supporting ON CONFLICT (PostgreSQL or SQLite) for the session's database."""
+    dialect = postgresql if session.get_bind().dialect.name == "postgresql" else sqlite
+    return dialect.insert(table)
 
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
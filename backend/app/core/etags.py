@@ -0,0 +1,70 @@
+"""
+Conditional responses (ETag / 304) for read endpoints whose data only changes
+through the app's own writes.
+
+Writes bump the version of the scopes they touch (a learner, a whole account)
+after committing; reads derive a weak ETag from those versions, so a matching
+`If-None-Match` gets a 304 after one shared-state lookup, before any query.
+
+Versions are random tokens in shared_state rather than counters: a version
+lost to eviction or a restart comes back as a fresh token, never as a value a
+client may still hold.
+"""
+import hashlib
+import json
+import time
+import uuid
+from typing import Optional
+from fastapi import Request, Response
+from app.core.state import shared_state
+
+VERSION_TTL = 30 * 24 * 3600 # An expired version only costs one full response
+
+def learner_scope(learner_id: Optional[uuid.UUID], user=None) -> str:
+    """Data of a learner; the main profile (None) of `user`'s account has a scope per account."""
+    if learner_id is None:
+        return f"learner:main:{user.parent_id or user.id}"
+    return f"learner:{learner_id}"
+
+def account_scope(user) -> str:
+    """Data listed across the learners of a family account (profiles, dashboard)."""
+    return f"account:{user.parent_id or user.id}"
+
+async def bump_versions(*scopes: str) -> None:
+    """Invalidates the ETags of the scopes. Call after the write is committed."""
+    for scope in scopes:
+        await shared_state.set(f"version:{scope}", uuid.uuid4().hex, ttl=VERSION_TTL)
+
+async def get_version(scope: str) -> str:
+    key = f"version:{scope}"
+    version = await shared_state.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        await shared_state.set(key, version, ttl=VERSION_TTL)
+    return version
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison against an If-None-Match header."""
+    if not if_none_match:
+        return False
+    opaque_tag = etag.removeprefix("W/")
+    return any(tag.strip() == "*" or tag.strip().removeprefix("W/") == opaque_tag for tag in if_none_match.split(","))
+
+async def conditional_response(request: Request, response: Response, user, *scopes: str, period: Optional[int] = None) -> Optional[Response]:
+    """
+    A 304 response if the client's copy is current, else None after setting
+    the ETag on `response`. The ETag covers the URL, the caller and the scope
+    versions; `period` (seconds) also rolls it over for clock-dependent data
+    (e.g. "today" summaries).
+    """
+    versions = [await get_version(scope) for scope in scopes]
+    if period:
+        versions.append(int(time.time() // period))
+    payload = json.dumps([request.url.path, request.url.query, str(user.id), versions])
+    etag = f'W/"{hashlib.sha1(payload.encode()).hexdigest()[:16]}"'
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
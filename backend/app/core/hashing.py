@@ -0,0 +1,22 @@
+"""Password hashing helpers that keep CPU-bound work off the event loop."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from app.config import settings
+
+# Bounded pool: argon2/bcrypt release the GIL, so a few threads are enough
+# to keep hashing from stalling SSE streams and other requests.
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+async def hash_password(password_helper, password: str) -> str:
+    """Hash a password (or PIN) in the hashing pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, password_helper.hash, password)
+
+async def verify_password(password_helper, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password (or PIN) in the hashing pool. Returns (valid, updated_hash)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, password_helper.verify_and_update, password, hashed)
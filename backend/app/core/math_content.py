@@ -0,0 +1,116 @@
+"""
+Math-content detection.
+
+The text is lowercased once, then a single compiled regex scans it and
+collects at the same time:
+- math keywords, accent-insensitively ("Équation", "equation", "EQUATION");
+  keywords are compiled into a trie-shaped pattern so shared prefixes
+  (calcul / calculate, formule / formula) are matched once
+- strong math symbols (∫, ∑, √, π, ...)
+- operators between two operands (at least one of them a number), with the
+  digits around them, scored as a density. Markdown (**bold**, * bullets,
+  > quotes, === underlines) has no such operands and does not count
+
+`detect_math_content` turns those into a confidence in [0, 1]. It is used by
+ingest to flag math lessons and by quiz generation for math-safe prompting.
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import Dict
+
+# Unaccented, lowercase: accents are matched by ACCENTS below
+MATH_KEYWORDS = [
+    "equation", "calcul", "calculate", "resoudre", "solve",
+    "formule", "formula", "mathematique", "mathematics", "algebre", "algebra",
+    "geometrie", "geometry", "derivee", "derivative", "integrale", "integral",
+]
+ACCENTS = {"a": "àâä", "c": "ç", "e": "éèêë", "i": "îï", "o": "ôö", "u": "ùûü"}
+STRONG_SYMBOLS = "∫∑∏√π∆∂θ≤≥≠±∞"
+OPERATORS = "=+×÷^<>*"
+
+# Each keyword counts for 1, each strong symbol for 2
+KEYWORD_WEIGHT = 1.0
+SYMBOL_WEIGHT = 2.0
+# Share of operator/digit characters that ordinary prose stays under
+DENSITY_BASELINE = 0.02
+DENSITY_WEIGHT = 100.0
+# Short texts are scored as if they were this long, so "a = b" alone is not dense
+MIN_DENSITY_LENGTH = 200
+# confidence = 1 - exp(-evidence / EVIDENCE_SCALE): one keyword is enough (0.63), as
+# with the former keyword check; more evidence pushes the confidence towards 1
+EVIDENCE_SCALE = 1.0
+MATH_CONFIDENCE_THRESHOLD = 0.5
+
+@dataclass
+class MathDetection:
+    confidence: float
+    keyword_hits: int
+    symbol_hits: int
+    density: float # Operator (and adjacent digit) characters per character of text
+
+    @property
+    def is_math(self) -> bool:
+        return self.confidence >= MATH_CONFIDENCE_THRESHOLD
+
+def _char_pattern(char: str) -> str:
+    return f"[{char}{ACCENTS[char]}]" if char in ACCENTS else re.escape(char)
+
+def _trie_pattern(node: Dict[str, dict]) -> str:
+    """Regex for a keyword trie; the "" key marks the end of a keyword."""
+    branches = [_char_pattern(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ""
+    if "" in node:
+        return f"(?:{'|'.join(branches)})?"
+    return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+def _build_pattern() -> re.Pattern:
+    trie: Dict[str, dict] = {}
+    for keyword in MATH_KEYWORDS:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    first_chars = {keyword[0] for keyword in MATH_KEYWORDS}
+    first_chars |= {accent for char in first_chars for accent in ACCENTS.get(char, "")}
+    # The lookahead lets the engine skip positions that cannot start any branch
+    prefilter = re.escape("".join(sorted(first_chars)) + STRONG_SYMBOLS + OPERATORS) + "0-9"
+    operator = f"[{re.escape(OPERATORS)}]"
+    # An operand right before / after the operator, with at most one space in between
+    number_before, operand_before = "(?:(?<=[0-9])|(?<=[0-9] ))", "(?:(?<=[0-9a-z)])|(?<=[0-9a-z)] ))"
+    number_after, operand_after = "(?= ?[0-9])", "(?= ?[0-9a-z(])"
+    return re.compile(
+        f"(?=[{prefilter}])"
+        f"(?:(?P<keyword>{_trie_pattern(trie)})"
+        f"|(?P<symbol>[{re.escape(STRONG_SYMBOLS)}])"
+        f"|(?P<operator>[0-9]*(?:{number_before}{operator}{operand_after}|{operand_before}{operator}{number_after})[0-9]*))"
+    )
+
+_PATTERN = _build_pattern()
+
+def detect_math_content(text: str) -> MathDetection:
+    """Scores how likely `text` is math content, in a single regex pass over it."""
+    keyword_hits = symbol_hits = operator_chars = 0
+    for match in _PATTERN.finditer(text.lower()):
+        kind = match.lastgroup
+        if kind == "keyword":
+            keyword_hits += 1
+        elif kind == "symbol":
+            symbol_hits += 1
+        else:
+            operator_chars += match.end() - match.start()
+
+    density = operator_chars / max(len(text), MIN_DENSITY_LENGTH)
+    evidence = (
+        keyword_hits * KEYWORD_WEIGHT
+        + symbol_hits * SYMBOL_WEIGHT
+        + max(0.0, density - DENSITY_BASELINE) * DENSITY_WEIGHT
+    )
+    return MathDetection(
+        confidence=1 - math.exp(-evidence / EVIDENCE_SCALE),
+        keyword_hits=keyword_hits,
+        symbol_hits=symbol_hits,
+        density=density
+    )
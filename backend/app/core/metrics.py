@@ -0,0 +1,130 @@
+"""
+In-process request metrics, exposed in Prometheus text format.
+
+MetricsMiddleware records, per (method, route template):
+- a latency histogram (until the last body chunk, so SSE streams count fully)
+- request counts by status code
+- an in-flight gauge
+
+It is a plain ASGI middleware: no per-request I/O, nothing wraps the body.
+"""
+import bisect
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from app.config import settings
+
+logger = logging.getLogger("app.requests")
+
+# Seconds; LLM-backed endpoints routinely take 10-60s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self):
+        self.latency: Dict[Tuple[str, str], Histogram] = defaultdict(Histogram)
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        # Scopes of requests being served; their route is resolved lazily
+        # since routing happens after the middleware saw the request
+        self.active: Dict[int, dict] = {}
+
+    def in_flight(self) -> Dict[Tuple[str, str], int]:
+        gauge: Dict[Tuple[str, str], int] = defaultdict(int)
+        for scope in list(self.active.values()):
+            gauge[(scope["method"], _route_template(scope))] += 1
+        return gauge
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines: List[str] = [
+            "# HELP http_requests_total Completed HTTP requests.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), value in sorted(self.requests.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {value}')
+
+        lines += [
+            "# HELP http_request_duration_seconds HTTP request latency.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), histogram in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [
+            "# HELP http_requests_in_flight HTTP requests currently being served.",
+            "# TYPE http_requests_in_flight gauge",
+        ]
+        for (method, route), value in sorted(self.in_flight().items()):
+            lines.append(f'http_requests_in_flight{{method="{method}",route="{_escape(route)}"}} {value}')
+
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+metrics = MetricsRegistry()
+
+class MetricsMiddleware:
+    def __init__(self, app, registry: MetricsRegistry = metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        start = time.perf_counter()
+        status_code = 500
+        self.registry.active[id(scope)] = scope
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = _route_template(scope)
+            self.registry.active.pop(id(scope), None)
+            self.registry.latency[(method, route)].observe(elapsed)
+            self.registry.requests[(method, route, status_code)] += 1
+            _log_request(method, scope.get("path", ""), route, status_code, elapsed)
+
+def _route_template(scope) -> str:
+    """Route template (e.g. /api/quiz/review/{revision_id}) to keep label cardinality low."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
+def _log_request(method: str, path: str, route: str, status_code: int, elapsed: float) -> None:
+    # Errors are always logged, the rest is sampled
+    if status_code < 500 and random.random() >= settings.REQUEST_LOG_SAMPLE_RATE:
+        return
+    logger.info(
+        "request",
+        extra={"method": method, "path": path, "route": route, "status": status_code, "duration_ms": round(elapsed * 1000, 1)}
+    )
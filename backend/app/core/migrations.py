@@ -0,0 +1,59 @@
+"""
+Lightweight, idempotent schema upgrades run at startup.
+
+Tables are created with `SQLModel.metadata.create_all`, which never alters
+existing tables. `upgrade_schema` fills that gap for additive changes:
+- columns declared on a model but missing from an existing table are added
+  (with the model's scalar default as server default, so NOT NULL works)
+- indexes declared on a model are created if missing
+- registered backfills then populate new columns on existing rows
+
+Anything destructive (renames, type changes) still needs a manual migration.
+"""
+import logging
+from typing import Callable, List
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import Column, Table
+from sqlmodel import SQLModel
+
+logger = logging.getLogger(__name__)
+
+Backfill = Callable[[Connection], None]
+_backfills: List[Backfill] = []
+
+def register_backfill(backfill: Backfill) -> Backfill:
+    """Registers a sync function run on every startup, after the columns exist. It must be idempotent."""
+    _backfills.append(backfill)
+    return backfill
+
+def _add_column(connection: Connection, table: Table, column: Column) -> None:
+    preparer = connection.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=connection.dialect)
+    ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}"
+
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        literal = column.type.literal_processor(connection.dialect)
+        ddl += f" DEFAULT {literal(default) if literal else default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+    connection.execute(text(ddl))
+    logger.info("Added column %s.%s", table.name, column.name)
+
+def upgrade_schema(connection: Connection) -> None:
+    """Adds missing columns and indexes to existing tables, then runs backfills."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                _add_column(connection, table, column)
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+    for backfill in _backfills:
+        backfill(connection)
@@ -0,0 +1,249 @@
+"""
+Shared state for caches, locks and rate-limit counters.
+
+With several worker processes (see gunicorn.conf.py), in-process dicts are
+per worker. The backend is chosen by STATE_BACKEND:
+- "memory": in-process (single worker, tests)
+- "sql": the `shared_state` table of the app database (SQLite or Postgres)
+- "redis://...": a Redis-compatible server (needs the `redis` extra)
+
+Values are JSON, so every backend behaves the same. TTLs are in seconds.
+"""
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+from sqlalchemy import case, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import Field, SQLModel
+from app.config import settings
+from app.core.cache import TTLCache
+
+class SharedState(SQLModel, table=True):
+    """Rows of the SQL state backend."""
+    __tablename__ = "shared_state"
+
+    key: str = Field(primary_key=True)
+    value: Optional[str] = None # JSON
+    counter: int = Field(default=0)
+    expires_at: float = Field(index=True) # Unix time
+
+class LockTimeout(Exception):
+    pass
+
+class StateBackend:
+    """Interface of the shared-state backends."""
+
+    async def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60.0) -> int:
+        """Adds to a counter and returns its new value; the counter expires `ttl` after its first increment."""
+        raise NotImplementedError
+
+    async def hit(self, key: str, limit: int, window: float) -> bool:
+        """Fixed-window rate limit: counts one hit, False once `limit` hits were counted in the window."""
+        return await self.incr(f"rate:{key}", 1, window) <= limit
+
+    async def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    async def _release(self, key: str, token: str) -> None:
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def lock(self, name: str, ttl: float = 30.0, timeout: float = 10.0, poll: float = 0.05) -> AsyncIterator[None]:
+        """
+        Mutual exclusion across workers. The lock expires after `ttl` (a crashed
+        holder cannot block others forever); LockTimeout after `timeout`.
+        """
+        key, token = f"lock:{name}", uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        while not await self._acquire(key, token, ttl):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name)
+            await asyncio.sleep(poll)
+        try:
+            yield
+        finally:
+            await self._release(key, token)
+
+class MemoryStateBackend(StateBackend):
+    def __init__(self, max_entries: int = 4096):
+        self._values = TTLCache(ttl=0, max_entries=max_entries)
+        self._counters: Dict[str, tuple] = {}
+        self._locks: Dict[str, tuple] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self._values.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self._values.set(key, json.dumps(value), ttl=ttl)
+
+    async def delete(self, key: str) -> None:
+        self._values.delete(key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60.0) -> int:
+        now = time.monotonic()
+        count, expires_at = self._counters.get(key, (0, 0.0))
+        if expires_at <= now:
+            count, expires_at = 0, now + ttl
+        self._counters[key] = (count + amount, expires_at)
+        return count + amount
+
+    async def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        holder = self._locks.get(key)
+        if holder is not None and holder[1] > time.monotonic():
+            return False
+        self._locks[key] = (token, time.monotonic() + ttl)
+        return True
+
+    async def _release(self, key: str, token: str) -> None:
+        if self._locks.get(key, (None,))[0] == token:
+            del self._locks[key]
+
+    def clear(self) -> None:
+        self._values.clear()
+        self._counters.clear()
+        self._locks.clear()
+
+class SQLStateBackend(StateBackend):
+    """Backed by the `shared_state` table; upserts need SQLite (3.24+) or Postgres."""
+
+    PURGE_EVERY = 100 # Writes between deletions of expired rows
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._writes = 0
+
+    def _insert(self):
+        dialect = postgresql if self.engine.dialect.name == "postgresql" else sqlite
+        return dialect.insert(SharedState.__table__)
+
+    async def get(self, key: str) -> Optional[Any]:
+        table = SharedState.__table__
+        async with self.engine.connect() as conn:
+            value = (await conn.execute(
+                select(table.c.value).where(table.c.key == key, table.c.expires_at > time.time())
+            )).scalar_one_or_none()
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        table = SharedState.__table__
+        statement = self._insert().values(key=key, value=json.dumps(value), counter=0, expires_at=time.time() + ttl)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"value": statement.excluded.value, "counter": 0, "expires_at": statement.excluded.expires_at}
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(statement)
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                await conn.execute(delete(table).where(table.c.expires_at <= time.time()))
+
+    async def delete(self, key: str) -> None:
+        table = SharedState.__table__
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(table).where(table.c.key == key))
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60.0) -> int:
+        table = SharedState.__table__
+        now = time.time()
+        expired = table.c.expires_at <= now
+        statement = self._insert().values(key=key, counter=amount, expires_at=now + ttl)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "counter": case((expired, amount), else_=table.c.counter + amount),
+                "expires_at": case((expired, now + ttl), else_=table.c.expires_at),
+            }
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(statement)
+            return (await conn.execute(select(table.c.counter).where(table.c.key == key))).scalar_one()
+
+    async def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        table = SharedState.__table__
+        now = time.time()
+        statement = self._insert().values(key=key, value=json.dumps(token), expires_at=now + ttl)
+        # Take over only an expired lock
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"value": statement.excluded.value, "expires_at": statement.excluded.expires_at},
+            where=table.c.expires_at <= now
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(statement)
+            holder = (await conn.execute(select(table.c.value).where(table.c.key == key))).scalar_one()
+        return holder == json.dumps(token)
+
+    async def _release(self, key: str, token: str) -> None:
+        table = SharedState.__table__
+        async with self.engine.begin() as conn:
+            await conn.execute(delete(table).where(table.c.key == key, table.c.value == json.dumps(token)))
+
+# Deletes the lock only if it is still ours (atomic on the server)
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class RedisStateBackend(StateBackend):
+    """Any client with the redis.asyncio API (decode_responses=True)."""
+
+    def __init__(self, client):
+        self.client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisStateBackend":
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND is a Redis URL but the `redis` package is not installed (poetry install -E redis)") from e
+        return cls(redis_asyncio.from_url(url, decode_responses=True))
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self.client.get(key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        await self.client.set(key, json.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(key)
+
+    async def incr(self, key: str, amount: int = 1, ttl: float = 60.0) -> int:
+        count = await self.client.incrby(key, amount)
+        if count == amount:
+            # First increment of the window
+            await self.client.pexpire(key, int(ttl * 1000))
+        return count
+
+    async def _acquire(self, key: str, token: str, ttl: float) -> bool:
+        return bool(await self.client.set(key, token, px=int(ttl * 1000), nx=True))
+
+    async def _release(self, key: str, token: str) -> None:
+        await self.client.eval(_RELEASE_SCRIPT, 1, key, token)
+
+def create_state_backend(url: str) -> StateBackend:
+    if url == "memory":
+        return MemoryStateBackend(settings.STATE_MEMORY_MAX_ENTRIES)
+    if url == "sql":
+        from app.core.db import engine
+        return SQLStateBackend(engine)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStateBackend.from_url(url)
+    raise ValueError(f"Unknown STATE_BACKEND: {url!r} (memory, sql or a redis:// URL)")
+
+shared_state = create_state_backend(settings.STATE_BACKEND)
@@ -0,0 +1,196 @@
+"""
+In-memory static file serving for the React build.
+
+The build directory is indexed once at startup: every file is read into
+memory along with precompressed gzip (and brotli, when installed) variants,
+so serving a file needs no filesystem syscalls and no per-request
+compression. Responses carry ETag / Last-Modified and honour conditional
+requests with 304s.
+
+Brotli at maximum quality takes seconds on a large bundle, for every worker
+at every cold start: `python -m app.core.static static/` (run when building
+the image) writes the variants next to the files (`x.js.gz`, `x.js.br`),
+and indexing reuses them instead of compressing again.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import sys
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, Optional
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError: # Optional dependency: gzip only
+    brotli = None
+
+# Vite fingerprints everything under assets/ (e.g. index-CcsouM31.js)
+HASHED_PREFIX = "assets/"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+# Compressing tiny files or already-compressed formats is not worth it
+MIN_COMPRESS_SIZE = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+# Precompressed sibling files, by encoding
+VARIANT_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+@dataclass
+class StaticFile:
+    content: bytes
+    media_type: str
+    etag: str
+    last_modified: str
+    mtime: float
+    cache_control: str
+    variants: Dict[str, bytes] = field(default_factory=dict) # encoding -> compressed body
+
+def _is_compressible(media_type: str) -> bool:
+    return media_type.startswith(COMPRESSIBLE_TYPES)
+
+def _compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    compressors = {"gzip": lambda content: gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressors["br"] = lambda content: brotli.compress(content, quality=11)
+    return compressors
+
+def _read_variant(path: str, encoding: str, mtime: float) -> Optional[bytes]:
+    """A precompressed sibling of the file, unless it is missing or older than the file."""
+    variant_path = path + VARIANT_SUFFIXES[encoding]
+    try:
+        if os.path.getmtime(variant_path) < mtime:
+            return None
+        with open(variant_path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _is_variant_file(directory: str, filename: str) -> bool:
+    return any(
+        filename.endswith(suffix) and os.path.exists(os.path.join(directory, filename[:-len(suffix)]))
+        for suffix in VARIANT_SUFFIXES.values()
+    )
+
+def _load_file(path: str, relative_path: str) -> StaticFile:
+    with open(path, "rb") as f:
+        content = f.read()
+    mtime = os.path.getmtime(path)
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+
+    static_file = StaticFile(
+        content=content,
+        media_type=media_type,
+        etag=f'"{hashlib.sha1(content).hexdigest()[:20]}"',
+        last_modified=formatdate(mtime, usegmt=True),
+        mtime=int(mtime),
+        cache_control=IMMUTABLE_CACHE if relative_path.startswith(HASHED_PREFIX) else REVALIDATE_CACHE
+    )
+
+    if len(content) >= MIN_COMPRESS_SIZE and _is_compressible(media_type):
+        for encoding, compress in _compressors().items():
+            static_file.variants[encoding] = _read_variant(path, encoding, mtime) or compress(content)
+    return static_file
+
+class StaticIndex:
+    """Snapshot of a static directory, keyed by URL path (without leading slash)."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.files: Dict[str, StaticFile] = {}
+        if os.path.isdir(root):
+            for directory, _, filenames in os.walk(root):
+                for filename in filenames:
+                    if _is_variant_file(directory, filename):
+                        continue
+                    path = os.path.join(directory, filename)
+                    relative_path = os.path.relpath(path, root).replace(os.sep, "/")
+                    self.files[relative_path] = _load_file(path, relative_path)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.files
+
+    def get(self, path: str) -> Optional[StaticFile]:
+        return self.files.get(path)
+
+    def alias(self, path: str, target: str) -> None:
+        """Serve `target` under `path` too (unless `path` exists)."""
+        if path not in self.files and target in self.files:
+            self.files[path] = self.files[target]
+
+    def respond(self, static_file: StaticFile, request: Request) -> Response:
+        """Builds the (possibly 304 / compressed) response for a file."""
+        encoding = negotiate_encoding(request.headers.get("accept-encoding", ""), static_file.variants)
+        etag = static_file.etag if encoding is None else f'{static_file.etag[:-1]}-{encoding}"'
+
+        headers = {
+            "ETag": etag,
+            "Last-Modified": static_file.last_modified,
+            "Cache-Control": static_file.cache_control,
+        }
+        if static_file.variants:
+            headers["Vary"] = "Accept-Encoding"
+
+        if _not_modified(request, static_file):
+            return Response(status_code=304, headers=headers)
+
+        body = static_file.content
+        if encoding is not None:
+            body = static_file.variants[encoding]
+            headers["Content-Encoding"] = encoding
+
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(body))
+            return Response(status_code=200, headers=headers, media_type=static_file.media_type)
+        return Response(content=body, headers=headers, media_type=static_file.media_type)
+
+def negotiate_encoding(accept_encoding: str, variants: Dict[str, bytes]) -> Optional[str]:
+    accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+    for encoding in ("br", "gzip"): # Best compression first
+        if encoding in variants and encoding in accepted:
+            return encoding
+    return None
+
+def _not_modified(request: Request, static_file: StaticFile) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Any encoding variant of the same content matches
+        base_tag = static_file.etag.strip('"')
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*":
+                return True
+            tag = tag.removeprefix("W/").strip('"')
+            if tag == base_tag or tag.rsplit("-", 1)[0] == base_tag:
+                return True
+        return False
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return static_file.mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def precompress(root: str) -> int:
+    """Writes the compressed variants of every compressible file under `root`. Returns the number written."""
+    written = 0
+    for relative_path, static_file in StaticIndex(root).files.items():
+        path = os.path.join(root, relative_path)
+        for encoding, body in static_file.variants.items():
+            variant_path = path + VARIANT_SUFFIXES[encoding]
+            if _read_variant(path, encoding, static_file.mtime) == body:
+                continue
+            with open(variant_path, "wb") as f:
+                f.write(body)
+            written += 1
+    return written
+
+if __name__ == "__main__":
+    root = sys.argv[1] if len(sys.argv) > 1 else "static"
+    print(f"{precompress(root)} precompressed files written under {root}")
@@ -1,93 +1,102 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, PlainTextResponse
+from sqlalchemy import text
+import logging
 import os
 
 from app.modules.auth.router import router as auth_router
 from app.modules.ingest.router import router as ingest_router
 from app.modules.quiz.router import router as quiz_router
-from app.core.db import create_db_and_tables
+from app.modules.llm.router import router as llm_router
+from app.modules.llm.service import close_http_client, get_http_client
+from app.modules.llm.ledger import usage_ledger
+from app.config import settings
+from app.core.compression import CompressionMiddleware
+from app.core.db import create_db_and_tables, engine
+from app.core.static import StaticIndex
+from app.core.logs import setup_logging
+from app.core.metrics import MetricsMiddleware, metrics
 
-app = FastAPI(title="Reviflow API")
+setup_logging()
+logger = logging.getLogger(__name__)
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    print(f"DEBUG REQ: {request.method} {request.url.path}")
-    response = await call_next(request)
-    print(f"DEBUG RES: {request.method} {request.url.path} -> {response.status_code}")
-    return response
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-process resources, set up once before the first request and released on shutdown."""
+    logger.info("Startup initiated")
+    # Under gunicorn the master already did it, once for all workers
+    if settings.DB_INIT_ON_STARTUP:
+        try:
+            await create_db_and_tables()
+            logger.info("DB creation successful")
+        except Exception:
+            logger.critical("Failed to connect to DB or create tables", exc_info=True)
+    await warm_up()
+    usage_ledger.start()
+    yield
+    # Write buffered token/cost usage before the process exits
+    await usage_ledger.stop()
+    await close_http_client()
+    await engine.dispose()
 
-@app.on_event("startup")
-async def on_startup():
-    print("DEBUG: Startup initiated")
-    import os
-    print(f"DEBUG: Current Working Directory: {os.getcwd()}")
-    print(f"DEBUG: Directory Contents: {os.listdir('.')}")
-    print(f"DEBUG: Environment DATABASE_URL: {os.getenv('DATABASE_URL')}")
-    
+async def warm_up() -> None:
+    """Opens the first pooled DB connection and the LLM HTTP client, so the first requests don't pay for them."""
+    get_http_client()
     try:
-        print("DEBUG: Attempting to create DB and tables...")
-        await create_db_and_tables()
-        print("DEBUG: DB creation successful.")
-    except Exception as e:
-        print(f"CRITICAL ERROR: Failed to connect to DB or create tables. Error: {e}")
-        import traceback
-        traceback.print_exc()
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    except Exception:
+        logger.warning("DB warm-up failed", exc_info=True)
 
-    # Debug: Check static files location
-    static_path = os.path.join(os.path.dirname(__file__), "..", "static")
-    print(f"Startup: Static dir check -> {os.path.abspath(static_path)} (Exists: {os.path.exists(static_path)})")
+app = FastAPI(title="Reviflow API", lifespan=lifespan, default_response_class=ORJSONResponse)
+# Added first so metrics (outermost) include the compression time
+if settings.COMPRESS_RESPONSES:
+    app.add_middleware(CompressionMiddleware, min_size=settings.COMPRESS_MIN_BYTES)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(auth_router, prefix="/api/auth")
 app.include_router(ingest_router, prefix="/api/ingest")
 app.include_router(quiz_router, prefix="/api/quiz")
+app.include_router(llm_router, prefix="/api/llm")
 
 # Health Check
 @app.get("/api/health")
 def health_check():
     return {"status": "ok", "service": "reviflow-backend"}
 
-# Mount Static Files (React) - Only if directory exists (Production/Monolith mode)
-static_dir = os.path.join(os.path.dirname(__file__), "..", "static")
+# Prometheus scrape endpoint (per-process HTTP metrics; LLM cost counters are
+# served by the token-protected /api/llm/metrics)
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Serve the React build (Production/Monolith mode) from an in-memory index:
+# precompressed variants, ETag/Last-Modified, 304s and no per-request syscalls
+static_dir = settings.STATIC_DIR or os.path.join(os.path.dirname(__file__), "..", "static")
 if os.path.exists(static_dir):
-    # Mount assets directory for JS, CSS, images
-    assets_dir = os.path.join(static_dir, "assets")
-    if os.path.exists(assets_dir):
-        app.mount("/assets", StaticFiles(directory=assets_dir), name="assets")
-    
-    # Serve static files (favicon, etc.)
-    @app.get("/vite.svg")
-    async def vite_svg():
-        return FileResponse(os.path.join(static_dir, "vite.svg"))
-    
-    @app.get("/favicon.ico")
-    async def favicon():
-        # Fallback to vite.svg if no favicon.ico exists
-        favicon_path = os.path.join(static_dir, "favicon.ico")
-        if os.path.exists(favicon_path):
-            return FileResponse(favicon_path)
-        return FileResponse(os.path.join(static_dir, "vite.svg"), media_type="image/svg+xml")
-    
+    static_index = StaticIndex(static_dir)
+    # Fallback to vite.svg if no favicon.ico exists
+    static_index.alias("favicon.ico", "vite.svg")
+
     # SPA Catch-all: Serve index.html for all non-API routes (React Router)
-    @app.get("/{full_path:path}")
+    @app.api_route("/{full_path:path}", methods=["GET", "HEAD"])
     async def serve_spa(request: Request, full_path: str):
-        # Don't catch API routes or missing static assets
-        # We check for common static directories to avoid serving index.html for missing assets
-        static_prefixes = ["api/", "assets/", "static/"]
-        if any(full_path.startswith(prefix) for prefix in static_prefixes):
-            return {"error": "Not found"}, 404
-            
-        # Check if file exists in static directory (e.g. logo.png, favicon.png)
-        # This allows serving root-level static files that are not in /assets
-        file_path = os.path.join(static_dir, full_path)
-        if os.path.isfile(file_path):
-            return FileResponse(file_path)
+        # Never answer API routes with the SPA
+        if full_path.startswith("api/"):
+            return JSONResponse({"error": "Not found"}, status_code=404)
+
+        # Root-level and hashed static files (logo.png, assets/index-xxx.js...)
+        static_file = static_index.get(full_path)
+        if static_file:
+            return static_index.respond(static_file, request)
 
-        # Also check for file extensions to avoid catching missing .png, .js, etc.
-        # If it has an extension and wasn't found above, it's a 404.
-        if "." in full_path.split("/")[-1]:
-             return {"error": "Not found"}, 404
+        # Missing assets, or anything with a file extension, is a 404
+        # rather than index.html
+        static_prefixes = ["assets/", "static/"]
+        if any(full_path.startswith(prefix) for prefix in static_prefixes) or "." in full_path.split("/")[-1]:
+            return JSONResponse({"error": "Not found"}, status_code=404)
 
-        return FileResponse(os.path.join(static_dir, "index.html"))
+        return static_index.respond(static_index.get("index.html"), request)
 else:
-    print(f"Warning: Static directory {static_dir} not found. Running in API-only mode.")
+    logger.warning("Static directory %s not found. Running in API-only mode.", static_dir)
@@ -27,12 +27,8 @@ class LearnerProfile(SQLModel, table=True):
     # Relationship back to the specific user account
     user: "User" = Relationship(back_populates="learner_profile")
     
-    # Badges
-    # Badges
-    badges: List["LearnerBadge"] = Relationship(
-        back_populates="learner",
-        sa_relationship_kwargs={"lazy": "selectin"}
-    )
+    # Badges (lazy: load explicitly with selectinload when needed)
+    badges: List["LearnerBadge"] = Relationship(back_populates="learner")
 
 class LearnerBadge(SQLModel, table=True):
     __tablename__ = "learner_badges"
@@ -65,12 +61,14 @@ class User(SQLModel, table=True):
     parent_id: Optional[uuid.UUID] = Field(default=None, foreign_key="users.id", index=True)
     
     # Relationships
+    # All lazy: queries state what they need via loader options
+    # (see select_user_related in auth/service.py) instead of every
+    # User load cascading into profiles, children, parent and badges.
     learner_profile: Optional[LearnerProfile] = Relationship(
         back_populates="user",
         sa_relationship_kwargs={
             "cascade": "all, delete-orphan",
-            "uselist": False,
-            "lazy": "selectin"
+            "uselist": False
         }
     )
     
@@ -78,7 +76,6 @@ class User(SQLModel, table=True):
         back_populates="parent",
         sa_relationship_kwargs={
              "cascade": "all, delete-orphan",
-             "lazy": "selectin",
              "single_parent": True
         }
     )
@@ -86,8 +83,7 @@ class User(SQLModel, table=True):
     parent: Optional["User"] = Relationship(
         back_populates="children",
         sa_relationship_kwargs={
-            "remote_side": "User.id",
-            "lazy": "selectin"
+            "remote_side": "User.id"
         }
     )
     
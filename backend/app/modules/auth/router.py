@@ -1,12 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 import httpx
-from app.modules.auth.service import auth_backend, fastapi_users, current_active_user
-from app.modules.auth.schemas import UserRead, UserCreate, UserUpdate
+from sqlalchemy.exc import IntegrityError
+from app.modules.auth.service import auth_backend, child_email, create_children, fastapi_users, current_active_user, invalidate_user_cache, select_user_related
+from app.modules.auth.schemas import (
+    ApiKeyValidation, BulkChildrenCreate, ChildAccountCreated, ChildAccountResult, ParentalGateResult, ProfileSelection,
+    ProfileSummary, UserRead, UserCreate, UserUpdate
+)
 from app.modules.auth.models import User, UserRole, LearnerProfile
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
-from sqlalchemy import select
 from app.core.db import get_async_session
+from app.core.etags import account_scope, bump_versions, conditional_response
+from app.core.hashing import verify_password
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -23,7 +30,17 @@ router.include_router(
     tags=["auth"],
 )
 
-# /users/me
+# /users/me (GET) - explicitly loads the learner profile, since the
+# authenticated principal is a slim, relationship-free User
+@router.get("/users/me", response_model=UserRead, tags=["users"])
+async def read_me(
+    user: User = Depends(current_active_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    result = await db.execute(select_user_related(user.id, profile=True, badges=True))
+    return result.scalar_one()
+
+# /users/me (PATCH), /users/{id}
 router.include_router(
     fastapi_users.get_users_router(UserRead, UserUpdate),
     prefix="/users",
@@ -31,7 +48,7 @@ router.include_router(
 )
 
 # API Key Validation
-@router.get("/validate-api-key", tags=["auth"])
+@router.get("/validate-api-key", response_model=ApiKeyValidation, response_model_exclude_unset=True, tags=["auth"])
 async def validate_api_key(user: User = Depends(current_active_user)):
     """Validate the user's OpenRouter API key by making a test request."""
     if not user.openrouter_api_key:
@@ -56,7 +73,7 @@ async def validate_api_key(user: User = Depends(current_active_user)):
     except Exception as e:
         return {"valid": False, "error": str(e)}
 
-@router.post("/verify-parental-gate", tags=["auth"])
+@router.post("/verify-parental-gate", response_model=ParentalGateResult, response_model_exclude_unset=True, tags=["auth"])
 async def verify_parental_gate(
     payload: dict,
     user: User = Depends(current_active_user),
@@ -68,13 +85,13 @@ async def verify_parental_gate(
     
     if pin:
         if user.parental_pin:
-            valid, _ = user_manager.password_helper.verify_and_update(pin, user.parental_pin)
+            valid, _ = await verify_password(user_manager.password_helper, pin, user.parental_pin)
             if valid:
                 return {"success": True}
         return {"success": False, "error": "Invalid PIN"}
             
     if password:
-        valid, _ = user_manager.password_helper.verify_and_update(password, user.hashed_password)
+        valid, _ = await verify_password(user_manager.password_helper, password, user.hashed_password)
         if valid:
             return {"success": True}
         return {"success": False, "error": "Invalid Password"}
@@ -90,17 +107,16 @@ async def list_children(
     if user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents can list children")
     
-    # Re-fetch user with relationships to avoid lazy-loading issues
-    statement = select(User).where(User.id == user.id).options(
-        selectinload(User.children)
-    )
-    result = await db.execute(statement)
+    # Re-fetch user with the children (and their profiles) loaded
+    result = await db.execute(select_user_related(user.id, children=True, badges=True))
     full_user = result.scalar_one()
     
     return full_user.children
 
-@router.get("/profiles", response_model=list[dict], tags=["auth"])
+@router.get("/profiles", response_model=list[ProfileSummary], response_model_exclude_unset=True, tags=["auth"])
 async def list_profiles(
+    request: Request,
+    response: Response,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
@@ -108,12 +124,13 @@ async def list_profiles(
     If parent: list all children's profiles.
     If learner: return own profile.
     """
-    # Re-fetch user with relationships to avoid lazy-loading issues
-    statement = select(User).where(User.id == user.id).options(
-        selectinload(User.learner_profile),
-        selectinload(User.children).selectinload(User.learner_profile)
-    )
-    result = await db.execute(statement)
+    not_modified = await conditional_response(request, response, user, account_scope(user))
+    if not_modified:
+        return not_modified
+
+    # Re-fetch user with only the relationships this role needs
+    is_learner = user.role == UserRole.LEARNER
+    result = await db.execute(select_user_related(user.id, profile=is_learner, children=not is_learner))
     full_user = result.scalar_one()
 
     if full_user.role == UserRole.LEARNER:
@@ -141,7 +158,7 @@ async def list_profiles(
             })
     return profiles
 
-@router.patch("/profiles/me", tags=["auth"])
+@router.patch("/profiles/me", response_model=ProfileSummary, response_model_exclude_unset=True, tags=["auth"])
 async def update_my_profile(
     profile_data: dict,
     user: User = Depends(current_active_user),
@@ -152,8 +169,7 @@ async def update_my_profile(
         raise HTTPException(status_code=403, detail="Only learners can update their learner profile directly")
     
     # Fetch profile with selectinload to ensure it's available
-    statement = select(User).where(User.id == user.id).options(selectinload(User.learner_profile))
-    result = await db.execute(statement)
+    result = await db.execute(select_user_related(user.id, profile=True))
     full_user = result.scalar_one()
     
     if not full_user.learner_profile:
@@ -168,6 +184,8 @@ async def update_my_profile(
     db.add(profile)
     await db.commit()
     await db.refresh(profile)
+    await invalidate_user_cache(user.id)
+    await bump_versions(account_scope(user))
     
     return {
         "id": str(profile.id),
@@ -175,18 +193,15 @@ async def update_my_profile(
         "avatar_url": profile.avatar_url
     }
 
-@router.post("/select-profile/{learner_id}", tags=["auth"])
+@router.post("/select-profile/{learner_id}", response_model=ProfileSelection, response_model_exclude_unset=True, tags=["auth"])
 async def select_profile(
     learner_id: str,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Validate that the learner profile belongs to the user."""
-    statement = select(User).where(User.id == user.id).options(
-        selectinload(User.learner_profile),
-        selectinload(User.children).selectinload(User.learner_profile)
-    )
-    result = await db.execute(statement)
+    is_learner = user.role == UserRole.LEARNER
+    result = await db.execute(select_user_related(user.id, profile=is_learner, children=not is_learner))
     full_user = result.scalar_one()
 
     profile = None
@@ -209,7 +224,7 @@ async def select_profile(
         "avatar_url": profile.avatar_url
     }}
 
-@router.post("/profiles", tags=["auth"])
+@router.post("/profiles", response_model=ChildAccountCreated, tags=["auth"])
 async def create_child_account(
     profile_data: dict,
     user: User = Depends(current_active_user),
@@ -217,8 +232,6 @@ async def create_child_account(
     db: AsyncSession = Depends(get_async_session)
 ):
     """Create a new learner user and their associated profile."""
-    print(f"DEBUG: create_child_account hit by user {user.email}")
-    print(f"DEBUG: profile_data: {profile_data}")
     if user.role != UserRole.PARENT:
         raise HTTPException(status_code=403, detail="Only parents can create child accounts")
     
@@ -231,7 +244,7 @@ async def create_child_account(
     try:
         child_user = await user_manager.create(
             UserCreate(
-                email=f"{username}@reviflow.app",
+                email=child_email(username),
                 password=profile_data.get("password", "1234"), # Default PIN if not provided
                 username=username,
                 first_name=profile_data.get("first_name"),
@@ -249,6 +262,7 @@ async def create_child_account(
         db.add(new_profile)
         await db.commit()
         await db.refresh(new_profile)
+        await bump_versions(account_scope(user))
         
         return {"success": True, "user": {
             "id": str(child_user.id),
@@ -257,9 +271,26 @@ async def create_child_account(
         }}
     except Exception as e:
         await db.rollback()
-        import traceback
-        traceback.print_exc()
         detail = str(e)
         if hasattr(e, "reason"): detail = e.reason
-        print(f"DEBUG: Child creation failed: {detail}")
+        logger.warning("Child creation failed: %s", detail, exc_info=True)
         raise HTTPException(status_code=400, detail=f"Échec de la création du compte enfant : {detail}")
+
+@router.post("/profiles/bulk", response_model=list[ChildAccountResult], tags=["auth"])
+async def create_child_accounts(
+    data: BulkChildrenCreate,
+    user: User = Depends(current_active_user),
+    user_manager = Depends(fastapi_users.get_user_manager),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """Create many learner users and profiles at once (class or association onboarding). Returns a result per child."""
+    if user.role != UserRole.PARENT:
+        raise HTTPException(status_code=403, detail="Only parents can create child accounts")
+
+    try:
+        results = await create_children(db, user_manager.password_helper, user, data.children)
+    except IntegrityError:
+        logger.warning("Bulk child creation conflicted with a concurrent creation", exc_info=True)
+        raise HTTPException(status_code=409, detail="Un identifiant vient d'être utilisé par un autre compte : aucun compte créé, réessayez.")
+    await bump_versions(account_scope(user))
+    return results
@@ -2,8 +2,10 @@ import uuid
 from typing import Optional, List
 from datetime import datetime
 from fastapi_users import schemas
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy import inspect as sa_inspect
 from .models import UserRole
+from app.modules.llm.ledger import usage_ledger
 
 # Learner Profile Schemas
 class LearnerProfileBase(BaseModel):
@@ -13,6 +15,55 @@ class LearnerProfileBase(BaseModel):
 class LearnerProfileCreate(LearnerProfileBase):
     pass
 
+class ChildAccountCreate(BaseModel):
+    username: str = Field(..., min_length=1)
+    password: str = "1234" # Default PIN if not provided
+    first_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+
+class BulkChildrenCreate(BaseModel):
+    children: List[ChildAccountCreate] = Field(..., min_length=1, max_length=200)
+
+class ChildAccountResult(BaseModel):
+    index: int # Position in the request
+    username: str
+    success: bool
+    user_id: Optional[uuid.UUID] = None
+    profile_id: Optional[uuid.UUID] = None
+    error: Optional[str] = None
+
+class ProfileSummary(BaseModel):
+    """Profile picker entry; the progress fields are only listed for parents."""
+    id: uuid.UUID
+    first_name: str
+    avatar_url: Optional[str] = None
+    username: Optional[str] = None
+    xp: Optional[int] = None
+    level: Optional[int] = None
+    streak_current: Optional[int] = None
+    streak_max: Optional[int] = None
+
+class ProfileSelection(BaseModel):
+    success: bool
+    profile: ProfileSummary
+
+class ChildAccountUser(BaseModel):
+    id: uuid.UUID
+    username: str
+    profile_id: uuid.UUID
+
+class ChildAccountCreated(BaseModel):
+    success: bool
+    user: ChildAccountUser
+
+class ApiKeyValidation(BaseModel):
+    valid: bool
+    error: Optional[str] = None
+
+class ParentalGateResult(BaseModel):
+    success: bool
+    error: Optional[str] = None
+
 class LearnerProfileUpdate(BaseModel):
     first_name: Optional[str] = None
     avatar_url: Optional[str] = None
@@ -49,6 +100,27 @@ class UserRead(schemas.BaseUser[uuid.UUID]):
     learner_profile: Optional[LearnerProfileRead] = None
     parent_id: Optional[uuid.UUID] = None
     parental_pin: Optional[str] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def skip_unloaded_relationships(cls, data):
+        """Serialize relationships that were not loaded (e.g. cached principals) as absent instead of lazy-loading them."""
+        state = sa_inspect(data, raiseerr=False)
+        if state is None or not state.unloaded:
+            return data
+        return {
+            name: getattr(data, name)
+            for name in cls.model_fields
+            if name not in state.unloaded and hasattr(data, name)
+        }
+
+    @model_validator(mode="after")
+    def include_pending_usage(self):
+        """Add usage recorded in the ledger but not flushed to the users row yet."""
+        tokens, cost = usage_ledger.pending(self.id)
+        self.total_tokens_used += tokens
+        self.total_cost_usd += cost
+        return self
     
     @property
     def has_parental_pin(self) -> bool:
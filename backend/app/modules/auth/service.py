@@ -1,31 +1,74 @@
+import asyncio
+import logging
 import uuid
-from typing import Optional
+from typing import Any, Dict, List, Optional, Sequence
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions
 from fastapi_users.authentication import AuthenticationBackend, BearerTransport, JWTStrategy
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import decode_jwt
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached, selectinload
+import jwt
 from app.config import settings
+from app.core.cache import TTLCache
 from app.core.db import get_async_session
-from app.modules.auth.models import User, UserRole
+from app.core.hashing import hash_password, verify_password
+from app.core.state import shared_state
+from app.modules.auth.models import User, UserRole, LearnerProfile
+from app.modules.auth.schemas import ChildAccountCreate, ChildAccountResult
+
+logger = logging.getLogger(__name__)
+
+MIN_PASSWORD_LENGTH = 4 # 4-digit PINs for learners
+CHILD_EMAIL_DOMAIN = "reviflow.app" # Learners log in by username; their email is synthetic
 
 # 1. Database Adaptor
 class UserDatabase(SQLAlchemyUserDatabase):
     async def get_by_username(self, username: str) -> Optional[User]:
-        from sqlalchemy import select
         statement = select(User).where(User.username == username)
         result = await self.session.execute(statement)
         return result.scalar_one_or_none()
 
+    async def get_by_email_or_username(self, identifier: str) -> Optional[User]:
+        """Single lookup for a login identifier; an email match wins over a username match."""
+        statement = select(User).where(
+            or_(func.lower(User.email) == func.lower(identifier), User.username == identifier)
+        ).limit(2)
+        result = await self.session.execute(statement)
+        users = result.scalars().all()
+        for user in users:
+            if user.email.lower() == identifier.lower():
+                return user
+        return users[0] if users else None
+
 async def get_user_db(session=Depends(get_async_session)):
     yield UserDatabase(session, User)
 
+def select_user_related(user_id: uuid.UUID, profile: bool = False, badges: bool = False, children: bool = False):
+    """
+    select(User) with exactly the relationships a view needs (select_related-style).
+
+    profile: the user's own learner profile (badges=True also loads its badges)
+    children: the children accounts with their learner profiles
+    """
+    options = []
+    if profile:
+        profile_loader = selectinload(User.learner_profile)
+        options.append(profile_loader.selectinload(LearnerProfile.badges) if badges else profile_loader)
+    if children:
+        children_loader = selectinload(User.children).selectinload(User.learner_profile)
+        options.append(children_loader.selectinload(LearnerProfile.badges) if badges else children_loader)
+    return select(User).where(User.id == user_id).options(*options)
+
 # 2. User Manager (Business Logic)
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     reset_password_token_secret = settings.SECRET_KEY
     verification_token_secret = settings.SECRET_KEY
 
     async def on_after_register(self, user: User, request: Optional[Request] = None):
-        print(f"User {user.id} has registered as {user.role}.")
+        logger.info("User %s has registered as %s", user.id, user.role.value)
         # If learner, ensure they have a profile
         if user.role == UserRole.LEARNER:
              # This will be handled in the custom creation endpoint mostly, 
@@ -34,9 +77,8 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
 
     async def validate_password(self, password: str, user: Optional[User] = None) -> None:
         """Relax validation to allow 4-digit PINs."""
-        if len(password) < 4:
-            from fastapi_users.exceptions import InvalidPasswordException
-            raise InvalidPasswordException("Password must be at least 4 characters long")
+        if len(password) < MIN_PASSWORD_LENGTH:
+            raise exceptions.InvalidPasswordException(f"Password must be at least {MIN_PASSWORD_LENGTH} characters long")
 
     async def authenticate(self, credentials):
         """Override authenticate to check both email and username."""
@@ -50,26 +92,45 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
         if not username or not password:
             return None
 
-        # Try finding by email (Standard)
-        try:
-            user = await self.get_by_email(username)
-            if user and self.password_helper.verify_and_update(password, user.hashed_password)[0]:
-                return user
-        except Exception:
-            pass
+        # Single query covering both email (Standard) and username (Learner)
+        user = await self.user_db.get_by_email_or_username(username)
+        if user is None:
+            # Run the hasher anyway to mitigate timing attacks
+            await hash_password(self.password_helper, password)
+            return None
 
-        # Try finding by username (Learner)
-        try:
-            # We use a custom query for username as BaseUserManager doesn't have get_by_username
-            user = await self.user_db.get_by_username(username)
-            if user and self.password_helper.verify_and_update(password, user.hashed_password)[0]:
-                return user
-        except Exception:
-            pass
-        
-        return None
+        verified, updated_password_hash = await verify_password(self.password_helper, password, user.hashed_password)
+        if not verified:
+            return None
+        # Upgrade the stored hash if the helper recommends it
+        if updated_password_hash is not None:
+            await self.user_db.update(user, {"hashed_password": updated_password_hash})
+
+        return user
+
+    async def create(self, user_create, safe: bool = False, request: Optional[Request] = None) -> User:
+        """Same as BaseUserManager.create, but hashes the password in the hashing pool."""
+        await self.validate_password(user_create.password, user_create)
+
+        existing_user = await self.user_db.get_by_email(user_create.email)
+        if existing_user is not None:
+            raise exceptions.UserAlreadyExists()
+
+        user_dict = (
+            user_create.create_update_dict()
+            if safe
+            else user_create.create_update_dict_superuser()
+        )
+        password = user_dict.pop("password")
+        user_dict["hashed_password"] = await hash_password(self.password_helper, password)
+
+        created_user = await self.user_db.create(user_dict)
+        await self.on_after_register(created_user, request)
+        return created_user
 
     async def on_after_update(self, user: User, update_dict: dict, request: Optional[Request] = None):
+        # Keys, roles, PINs... may have changed: drop cached principals
+        await invalidate_user_cache(user.id)
         if "parental_pin" in update_dict and update_dict["parental_pin"]:
             # We don't hash it here because FastAPI Users doesn't automatically call a hook BEFORE update for custom fields easily without overriding update()
             pass
@@ -77,17 +138,149 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     async def update(self, user_update, user, safe=True, request=None):
         # Hash parental_pin if it's being updated
         if hasattr(user_update, "parental_pin") and user_update.parental_pin is not None:
-            user_update.parental_pin = self.password_helper.hash(user_update.parental_pin)
+            user_update.parental_pin = await hash_password(self.password_helper, user_update.parental_pin)
         return await super().update(user_update, user, safe=safe, request=request)
 
+    async def _update(self, user: User, update_dict: dict) -> User:
+        # Hash a new password in the hashing pool; everything else is handled upstream
+        password = update_dict.pop("password", None)
+        if password is not None:
+            await self.validate_password(password, user)
+            update_dict["hashed_password"] = await hash_password(self.password_helper, password)
+        return await super()._update(user, update_dict)
+
 async def get_user_manager(user_db=Depends(get_user_db)):
     yield UserManager(user_db)
 
-# 3. Authentication Backend (Cookie/JWT)
+def child_email(username: str) -> str:
+    return f"{username}@{CHILD_EMAIL_DOMAIN}"
+
+async def create_children(
+    db: AsyncSession,
+    password_helper,
+    parent: User,
+    children: Sequence[ChildAccountCreate]
+) -> List[ChildAccountResult]:
+    """
+    Bulk provisioning of learner accounts for a parent, with a result per row.
+
+    Invalid rows (short PIN, username taken or repeated) are reported and
+    skipped. Passwords of the valid rows are hashed concurrently in the
+    hashing pool, then all users and profiles are inserted with two batched
+    INSERTs in one transaction. Raises IntegrityError if a username is taken
+    concurrently (nothing is inserted then).
+    """
+    results = [ChildAccountResult(index=index, username=child.username, success=False) for index, child in enumerate(children)]
+
+    # 1. Conflicts with existing accounts: one query for the whole batch
+    usernames = [child.username for child in children]
+    taken = set()
+    for username, email in (await db.execute(
+        select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_([child_email(name) for name in usernames])))
+    )).all():
+        taken.update({username, email.removesuffix(f"@{CHILD_EMAIL_DOMAIN}")})
+
+    valid = []
+    seen = set()
+    for result, child in zip(results, children):
+        if len(child.password) < MIN_PASSWORD_LENGTH:
+            result.error = f"Password must be at least {MIN_PASSWORD_LENGTH} characters long"
+        elif child.username in taken:
+            result.error = "Username already taken"
+        elif child.username in seen:
+            result.error = "Username repeated in the request"
+        else:
+            valid.append((result, child))
+        seen.add(child.username)
+    if not valid:
+        return results
+
+    # 2. Hash in parallel: the pool runs PASSWORD_HASH_WORKERS hashes at a time
+    hashed_passwords = await asyncio.gather(*(hash_password(password_helper, child.password) for _, child in valid))
+
+    # 3. Two batched inserts in one transaction
+    user_rows, profile_rows = [], []
+    for (result, child), hashed_password in zip(valid, hashed_passwords):
+        child_user = User(
+            email=child_email(child.username),
+            username=child.username,
+            hashed_password=hashed_password,
+            first_name=child.first_name,
+            role=UserRole.LEARNER,
+            parent_id=parent.id
+        )
+        profile = LearnerProfile(user_id=child_user.id, first_name=child.first_name or child.username, avatar_url=child.avatar_url)
+        user_rows.append(_column_values(child_user))
+        profile_rows.append(_column_values(profile))
+        result.success, result.user_id, result.profile_id = True, child_user.id, profile.id
+
+    try:
+        await db.execute(insert(User.__table__), user_rows)
+        await db.execute(insert(LearnerProfile.__table__), profile_rows)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    logger.info("Parent %s provisioned %d learner accounts", parent.id, len(valid))
+    return results
+
+# 3. Authenticated-user cache
+# Maps (user id, token) -> (principal version, column snapshot of the User row),
+# so authenticated requests skip loading the user (and its relationships) on
+# every call. The cache is per process; the version lives in shared_state, so
+# an invalidation in one worker makes every worker reload the user.
+principal_cache = TTLCache(ttl=settings.AUTH_CACHE_TTL_SECONDS, max_entries=4096)
+
+def _principal_version_key(user_id: Any) -> str:
+    return f"principal:{user_id}"
+
+def _column_values(row: Any) -> Dict[str, Any]:
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+def _snapshot_user(user: User) -> Dict[str, Any]:
+    return _column_values(user)
+
+def _principal_from_snapshot(snapshot: Dict[str, Any]) -> User:
+    """Builds a slim, detached User (columns only, no relationships loaded)."""
+    principal = User(**snapshot)
+    # Mark as an existing row so db.add(user) issues UPDATEs, not INSERTs
+    make_transient_to_detached(principal)
+    return principal
+
+async def invalidate_user_cache(user_id: uuid.UUID) -> None:
+    """Forget every cached principal of a user, in every worker (call after writing to its row)."""
+    principal_cache.delete_where(lambda key: key[0] == str(user_id))
+    # Outlives the entries cached before it: a cached version never matches an expired one
+    await shared_state.set(_principal_version_key(user_id), uuid.uuid4().hex, ttl=settings.AUTH_CACHE_TTL_SECONDS)
+
+class CachedJWTStrategy(JWTStrategy):
+    async def read_token(self, token: Optional[str], user_manager) -> Optional[User]:
+        if token is None:
+            return None
+
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        version = await shared_state.get(_principal_version_key(user_id))
+        cached = principal_cache.get((user_id, token))
+        if cached is not None and cached[0] == version:
+            return _principal_from_snapshot(cached[1])
+
+        user = await super().read_token(token, user_manager)
+        if user is not None:
+            principal_cache.set((user_id, token), (version, _snapshot_user(user)))
+        return user
+
+# 4. Authentication Backend (Cookie/JWT)
 bearer_transport = BearerTransport(tokenUrl="auth/jwt/login")
 
 def get_jwt_strategy() -> JWTStrategy:
-    return JWTStrategy(secret=settings.SECRET_KEY, lifetime_seconds=3600*24) # 24h Session
+    return CachedJWTStrategy(secret=settings.SECRET_KEY, lifetime_seconds=3600*24) # 24h Session
 
 auth_backend = AuthenticationBackend(
     name="jwt",
@@ -95,7 +288,7 @@ auth_backend = AuthenticationBackend(
     get_strategy=get_jwt_strategy,
 )
 
-# 4. FastAPI Users Instance
+# 5. FastAPI Users Instance
 fastapi_users = FastAPIUsers[User, uuid.UUID](
     get_user_manager,
     [auth_backend],
@@ -0,0 +1,163 @@
+"""
+Adaptive packing of images into vision calls.
+
+Images are packed in page order into batches bounded by:
+- INGEST_BATCH_MAX_BYTES: base64 payload bytes (what the upstream size limit applies to)
+- INGEST_BATCH_MAX_IMAGE_TOKENS: estimated vision tokens (from the image dimensions)
+- a target image count, learned by `batch_tuner`
+
+The tuner keeps a moving average of the upstream latency per image for each
+batch size and targets the size with the lowest one, trying the next size up
+now and then. Failed calls count as very slow, so a size that times out or
+is rejected is backed away from. State is per process.
+"""
+import base64
+import binascii
+import math
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.config import settings
+
+INITIAL_BATCH_IMAGES = 5 # Before anything was observed
+FAILURE_SECONDS = 120.0 # Latency recorded for a failed call (the call timeout)
+EWMA_ALPHA = 0.3
+MIN_SAMPLES = 3 # Observations of the best size before trying a bigger one
+EXPLORE_EVERY = 10 # Plans between two tries of a bigger size
+
+# Vision token estimate (tiling models): image fit into 2048x2048, shortest
+# side scaled to 768, then 170 tokens per 512px tile plus 85 base tokens
+TILE_SIZE = 512
+TOKENS_PER_TILE = 170
+BASE_TOKENS = 85
+UNKNOWN_IMAGE_TOKENS = BASE_TOKENS + 4 * TOKENS_PER_TILE
+# Base64 characters decoded to read the dimensions (a multiple of 4): JPEG
+# headers past it (large EXIF/ICC segments) fall back to UNKNOWN_IMAGE_TOKENS
+HEADER_PREFIX_CHARS = 64 * 1024
+
+@dataclass
+class ImageCost:
+    payload_bytes: int
+    tokens: int
+
+def _strip_data_url(img_b64: str) -> str:
+    return img_b64.split("base64,", 1)[1] if "base64," in img_b64 else img_b64
+
+def image_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a PNG, JPEG, GIF or WebP header; None if unknown."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return struct.unpack("<HH", data[6:10])
+    if data.startswith(b"RIFF") and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            return 1 + int.from_bytes(data[24:27], "little"), 1 + int.from_bytes(data[27:30], "little")
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        return None
+    if data.startswith(b"\xff\xd8"):
+        # Walk the JPEG segments up to a start-of-frame marker
+        position = 2
+        while position + 9 < len(data):
+            if data[position] != 0xFF:
+                return None
+            marker = data[position + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7: # No length
+                position += 2
+                continue
+            length = struct.unpack(">H", data[position + 2:position + 4])[0]
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[position + 5:position + 9])
+                return width, height
+            position += 2 + length
+    return None
+
+def vision_tokens(width: int, height: int) -> int:
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height)) if min(width, height) > 0 else 1.0
+    width, height = width * scale, height * scale
+    return BASE_TOKENS + TOKENS_PER_TILE * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+def image_cost(img_b64: str) -> ImageCost:
+    """Payload size and vision token estimate; only the header prefix of the image is decoded."""
+    encoded = _strip_data_url(img_b64)
+    try:
+        dimensions = image_dimensions(base64.b64decode(encoded[:HEADER_PREFIX_CHARS], validate=False))
+    except (binascii.Error, ValueError, struct.error):
+        dimensions = None
+    tokens = vision_tokens(*dimensions) if dimensions and min(dimensions) > 0 else UNKNOWN_IMAGE_TOKENS
+    return ImageCost(payload_bytes=len(encoded), tokens=tokens)
+
+class BatchSizeTuner:
+    """Learns the images per call with the lowest upstream latency per image."""
+
+    def __init__(self, max_images: int, initial: int = INITIAL_BATCH_IMAGES):
+        self.max_images = max(1, max_images)
+        self.initial = max(1, min(initial, self.max_images))
+        self.seconds_per_image: Dict[int, float] = {} # EWMA, per batch size
+        self.samples: Dict[int, int] = {}
+        self.plans = 0
+
+    def record(self, size: int, seconds: float) -> None:
+        per_image = seconds / size
+        previous = self.seconds_per_image.get(size)
+        self.seconds_per_image[size] = per_image if previous is None else previous + EWMA_ALPHA * (per_image - previous)
+        self.samples[size] = self.samples.get(size, 0) + 1
+
+    def record_failure(self, size: int) -> None:
+        self.record(size, FAILURE_SECONDS)
+
+    def best_size(self) -> int:
+        if not self.seconds_per_image:
+            return self.initial
+        return min(self.seconds_per_image, key=lambda size: (self.seconds_per_image[size], -size))
+
+    def target(self) -> int:
+        """Images per call for the next plan: the best size, or one more to explore."""
+        self.plans += 1
+        best = self.best_size()
+        explore = best + 1
+        if (
+            explore <= self.max_images
+            and self.samples.get(best, 0) >= MIN_SAMPLES
+            and self.samples.get(explore, 0) < MIN_SAMPLES
+            and self.plans % EXPLORE_EVERY == 0
+        ):
+            return explore
+        return best
+
+batch_tuner = BatchSizeTuner(settings.INGEST_BATCH_MAX_IMAGES)
+
+def plan_batches(
+    images_base64: Sequence[str],
+    max_images: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+    max_tokens: Optional[int] = None
+) -> List[int]:
+    """
+    Sizes of consecutive batches covering the images, in page order. An
+    image over a ceiling on its own still gets a batch of its own.
+    """
+    max_images = max_images or batch_tuner.target()
+    max_bytes = max_bytes or settings.INGEST_BATCH_MAX_BYTES
+    max_tokens = max_tokens or settings.INGEST_BATCH_MAX_IMAGE_TOKENS
+
+    sizes: List[int] = []
+    count = payload_bytes = tokens = 0
+    for img_b64 in images_base64:
+        cost = image_cost(img_b64)
+        if count and (count >= max_images or payload_bytes + cost.payload_bytes > max_bytes or tokens + cost.tokens > max_tokens):
+            sizes.append(count)
+            count = payload_bytes = tokens = 0
+        count += 1
+        payload_bytes += cost.payload_bytes
+        tokens += cost.tokens
+    if count:
+        sizes.append(count)
+    return sizes
@@ -0,0 +1,26 @@
+from sqlalchemy import UniqueConstraint
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+import uuid
+
+class IngestPage(SQLModel, table=True):
+    """Analysis of one batch of pages of an upload, saved as soon as the batch completes."""
+    __tablename__ = "ingest_pages"
+    __table_args__ = (
+        UniqueConstraint("upload_id", "batch_index", name="uq_ingest_pages_upload_batch"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    upload_id: uuid.UUID = Field(index=True)
+    user_id: Optional[uuid.UUID] = Field(default=None, index=True)
+    batch_index: int
+    first_page: int # 1-based
+    page_count: int
+    images_hash: str # A retry with different images for this batch analyzes it again
+    status: str = Field(default="FAILED") # DONE, FAILED
+    result: Optional[str] = None # JSON analysis of the batch
+    error: Optional[str] = None
+    attempts: int = Field(default=0)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -1,19 +1,23 @@
 """Ingest module router for image analysis."""
+import logging
 import json
 import asyncio
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
-from app.modules.ingest.schemas import AnalyzeRequest, AnalyzeResponse, AnalyzeError
-from app.modules.ingest.service import analyze_documents
+from app.modules.ingest.schemas import AnalyzeRequest, AnalyzeResponse, AnalyzeError, AnalyzeIncomplete
+from app.modules.ingest.service import analyze_documents, IngestIncomplete, UploadInProgress, UploadNotFound
+from app.modules.llm.service import account_usage
 from app.modules.auth.service import current_active_user
 from typing import Optional
 from app.modules.auth.models import User, UserRole
 
-from app.core.db import get_async_session
+from app.core.db import async_session_maker, get_async_session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 async def get_effective_api_key(user: User, db: AsyncSession) -> Optional[str]:
@@ -24,11 +28,12 @@ async def get_effective_api_key(user: User, db: AsyncSession) -> Optional[str]:
     
     # 2. Parent's key (if learner)
     if user.parent_id:
-        statement = select(User).where(User.id == user.parent_id)
+        # Only the key column: no need to load the parent row
+        statement = select(User.openrouter_api_key).where(User.id == user.parent_id)
         result = await db.execute(statement)
-        parent = result.scalar_one_or_none()
-        if parent and parent.openrouter_api_key:
-            return parent.openrouter_api_key
+        parent_key = result.scalar_one_or_none()
+        if parent_key:
+            return parent_key
             
     # 3. Global settings key
     if settings.OPENROUTER_API_KEY:
@@ -43,7 +48,10 @@ async def get_effective_api_key(user: User, db: AsyncSession) -> Optional[str]:
     responses={
         400: {"model": AnalyzeError, "description": "Invalid request"},
         401: {"model": AnalyzeError, "description": "No API key configured"},
-        500: {"model": AnalyzeError, "description": "AI service error"}
+        404: {"model": AnalyzeError, "description": "Unknown upload_id"},
+        409: {"model": AnalyzeError, "description": "The upload_id is being analyzed by another request"},
+        500: {"model": AnalyzeError, "description": "AI service error"},
+        502: {"model": AnalyzeIncomplete, "description": "Some pages failed: retry them with the upload_id"}
     }
 )
 async def analyze_image_endpoint(
@@ -55,6 +63,8 @@ async def analyze_image_endpoint(
     Analyze an image using AI Vision to extract lesson content.
     
     Requires a valid OpenRouter API key configured in user settings.
+    When some pages fail, the 502 detail gives the upload_id to resend the
+    images with: only the failed pages are analyzed again.
     """
     # Determine which API key to use
     api_key = await get_effective_api_key(user, db)
@@ -73,21 +83,29 @@ async def analyze_image_endpoint(
     
     try:
         result, math_safety_triggered = await analyze_documents(
+            db,
             request.images_base64,
-            api_key
+            api_key,
+            user_id=user.id,
+            upload_id=request.upload_id
         )
         
         # Update usage
-        usage = result.get("usage", {})
-        user.total_tokens_used += usage.get("total_tokens", 0)
-        # Approximate cost (0.1$ / 1M tokens for Flash)
-        user.total_cost_usd += usage.get("total_tokens", 0) * 0.0000001
-        
-        db.add(user)
-        await db.commit()
+        account_usage(user, result.get("usage", {}))
         
         return AnalyzeResponse(**result)
         
+    except UploadNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadInProgress:
+        raise HTTPException(status_code=409, detail="Upload already being analyzed")
+    except IngestIncomplete as e:
+        # The successful pages were paid for and are kept
+        account_usage(user, e.usage)
+        raise HTTPException(
+            status_code=502,
+            detail=AnalyzeIncomplete(message=str(e), upload_id=e.upload_id, failed_pages=e.failed_pages).model_dump(mode="json")
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -135,19 +153,18 @@ async def analyze_image_stream(
             # Step 3: Analyzing
             yield f"data: {json.dumps({'step': 'analyzing', 'message': 'Analyse IA en cours...', 'progress': 50})}\n\n"
             
-            # Actually perform the analysis
-            result, math_safety_triggered = await analyze_documents(
-                request.images_base64,
-                api_key
-            )
+            # Actually perform the analysis (own session: the request's is closed once streaming starts)
+            async with async_session_maker() as session:
+                result, math_safety_triggered = await analyze_documents(
+                    session,
+                    request.images_base64,
+                    api_key,
+                    user_id=user.id,
+                    upload_id=request.upload_id
+                )
             
             # Update usage
-            usage = result.get("usage", {})
-            user.total_tokens_used += usage.get("total_tokens", 0)
-            user.total_cost_usd += usage.get("total_tokens", 0) * 0.0000001
-            
-            db.add(user)
-            await db.commit()
+            account_usage(user, result.get("usage", {}))
             
             # Step 4: Synthesizing
             yield f"data: {json.dumps({'step': 'synthesizing', 'message': 'Génération de la synthèse...', 'progress': 80})}\n\n"
@@ -156,10 +173,12 @@ async def analyze_image_stream(
             # Step 5: Complete
             yield f"data: {json.dumps({'step': 'complete', 'message': 'Terminé!', 'progress': 100, 'result': result})}\n\n"
             
+        except IngestIncomplete as e:
+            account_usage(user, e.usage)
+            incomplete = {'step': 'error', 'message': str(e), 'progress': 0, 'upload_id': str(e.upload_id), 'failed_pages': e.failed_pages}
+            yield f"data: {json.dumps(incomplete)}\n\n"
         except Exception as e:
-            import traceback
-            error_msg = f"Error in analyze_image_stream: {str(e)}\n{traceback.format_exc()}"
-            print(error_msg)  # Log to console
+            logger.exception("Error in analyze_image_stream: %s", e)
             yield f"data: {json.dumps({'step': 'error', 'message': str(e), 'progress': 0})}\n\n"
     
     return StreamingResponse(
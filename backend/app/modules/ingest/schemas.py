@@ -1,8 +1,10 @@
 from pydantic import BaseModel
 from typing import Optional, List
+import uuid
 
 class AnalyzeRequest(BaseModel):
     images_base64: list[str]  # List of base64 encoded image data
+    upload_id: Optional[uuid.UUID] = None # Resumes an upload whose pages partly failed
 
 class AnalyzeResponse(BaseModel):
     title: str
@@ -11,9 +13,16 @@ class AnalyzeResponse(BaseModel):
     synthesis: str
     study_tips: List[str] = []
     is_math_content: bool = False
+    math_confidence: float = 0.0
     math_safety_triggered: bool = False
     usage: Optional[dict] = None
+    upload_id: Optional[uuid.UUID] = None
 
 class AnalyzeError(BaseModel):
     error: str
     detail: Optional[str] = None
+
+class AnalyzeIncomplete(BaseModel):
+    message: str
+    upload_id: uuid.UUID
+    failed_pages: List[int] # 1-based; resend the same images with this upload_id
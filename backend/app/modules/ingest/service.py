@@ -1,21 +1,41 @@
 """AI Vision Service using OpenRouter API."""
+import logging
 import base64
 import json
 import re
-from typing import Tuple
-import httpx
+import hashlib
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from app.core.math_content import detect_math_content
+from app.core.state import LockTimeout, shared_state
+from app.modules.ingest import batching
+from app.modules.ingest.models import IngestPage
+from app.modules.llm.service import chat_completion, DEFAULT_MODEL, FEATURE_INGEST
 
-# Constants
-OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
-DEFAULT_MODEL = "google/gemini-2.5-flash"  # Verified OpenRouter ID
+logger = logging.getLogger(__name__)
 
-# Math Safety keywords
-MATH_KEYWORDS = [
-    "équation", "equation", "calcul", "calculate", "résoudre", "solve",
-    "formule", "formula", "mathématique", "mathematics", "algèbre", "algebra",
-    "géométrie", "geometry", "dérivée", "derivative", "intégrale", "integral",
-    "∫", "∑", "∏", "√", "π", "θ", "∆", "∂"
-]
+# Lock held on an upload while it is analyzed; worst case is one batch (call timeout + retries) per page
+UPLOAD_LOCK_SECONDS_PER_PAGE = 150
+
+class UploadNotFound(Exception):
+    """The upload_id belongs to another user."""
+
+class UploadInProgress(Exception):
+    """Another request is analyzing the same upload_id."""
+
+class IngestIncomplete(Exception):
+    """Some batches failed; retrying with the same upload_id only analyzes their pages."""
+
+    def __init__(self, upload_id: uuid.UUID, failed_pages: List[int], usage: dict):
+        super().__init__(f"Pages {failed_pages} of upload {upload_id} failed")
+        self.upload_id = upload_id
+        self.failed_pages = failed_pages
+        self.usage = usage
 
 SYSTEM_PROMPT = """You are an educational content analyzer for French students. 
 Analyze the provided image of a lesson/course material and extract:
@@ -44,8 +64,8 @@ Always respond in French."""
 
 
 
-async def _analyze_batch(batch_images: list[str], api_key: str) -> dict:
-    """Helper to analyze a batch of images."""
+async def _analyze_batch(batch_images: list[str], api_key: str, user_id: Optional[uuid.UUID] = None) -> Tuple[dict, dict]:
+    """Helper to analyze a batch of images. Returns (analysis, usage)."""
     content_payload = [
         {
             "type": "text",
@@ -81,83 +101,158 @@ async def _analyze_batch(batch_images: list[str], api_key: str) -> dict:
         "max_tokens": 8192
     }
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://reviflow.app",
-        "X-Title": "Reviflow"
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            OPENROUTER_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120.0
-        )
-        
-        if response.status_code != 200:
-            error_detail = response.text
-            raise Exception(f"OpenRouter API error ({response.status_code}): {error_detail}")
-        
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        
-        try:
-            analysis = json.loads(content)
-            return analysis
-        except json.JSONDecodeError:
-            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group(1))
-            else:
-                print(f"FAILED CONTENT PREVIEW: {content[:500]}...")
-                raise Exception("Failed to parse AI response as JSON")
-
-async def analyze_documents(images_base64: list[str], api_key: str) -> Tuple[dict, bool]:
-    """
-    Analyze multiple images using OpenRouter Vision API with batching.
-    """
-    BATCH_SIZE = 5
-    batches = [images_base64[i:i + BATCH_SIZE] for i in range(0, len(images_base64), BATCH_SIZE)]
-    
+    result = await chat_completion(payload, api_key, feature=FEATURE_INGEST, timeout=120.0, user_id=user_id)
+    content = result["choices"][0]["message"]["content"]
+    usage = result.get("usage", {})
+
+    try:
+        return json.loads(content), usage
+    except json.JSONDecodeError:
+        json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+        if json_match:
+            return json.loads(json_match.group(1)), usage
+        else:
+            logger.error("FAILED CONTENT PREVIEW: %s...", content[:500])
+            raise Exception("Failed to parse AI response as JSON")
+
+def _batch_hash(batch_images: List[str]) -> str:
+    digest = hashlib.sha256()
+    for img_b64 in batch_images:
+        digest.update(img_b64.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def merge_batches(batch_results: List[dict]) -> dict:
+    """Merges the batch analyses of an upload, in page order."""
     full_analysis = {
         "title": "Sans titre",
         "subject": "Général",
         "raw_text": "",
         "synthesis": "",
         "is_math_content": False,
-        "usage": {}
+        "math_confidence": 0.0
     }
-    
-    print(f"Processing {len(images_base64)} images in {len(batches)} batches...")
-    
+    for index, batch_result in enumerate(batch_results):
+        # For the first batch, take title and subject
+        if index == 0:
+            full_analysis["title"] = batch_result.get("title", "Sans titre")
+            full_analysis["subject"] = batch_result.get("subject", "Général")
+
+        # Accumulate text and synthesis
+        chunk_text = batch_result.get("raw_text", "")
+        chunk_synthesis = batch_result.get("synthesis", "")
+
+        full_analysis["raw_text"] += f"\n\n--- Partie {index + 1} ---\n" + chunk_text
+        full_analysis["synthesis"] += f"\n" + chunk_synthesis
+
+        # Check for math (if any batch has math, whole doc is math)
+        detection = detect_math_content(chunk_text)
+        full_analysis["math_confidence"] = max(full_analysis["math_confidence"], detection.confidence)
+        if batch_result.get("is_math_content", False) or detection.is_math:
+            full_analysis["is_math_content"] = True
+    return full_analysis
+
+async def analyze_documents(
+    db: AsyncSession,
+    images_base64: list[str],
+    api_key: str,
+    user_id: Optional[uuid.UUID] = None,
+    upload_id: Optional[uuid.UUID] = None
+) -> Tuple[dict, bool]:
+    """
+    Analyze multiple images using OpenRouter Vision API with batching
+    (sized by batching.plan_batches; a batch is the unit of retry).
+
+    Each batch result is saved in `ingest_pages` as soon as it completes and
+    a failing batch does not stop the others. Sending the same upload_id
+    again resumes the upload: batches already analyzed (same images) are not
+    paid for again. The merge happens once every batch succeeded; otherwise
+    IngestIncomplete lists the pages to retry. `usage` covers this call only.
+    A request for an upload_id that another one is analyzing gets
+    UploadInProgress, before paying for any batch.
+    """
+    upload_id = upload_id or uuid.uuid4()
+    try:
+        async with shared_state.lock(f"upload:{upload_id}", ttl=len(images_base64) * UPLOAD_LOCK_SECONDS_PER_PAGE, timeout=0):
+            return await _analyze_upload(db, images_base64, api_key, user_id, upload_id)
+    except LockTimeout:
+        raise UploadInProgress(upload_id)
+
+async def _analyze_upload(
+    db: AsyncSession,
+    images_base64: list[str],
+    api_key: str,
+    user_id: Optional[uuid.UUID],
+    upload_id: uuid.UUID
+) -> Tuple[dict, bool]:
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0}
+
+    rows = {
+        row.batch_index: row
+        for row in (await db.execute(select(IngestPage).where(IngestPage.upload_id == upload_id))).scalars().all()
+    }
+    if any(row.user_id != user_id for row in rows.values()):
+        raise UploadNotFound(upload_id)
+
+    # A resumed upload keeps its batch boundaries (else no stored batch would match);
+    # pages without a stored batch are planned afresh
+    sizes: List[int] = []
+    while len(sizes) in rows:
+        row = rows[len(sizes)]
+        if row.first_page != sum(sizes) + 1 or sum(sizes) + row.page_count > len(images_base64):
+            break
+        sizes.append(row.page_count)
+    sizes += batching.plan_batches(images_base64[sum(sizes):])
+    starts = [sum(sizes[:index]) for index in range(len(sizes))]
+    batches = [images_base64[start:start + size] for start, size in zip(starts, sizes)]
+
+    logger.info("Processing %d images in %d batches (upload %s)...", len(images_base64), len(batches), upload_id)
+
+    batch_results: List[Optional[dict]] = []
+    failed_pages: List[int] = []
     for index, batch in enumerate(batches):
-        print(f"Analyzing batch {index + 1}/{len(batches)}...")
+        images_hash = _batch_hash(batch)
+        row = rows.get(index)
+        first_page = starts[index] + 1
+        if row is not None and row.status == "DONE" and row.images_hash == images_hash and row.first_page == first_page:
+            batch_results.append(json.loads(row.result))
+            continue
+
+        if row is None:
+            row = IngestPage(upload_id=upload_id, user_id=user_id, batch_index=index, first_page=first_page, page_count=len(batch), images_hash=images_hash)
+        row.first_page, row.page_count, row.images_hash = first_page, len(batch), images_hash
+        row.attempts += 1
+        row.updated_at = datetime.utcnow()
+
+        logger.debug("Analyzing batch %d/%d...", index + 1, len(batches))
+        started = time.perf_counter()
         try:
-            batch_result = await _analyze_batch(batch, api_key)
-            
-            # For the first batch, take title and subject
-            if index == 0:
-                full_analysis["title"] = batch_result.get("title", "Sans titre")
-                full_analysis["subject"] = batch_result.get("subject", "Général")
-            
-            # Accumulate text and synthesis
-            chunk_text = batch_result.get("raw_text", "")
-            chunk_synthesis = batch_result.get("synthesis", "")
-            
-            full_analysis["raw_text"] += f"\n\n--- Partie {index + 1} ---\n" + chunk_text
-            full_analysis["synthesis"] += f"\n" + chunk_synthesis
-            
-            # Check for math (if any batch has math, whole doc is math)
-            if batch_result.get("is_math_content", False) or \
-               any(k in chunk_text.lower() for k in MATH_KEYWORDS):
-                full_analysis["is_math_content"] = True
-                
+            batch_result, batch_usage = await _analyze_batch(batch, api_key, user_id=user_id)
+            batching.batch_tuner.record(len(batch), time.perf_counter() - started)
+            for key in usage:
+                usage[key] += batch_usage.get(key, 0) or 0
+            row.status, row.result, row.error = "DONE", json.dumps(batch_result, ensure_ascii=False), None
+            batch_results.append(batch_result)
         except Exception as e:
-            print(f"Error processing batch {index + 1}: {str(e)}")
-            # Continue with what we have, or could fail? 
-            # Ideally fail to warn user, but for now lets re-raise to be safe
-            raise e
+            logger.error("Error processing batch %d of upload %s: %s", index + 1, upload_id, e)
+            batching.batch_tuner.record_failure(len(batch))
+            row.status, row.result, row.error = "FAILED", None, str(e)[:500]
+            failed_pages.extend(range(row.first_page, row.first_page + len(batch)))
+            batch_results.append(None)
+
+        # Persisted as it completes: a later failure never loses this batch
+        db.add(row)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The lock expired and another request stored this batch first
+            await db.rollback()
+            raise UploadInProgress(upload_id)
+
+    if failed_pages:
+        raise IngestIncomplete(upload_id, failed_pages, usage)
 
+    full_analysis = merge_batches(batch_results)
+    full_analysis["usage"] = usage
+    full_analysis["upload_id"] = str(upload_id)
     return full_analysis, full_analysis["is_math_content"]
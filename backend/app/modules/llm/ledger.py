@@ -0,0 +1,89 @@
+"""
+Usage ledger: batched accounting of tokens and cost per user.
+
+Request handlers only append deltas to an in-memory buffer. A background
+flusher applies them every USAGE_FLUSH_INTERVAL_SECONDS with one
+`UPDATE users SET total = total + delta` per user, in a single transaction,
+so concurrent generations (e.g. siblings sharing a parent key) no longer
+contend on the users rows inside their main transactions. The buffer is
+flushed on shutdown; readers add pending deltas (see UserRead) so totals
+stay accurate in between.
+"""
+import asyncio
+import logging
+import uuid
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, update
+from app.config import settings
+from app.core.db import engine
+from app.modules.auth.models import User
+
+logger = logging.getLogger(__name__)
+
+users_table = User.__table__
+
+_increment_statement = (
+    update(users_table)
+    .where(users_table.c.id == bindparam("user_id"))
+    .values(
+        total_tokens_used=users_table.c.total_tokens_used + bindparam("tokens"),
+        total_cost_usd=users_table.c.total_cost_usd + bindparam("cost")
+    )
+)
+
+class UsageLedger:
+    def __init__(self):
+        self._pending: Dict[uuid.UUID, List[float]] = {} # user_id -> [tokens, cost]
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, user_id: uuid.UUID, tokens: int, cost_usd: float) -> None:
+        entry = self._pending.setdefault(user_id, [0, 0.0])
+        entry[0] += tokens
+        entry[1] += cost_usd
+
+    def pending(self, user_id: uuid.UUID) -> Tuple[int, float]:
+        """Deltas recorded for a user but not flushed yet."""
+        tokens, cost = self._pending.get(user_id, (0, 0.0))
+        return int(tokens), cost
+
+    async def flush(self) -> int:
+        """Applies all buffered deltas in one transaction. Returns the number of users updated."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        params = [
+            {"user_id": user_id, "tokens": int(tokens), "cost": cost}
+            for user_id, (tokens, cost) in batch.items()
+        ]
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(_increment_statement, params)
+        except Exception:
+            # Put the deltas back so the next flush retries them
+            for user_id, (tokens, cost) in batch.items():
+                self.add(user_id, tokens, cost)
+            logger.warning("Usage ledger flush failed; will retry", exc_info=True)
+            return 0
+        return len(params)
+
+    async def _run(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self, interval: float = settings.USAGE_FLUSH_INTERVAL_SECONDS) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+usage_ledger = UsageLedger()
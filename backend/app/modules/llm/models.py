@@ -0,0 +1,25 @@
+from sqlmodel import SQLModel, Field
+from typing import Optional
+from datetime import datetime
+import uuid
+
+class LLMCall(SQLModel, table=True):
+    """Append-only log of every upstream (OpenRouter) call."""
+    __tablename__ = "llm_calls"
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    feature: str = Field(index=True) # ingest, quiz, remediation, next-series, reset
+    model: str
+    user_id: Optional[uuid.UUID] = Field(default=None, index=True)
+    status_code: Optional[int] = None # None when no response was received
+    success: bool = Field(default=True)
+    wall_ms: float = Field(default=0.0)
+    ttfb_ms: Optional[float] = None # Time until response headers (of the last attempt)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    cached_tokens: int = Field(default=0) # Served from the provider's prompt cache
+    cost_usd: float = Field(default=0.0)
+    retries: int = Field(default=0)
+    cache_hit: bool = Field(default=False) # Served from our local response cache
+    error: Optional[str] = None
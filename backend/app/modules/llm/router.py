@@ -0,0 +1,31 @@
+"""LLM telemetry endpoints."""
+import hmac
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.config import settings
+from app.modules.auth.service import fastapi_users
+from app.modules.auth.models import User
+from app.modules.llm.schemas import LLMFeatureStats
+from app.modules.llm.service import llm_stats
+
+router = APIRouter()
+
+current_superuser = fastapi_users.current_user(active=True, superuser=True)
+
+@router.get("/stats", response_model=List[LLMFeatureStats])
+async def get_llm_stats(user: User = Depends(current_superuser)):
+    """Per feature/model aggregates of upstream calls since process start."""
+    return llm_stats.summary()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_llm_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus counters of upstream calls (cost, tokens) for a scraper
+    holding LLM_METRICS_TOKEN; not found while no token is configured.
+    """
+    if not settings.LLM_METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {settings.LLM_METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Unauthorized", headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(llm_stats.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+class LLMFeatureStats(BaseModel):
+    """Aggregates of upstream calls for one (feature, model) since process start."""
+    feature: str
+    model: str
+    calls: int
+    errors: int
+    retries: int
+    cache_hits: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    cost_usd: float
+    wall_ms: float
+    ttfb_ms: float
+    avg_wall_ms: float
+    avg_ttfb_ms: float
+    cache_hit_rate: float
@@ -0,0 +1,226 @@
+"""
+OpenRouter client with call telemetry.
+
+Every upstream LLM call goes through `chat_completion`, which records wall
+time, time-to-first-byte, tokens, retries and cost, appends a row to the
+`llm_calls` table and keeps in-memory aggregates per (feature, model).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Optional
+import httpx
+from app.config import settings
+from app.core.state import shared_state
+from app.core.db import async_session_maker
+from app.modules.llm.models import LLMCall
+from app.modules.llm.ledger import usage_ledger
+
+logger = logging.getLogger(__name__)
+
+# Constants
+OPENROUTER_API_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "google/gemini-2.5-flash"  # Verified OpenRouter ID
+
+# Calling features (the `feature` column of llm_calls)
+FEATURE_INGEST = "ingest"
+FEATURE_QUIZ = "quiz"
+FEATURE_REMEDIATION = "remediation"
+FEATURE_NEXT_SERIES = "next-series"
+FEATURE_RESET = "reset"
+
+# USD per 1M tokens (prompt, completion). Only used when OpenRouter does
+# not report the actual cost of a call.
+MODEL_PRICING = {
+    "google/gemini-2.5-flash": (0.30, 2.50),
+    "google/gemini-2.0-flash-001": (0.10, 0.40),
+}
+DEFAULT_PRICING = MODEL_PRICING[DEFAULT_MODEL]
+
+# Transient upstream failures worth retrying
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+MAX_RETRIES = 2
+RETRY_BACKOFF_SECONDS = 1.0
+
+_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared client, so connections to OpenRouter are pooled and reused."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=120.0)
+    return _client
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def compute_cost(model: str, usage: Dict[str, Any]) -> float:
+    """Cost of a call in USD: as billed by OpenRouter when reported, else from MODEL_PRICING."""
+    if usage.get("cost") is not None:
+        return float(usage["cost"])
+    prompt_price, completion_price = MODEL_PRICING.get(model, DEFAULT_PRICING)
+    return (usage.get("prompt_tokens", 0) * prompt_price + usage.get("completion_tokens", 0) * completion_price) / 1_000_000
+
+def account_usage(user, usage: Dict[str, Any]) -> None:
+    """Adds a call's tokens and cost to the user's running totals (via the batched usage ledger)."""
+    usage_ledger.add(user.id, usage.get("total_tokens", 0), usage.get("cost_usd", 0.0))
+
+class LLMStats:
+    """In-memory aggregates per (feature, model), since process start."""
+
+    FIELDS = ("calls", "errors", "retries", "cache_hits", "prompt_tokens", "completion_tokens", "cached_tokens", "cost_usd", "wall_ms", "ttfb_ms")
+
+    def __init__(self):
+        self.aggregates: Dict[tuple, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(self.FIELDS, 0))
+
+    def record(self, call: LLMCall) -> None:
+        entry = self.aggregates[(call.feature, call.model)]
+        entry["calls"] += 1
+        entry["errors"] += 0 if call.success else 1
+        entry["retries"] += call.retries
+        entry["cache_hits"] += 1 if call.cache_hit else 0
+        entry["prompt_tokens"] += call.prompt_tokens
+        entry["completion_tokens"] += call.completion_tokens
+        entry["cached_tokens"] += call.cached_tokens
+        entry["cost_usd"] += call.cost_usd
+        entry["wall_ms"] += call.wall_ms
+        entry["ttfb_ms"] += call.ttfb_ms or 0
+
+    def summary(self) -> list:
+        rows = []
+        for (feature, model), entry in sorted(self.aggregates.items()):
+            calls = entry["calls"] or 1
+            rows.append({
+                "feature": feature,
+                "model": model,
+                **entry,
+                "avg_wall_ms": round(entry["wall_ms"] / calls, 1),
+                "avg_ttfb_ms": round(entry["ttfb_ms"] / calls, 1),
+                "cache_hit_rate": round(entry["cache_hits"] / calls, 3),
+            })
+        return rows
+
+    def render(self) -> str:
+        """Prometheus counters, served by /api/llm/metrics."""
+        lines = []
+        for name in ("calls", "errors", "retries", "cache_hits", "prompt_tokens", "completion_tokens", "cost_usd"):
+            lines.append(f"# TYPE llm_{name}_total counter")
+            for (feature, model), entry in sorted(self.aggregates.items()):
+                lines.append(f'llm_{name}_total{{feature="{feature}",model="{model}"}} {entry[name]}')
+        return "\n".join(lines) + "\n" if lines else ""
+
+llm_stats = LLMStats()
+
+def _cache_key(payload: Dict[str, Any]) -> str:
+    """Exact-match key of a payload in the shared response cache."""
+    return "llm:response:" + hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def _cached_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """A cached response as returned to callers: nothing was billed for it."""
+    return {**result, "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0, "cache_hit": True}}
+
+async def cache_response(payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    """
+    Stores a response for later `chat_completion(payload, cache=True)` calls.
+    Callers store it only once they validated (parsed) it: an unusable
+    answer must not be replayed for LLM_CACHE_TTL_SECONDS. Responses cut at
+    max_tokens and cache hits are never stored.
+    """
+    if settings.LLM_CACHE_TTL_SECONDS <= 0 or (result.get("usage") or {}).get("cache_hit"):
+        return
+    if any(choice.get("finish_reason") == "length" for choice in result.get("choices", [])):
+        return
+    await shared_state.set(_cache_key(payload), result, settings.LLM_CACHE_TTL_SECONDS)
+
+async def record_llm_call(call: LLMCall) -> None:
+    """Aggregates a call in memory and appends it to llm_calls. Never raises."""
+    llm_stats.record(call)
+    try:
+        async with async_session_maker() as session:
+            session.add(call)
+            await session.commit()
+    except Exception:
+        logger.warning("Failed to record LLM call telemetry", exc_info=True)
+
+async def chat_completion(
+    payload: Dict[str, Any],
+    api_key: str,
+    feature: str,
+    timeout: float = 120.0,
+    user_id: Optional[uuid.UUID] = None,
+    cache: bool = False
+) -> Dict[str, Any]:
+    """
+    POSTs a chat completion to OpenRouter and returns the decoded response.
+
+    Transient failures (429/5xx, network errors) are retried with backoff.
+    The returned `usage` gains a `cost_usd` entry (billed cost for the model).
+    With `cache`, a response stored by `cache_response` for an identical
+    payload is returned instead (zero usage, recorded as a cache hit).
+    """
+    model = payload.get("model", DEFAULT_MODEL)
+    cache_key = _cache_key(payload) if cache and settings.LLM_CACHE_TTL_SECONDS > 0 else None
+    if cache_key is not None:
+        cached = await shared_state.get(cache_key)
+        if cached is not None:
+            await record_llm_call(LLMCall(feature=feature, model=model, user_id=user_id, status_code=200, cache_hit=True, wall_ms=0.0))
+            return _cached_result(cached)
+
+    # Ask OpenRouter to report the billed cost alongside token counts
+    payload = {**payload, "usage": {"include": True}}
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://reviflow.app",
+        "X-Title": "Reviflow"
+    }
+
+    call = LLMCall(feature=feature, model=model, user_id=user_id)
+    started = time.perf_counter()
+    try:
+        for attempt in range(MAX_RETRIES + 1):
+            call.retries = attempt
+            attempt_started = time.perf_counter() # TTFB of the final attempt; wall_ms includes retries and backoff
+            try:
+                async with get_http_client().stream("POST", OPENROUTER_API_URL, json=payload, headers=headers, timeout=timeout) as response:
+                    call.ttfb_ms = (time.perf_counter() - attempt_started) * 1000
+                    await response.aread()
+            except httpx.TransportError as e:
+                if attempt < MAX_RETRIES:
+                    await asyncio.sleep(RETRY_BACKOFF_SECONDS * (attempt + 1))
+                    continue
+                raise Exception(f"OpenRouter connection error: {e}") from e
+
+            call.status_code = response.status_code
+            if response.status_code in RETRY_STATUS_CODES and attempt < MAX_RETRIES:
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * (attempt + 1))
+                continue
+            break
+
+        if response.status_code != 200:
+            raise Exception(f"OpenRouter API error ({response.status_code}): {response.text}")
+
+        result = response.json()
+        usage = result.setdefault("usage", {}) or {}
+        result["usage"] = usage
+        usage["cost_usd"] = compute_cost(model, usage)
+
+        call.prompt_tokens = usage.get("prompt_tokens", 0)
+        call.completion_tokens = usage.get("completion_tokens", 0)
+        call.cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+        call.cost_usd = usage["cost_usd"]
+        return result
+    except Exception as e:
+        call.success = False
+        call.error = str(e)[:500]
+        raise
+    finally:
+        call.wall_ms = (time.perf_counter() - started) * 1000
+        await record_llm_call(call)
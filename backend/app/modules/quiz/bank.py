@@ -0,0 +1,137 @@
+"""
+Question bank: every generated question is stored per (revision, series,
+concept) so resets, repeated series and remediation can reuse questions
+instead of calling the LLM again.
+
+A question is served at most BANK_MAX_SERVES times; draws take the least
+served ones first. When the bank cannot fill a quiz, callers generate with
+the LLM and bank the new questions.
+"""
+import json
+import random
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from app.core.db import dialect_insert
+from app.modules.quiz.models import BankQuestion
+from app.modules.quiz.service import normalize_topic, question_hash
+
+BANK_MAX_SERVES = 2
+REMEDIATION_SERIES = 0
+
+QUESTION_FIELDS = ("question", "options", "correct_answer", "explanation")
+
+def _as_quiz_questions(rows: Sequence[BankQuestion]) -> List[Dict[str, Any]]:
+    questions = [json.loads(row.content) for row in rows]
+    random.shuffle(questions)
+    for index, question in enumerate(questions, start=1):
+        question["id"] = index
+    return questions
+
+def _mark_served(db: AsyncSession, rows: Sequence[BankQuestion], now: datetime) -> None:
+    for row in rows:
+        row.times_served += 1
+        row.last_served_at = now
+        db.add(row)
+
+async def bank_questions(
+    db: AsyncSession,
+    revision_id: Optional[uuid.UUID],
+    series: int,
+    topic: str,
+    questions: Sequence[Dict[str, Any]],
+    concepts: Optional[Sequence[str]] = None,
+    served: bool = True
+) -> None:
+    """
+    Stores generated questions (skipping ones already banked). `concepts`
+    overrides the per-question concept (defaults to the normalized topic).
+    Inserted in the session's transaction; the caller commits. A question
+    banked concurrently by another request is skipped too (on conflict do
+    nothing on ix_question_bank_unique).
+    """
+    hashes = [question_hash(question.get("question", "")) for question in questions]
+    existing = set((await db.execute(
+        select(BankQuestion.question_hash).where(
+            BankQuestion.revision_id == revision_id if revision_id else BankQuestion.revision_id.is_(None),
+            BankQuestion.series == series,
+            BankQuestion.question_hash.in_(hashes)
+        )
+    )).scalars().all())
+
+    now = datetime.utcnow()
+    rows = []
+    for index, (question, hash_key) in enumerate(zip(questions, hashes)):
+        if hash_key in existing:
+            continue
+        existing.add(hash_key)
+        rows.append({
+            "id": uuid.uuid4(),
+            "revision_id": revision_id,
+            "series": series,
+            "concept": concepts[index] if concepts else normalize_topic(topic),
+            "topic": topic,
+            "question_hash": hash_key,
+            "content": json.dumps({field: question.get(field) for field in QUESTION_FIELDS}),
+            "times_served": 1 if served else 0,
+            "last_served_at": now if served else None,
+            "created_at": now,
+        })
+    if not rows:
+        return
+
+    statement = dialect_insert(db, BankQuestion.__table__).values(rows).on_conflict_do_nothing(
+        index_elements=["revision_id", "series", "question_hash"]
+    )
+    await db.execute(statement)
+
+async def draw_quiz(db: AsyncSession, revision_id: uuid.UUID, series: int, count: int) -> Optional[Dict[str, Any]]:
+    """A quiz of `count` banked questions for a revision series, or None when the bank is exhausted."""
+    rows = (await db.execute(
+        select(BankQuestion).where(
+            BankQuestion.revision_id == revision_id,
+            BankQuestion.series == series,
+            BankQuestion.times_served < BANK_MAX_SERVES
+        ).order_by(BankQuestion.times_served, BankQuestion.last_served_at).limit(count)
+    )).scalars().all()
+    if len(rows) < count:
+        return None
+
+    _mark_served(db, rows, datetime.utcnow())
+    return {"topic": rows[0].topic, "questions": _as_quiz_questions(rows)}
+
+async def is_banked(db: AsyncSession, revision_id: uuid.UUID, series: int) -> bool:
+    """Whether questions were already generated for a revision series."""
+    row = (await db.execute(
+        select(BankQuestion.id).where(BankQuestion.revision_id == revision_id, BankQuestion.series == series).limit(1)
+    )).first()
+    return row is not None
+
+async def draw_remediation(db: AsyncSession, items: Sequence[Any]) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """Banked remediation questions for the given errors, by error id (errors without one are left out)."""
+    if not items:
+        return {}
+    concepts = {item.question_hash: item for item in items if item.question_hash}
+    rows = (await db.execute(
+        select(BankQuestion).where(
+            BankQuestion.series == REMEDIATION_SERIES,
+            BankQuestion.concept.in_(list(concepts)),
+            BankQuestion.times_served < BANK_MAX_SERVES
+        ).order_by(BankQuestion.times_served, BankQuestion.last_served_at)
+    )).scalars().all()
+
+    drawn: Dict[uuid.UUID, Dict[str, Any]] = {}
+    served = []
+    for row in rows:
+        item = concepts.get(row.concept)
+        if item is None or item.id in drawn or row.revision_id != item.revision_id:
+            continue
+        question = json.loads(row.content)
+        question["remediation_id"] = str(item.id)
+        drawn[item.id] = question
+        served.append(row)
+
+    _mark_served(db, served, datetime.utcnow())
+    return drawn
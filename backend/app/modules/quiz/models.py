@@ -1,12 +1,20 @@
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 from typing import Optional
 from datetime import datetime
 import uuid
 
 class Score(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_score_learner_topic", "learner_id", "topic_key"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(index=True)
     topic: str
+    # Set from topic on write (see quiz.service.set_topic_fields)
+    topic_key: str = Field(default="") # Topic without remediation suffixes
+    is_remediation: bool = Field(default=False)
     score: int
     total_questions: int
     learner_id: Optional[uuid.UUID] = Field(default=None, index=True)
@@ -15,6 +23,14 @@ class Score(SQLModel, table=True):
 
 class RemediationQueue(SQLModel, table=True):
     __tablename__ = "remediation_queue"
+    __table_args__ = (
+        # Dedup lookup: is this question already pending for the learner/revision?
+        Index("ix_remediation_queue_dedup", "learner_id", "revision_id", "question_hash"),
+        # Next items to review: range scan on due_at within a learner
+        Index("ix_remediation_queue_due", "learner_id", "due_at"),
+        # Pending errors per topic
+        Index("ix_remediation_queue_topic", "learner_id", "status", "topic_key"),
+    )
     
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     learner_id: uuid.UUID = Field(index=True)
@@ -23,14 +39,30 @@ class RemediationQueue(SQLModel, table=True):
     wrong_answer: str
     correct_answer: str
     topic: str
+    topic_key: str = Field(default="")
+    is_remediation: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    status: str = Field(default="PENDING") # PENDING, REVIEWED, MASTERED
+    status: str = Field(default="PENDING") # PENDING, MASTERED (REVIEWED: before scheduling)
     revision_id: Optional[uuid.UUID] = Field(default=None, index=True)
+    question_hash: Optional[str] = None # See quiz.service.question_hash
+    occurrences: int = Field(default=1) # Times the question was failed while pending; ranks errors due together
+    last_seen_at: datetime = Field(default_factory=datetime.utcnow)
+    # SM-2 schedule (see quiz.service.schedule_review); due_at is None once MASTERED
+    ease: float = Field(default=2.5)
+    interval_days: float = Field(default=0.0)
+    repetitions: int = Field(default=0)
+    due_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
 class Revision(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_revision_learner_topic", "learner_id", "topic_key"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     learner_id: Optional[uuid.UUID] = Field(index=True)
     topic: str
+    topic_key: str = Field(default="")
+    is_remediation: bool = Field(default=False)
     subject: Optional[str] = None # Added for categorization
     text_content: str  # The full lesson text
     synthesis: Optional[str] = None # AI Summary
@@ -46,3 +78,31 @@ class Revision(SQLModel, table=True):
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BankQuestion(SQLModel, table=True):
+    """A generated question kept for reuse (see quiz.bank)."""
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        # Draw: least served questions of a revision series / remediation concept
+        Index("ix_question_bank_draw", "revision_id", "series", "concept", "times_served"),
+        Index("ix_question_bank_unique", "revision_id", "series", "question_hash", unique=True),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    revision_id: Optional[uuid.UUID] = Field(default=None) # None for remediation without revision
+    series: int # Series index; 0 for remediation questions
+    concept: str # Normalized quiz topic, or the question_hash of the error a remediation question reviews
+    topic: str
+    question_hash: str
+    content: str # JSON: question, options, correct_answer, explanation
+    times_served: int = Field(default=0)
+    last_served_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class LearnerStats(SQLModel, table=True):
+    """Per-learner dashboard rollup, maintained on write (see quiz.stats)."""
+    __tablename__ = "learner_stats"
+
+    learner_id: uuid.UUID = Field(primary_key=True)
+    data: str # JSON: topic attempt windows, pending errors, daily minutes, totals
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
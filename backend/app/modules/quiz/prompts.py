@@ -0,0 +1,71 @@
+"""
+Prompt assembly for quiz generation.
+
+Messages are ordered from most to least stable so provider-side prompt
+caching can reuse the prefix across series, resets and siblings:
+1. system prompt (identical for every quiz)
+2. lesson text (identical for every series / reset of a revision),
+   marked as a cache breakpoint
+3. the per-request instructions: question count, difficulty, series part
+"""
+from typing import Any, Dict, List
+
+QUIZ_SYSTEM_PROMPT = """You are an expert French teacher.
+Create a multiple-choice quiz (QCM) based on the provided lesson text.
+
+Guidelines:
+1.  **Language**: French.
+2.  **Topic**: Extract the main topic/subject of the text.
+3.  **Target Audience**: Students.
+4.  **Format**: the number of questions given in the last message.
+5.  **Difficulty**: the difficulty given in the last message.
+
+Output strictly valid JSON with this structure. Do NOT include markdown formatting (like ```json), introduction, or conclusion. Just the raw JSON object.
+{
+  "topic": "string",
+  "questions": [
+    {
+      "id": 1,
+      "question": "The question text",
+      "options": ["Option A", "Option B", "Option C", "Option D"],
+      "correct_answer": 0, // Index 0-3
+      "explanation": "Brief explanation."
+    }
+  ]
+}
+"""
+
+# Added to the lesson message when the lesson is detected as math content
+MATH_SAFE_HINT = """
+
+MATH CONTENT: This lesson contains mathematics.
+- Write formulas in plain text (e.g. "x^2 + 3x = 10"), never LaTeX.
+- Double-check every calculation: exactly one option must be correct.
+- Make wrong options plausible (common mistakes), not random numbers."""
+
+def quiz_instructions(num_questions: int, difficulty: str, series_index: int = 1, total_series: int = 1) -> str:
+    """The varying suffix of a quiz prompt."""
+    instructions = f"Generate exactly {num_questions} questions.\nDifficulty: {difficulty}"
+    if total_series > 1:
+        # Series Context Hint
+        instructions += f"\n\nCONTEXT: This text is long and is split into {total_series} parts. This is Part {series_index}. Please focus your questions on the section of the text corresponding roughly to part {series_index}/{total_series}."
+    return instructions
+
+def build_quiz_messages(
+    text_content: str,
+    num_questions: int,
+    difficulty: str,
+    series_index: int = 1,
+    total_series: int = 1,
+    math_content: bool = False
+) -> List[Dict[str, Any]]:
+    """Chat messages for a quiz: stable prefix (system prompt, lesson) then the varying instructions."""
+    lesson = f"Here is the lesson text:\n\n{text_content}"
+    if math_content:
+        lesson += MATH_SAFE_HINT
+    return [
+        {"role": "system", "content": QUIZ_SYSTEM_PROMPT},
+        # Breakpoint: providers that need explicit markers cache up to here
+        {"role": "user", "content": [{"type": "text", "text": lesson, "cache_control": {"type": "ephemeral"}}]},
+        {"role": "user", "content": quiz_instructions(num_questions, difficulty, series_index, total_series)},
+    ]
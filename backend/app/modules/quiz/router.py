@@ -1,21 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+import logging
+import math
+from fastapi import APIRouter, Depends, HTTPException, Body, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import uuid
+import hashlib
 import json as import_json
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 from app.core.db import get_async_session
+from app.core.etags import account_scope, bump_versions, conditional_response, learner_scope
 from app.modules.auth.service import current_active_user
-from app.modules.auth.models import User
-from app.modules.quiz.schemas import QuizRequest, QuizResponse, ScoreCreate, ScoreResponse
+from app.modules.auth.models import LearnerBadge, LearnerProfile, User, UserRole
+from app.modules.quiz.schemas import (
+    ActivityStats, DashboardEntry, ProgressBatchResult, ProgressSaved, QuizRequest, QuizResponse, RemediationCount,
+    RevisionDeleted, RevisionRead, RevisionSummary, ScoreCreate, ScoreResponse, TopicMastery
+)
 from pydantic import BaseModel, Field as PydanticField
 from typing import Any
-from app.modules.quiz.models import Score
-from app.modules.quiz.service import generate_quiz
+from app.modules.quiz.models import BankQuestion, RemediationQueue, Revision, Score
+from app.modules.quiz.service import (
+    generate_quiz, generate_remediation_quiz_service, is_remediation_topic, set_topic_fields,
+    bucket_activities, question_hash, schedule_review, quiz_size,
+    REMEDIATION_QUIZ_SIZE, QUALITY_CORRECT, QUALITY_FAILED
+)
+from app.modules.quiz.bank import bank_questions, draw_quiz, draw_remediation, is_banked, REMEDIATION_SERIES
+from app.modules.quiz.stats import (
+    activity_summary, get_stats, get_stats_many, rebuild_stats, record_quiz, record_revision, topic_mastery,
+    TIME_PER_QUIZ, TIME_PER_REVISION
+)
+from app.modules.llm.service import account_usage, FEATURE_NEXT_SERIES, FEATURE_RESET
+from sqlalchemy import func
 from sqlmodel import select, delete
 
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
 async def get_effective_api_key(user: User, db: AsyncSession) -> Optional[str]:
@@ -26,12 +47,12 @@ async def get_effective_api_key(user: User, db: AsyncSession) -> Optional[str]:
     
     # 2. Parent's key (if learner)
     if user.parent_id:
-        # Use simple select for Parent
-        statement = select(User).where(User.id == user.parent_id)
+        # Only the key column: no need to load the parent row
+        statement = select(User.openrouter_api_key).where(User.id == user.parent_id)
         result = await db.execute(statement)
-        parent = result.scalar_one_or_none()
-        if parent and parent.openrouter_api_key:
-            return parent.openrouter_api_key
+        parent_key = result.scalar_one_or_none()
+        if parent_key:
+            return parent_key
             
     # 3. Global settings key
     if settings.OPENROUTER_API_KEY:
@@ -56,10 +77,9 @@ async def generate_quiz_endpoint(
         )
 
     try:
-        data = await generate_quiz(request.text_content, api_key, request.difficulty)
+        data = await generate_quiz(request.text_content, api_key, request.difficulty, user_id=user.id)
         
         # Save Revision
-        from app.modules.quiz.models import Revision
         revision = Revision(
             learner_id=request.learner_id, # Optional
             topic=request.title if request.title else data["quiz"]["topic"],
@@ -72,15 +92,16 @@ async def generate_quiz_endpoint(
             total_series=data.get("meta", {}).get("total_series", 1)
         )
         db.add(revision)
+        await bank_questions(db, revision.id, 1, data["quiz"].get("topic", revision.topic), data["quiz"].get("questions", []))
+        if revision.learner_id:
+            await record_revision(db, revision.learner_id, revision.created_at)
         
         # Update usage
-        usage = data.get("usage", {})
-        user.total_tokens_used += usage.get("total_tokens", 0)
-        user.total_cost_usd += usage.get("total_tokens", 0) * 0.0000001
+        account_usage(user, data.get("usage", {}))
         
-        db.add(user)
         await db.commit()
         await db.refresh(revision)
+        await bump_versions(learner_scope(revision.learner_id, user), account_scope(user))
         
         response_quiz = data["quiz"]
         response_quiz["revision_id"] = revision.id # Add revision_id to response
@@ -91,8 +112,7 @@ async def generate_quiz_endpoint(
         
         return response_quiz
     except Exception as e:
-        import traceback
-        print(f"Error in generate_quiz_endpoint: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in generate_quiz_endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/score", response_model=ScoreResponse)
@@ -102,7 +122,6 @@ async def save_score(
     db: AsyncSession = Depends(get_async_session)
 ):
     """Saves a quiz score."""
-    from app.modules.quiz.models import RemediationQueue
 
     score = Score(
         user_id=user.id,
@@ -112,13 +131,11 @@ async def save_score(
         learner_id=score_data.learner_id,
         revision_id=score_data.revision_id # Link to revision
     )
+    set_topic_fields(score)
     db.add(score)
     
     # --- Streak Logic ---
     if score_data.learner_id:
-        from app.modules.auth.models import LearnerProfile
-        from datetime import datetime, timedelta
-        
         learner = await db.get(LearnerProfile, score_data.learner_id)
         if learner:
             today = datetime.utcnow().date()
@@ -145,7 +162,6 @@ async def save_score(
             # Level 2: 50-199 XP
             # Level 3: 200-449 XP
             # ...
-            import math
             new_level = 1 + math.floor(math.sqrt(learner.xp / 50))
             if new_level > learner.level:
                 # Level Up! We could notify frontend here too via new_badges or similar
@@ -162,7 +178,6 @@ async def save_score(
             BADGE_ON_FIRE = "ON_FIRE"         # Streak >= 3
             
             # Get existing badges
-            from app.modules.auth.models import LearnerBadge
             result = await db.execute(select(LearnerBadge.badge_code).where(LearnerBadge.learner_id == learner.id))
             existing_badges = result.scalars().all()
             
@@ -188,50 +203,82 @@ async def save_score(
             # -------------------
             
             # --- Remediation Logic ---
-            # 1. If this IS a remediation quiz (detected by topic), close old pending errors
-            # Robust check: case insensitive, check for 'remedia' or 'correct'
-            topic_lower = score_data.topic.lower()
-            if "remedia" in topic_lower or "correct" in topic_lower:
-                # Mark pending items for this revision/topic as REVIEWED
-                # We assume that taking the quiz counts as reviewing them.
-                # If they fail again, the code below (step 2) will add new items.
-                update_stmt = select(RemediationQueue).where(
+            now = datetime.utcnow()
+            # 1. If this IS a remediation quiz (detected by topic), grade the errors it reviewed
+            if score.is_remediation:
+                graded = {detail.remediation_id: detail.is_correct for detail in score_data.details if detail.remediation_id}
+                if graded:
+                    # Each question echoes the error it reviews
+                    review_stmt = select(RemediationQueue).where(
+                        RemediationQueue.learner_id == learner.id,
+                        RemediationQueue.id.in_(list(graded))
+                    )
+                    for item in (await db.execute(review_stmt)).scalars().all():
+                        schedule_review(item, QUALITY_CORRECT if graded[item.id] else QUALITY_FAILED, now)
+                        db.add(item)
+                else:
+                    # Older clients: grade the errors that were due by the overall score
+                    review_stmt = select(RemediationQueue).where(
+                        RemediationQueue.learner_id == learner.id,
+                        RemediationQueue.status == "PENDING",
+                        RemediationQueue.due_at <= now
+                    )
+                    if score_data.revision_id:
+                        review_stmt = review_stmt.where(RemediationQueue.revision_id == score_data.revision_id)
+                    review_stmt = review_stmt.order_by(RemediationQueue.due_at, RemediationQueue.occurrences.desc()).limit(REMEDIATION_QUIZ_SIZE)
+                    passed = score_data.total_questions > 0 and score_data.score / score_data.total_questions >= 0.5
+                    for item in (await db.execute(review_stmt)).scalars().all():
+                        schedule_review(item, QUALITY_CORRECT if passed else QUALITY_FAILED, now)
+                        db.add(item)
+
+            # 2. Add NEW errors to queue, deduplicated by normalized question:
+            # an error already pending for this learner/revision gains an occurrence
+            failed = {}
+            for detail in score_data.details or []:
+                # Failed remediation questions were graded on their error above
+                if not detail.is_correct and not detail.remediation_id:
+                    failed[question_hash(detail.question)] = detail
+            if failed:
+                pending_stmt = select(RemediationQueue).where(
                     RemediationQueue.learner_id == learner.id,
+                    RemediationQueue.revision_id == score_data.revision_id if score_data.revision_id else RemediationQueue.revision_id.is_(None),
+                    RemediationQueue.question_hash.in_(list(failed)),
                     RemediationQueue.status == "PENDING"
                 )
-                if score_data.revision_id:
-                     update_stmt = update_stmt.where(RemediationQueue.revision_id == score_data.revision_id)
-                
-                # Fetch and update
-                pending_results = await db.execute(update_stmt)
-                pending_items = pending_results.scalars().all()
-                for item in pending_items:
-                    item.status = "REVIEWED"
-                    db.add(item)
-
-            # 2. Add NEW errors to queue
-            if score_data.details:
-                for detail in score_data.details:
-                    if not detail.is_correct:
-                        # Add to remediation queue
-                        remediation_item = RemediationQueue(
+                pending = {item.question_hash: item for item in (await db.execute(pending_stmt)).scalars().all()}
+                for hash_key, detail in failed.items():
+                    item = pending.get(hash_key)
+                    if item:
+                        # Failed again: a lapse, and due for remediation right away
+                        schedule_review(item, QUALITY_FAILED, now)
+                        item.due_at = now
+                        item.occurrences += 1
+                        item.last_seen_at = now
+                        item.wrong_answer = detail.user_answer
+                        db.add(item)
+                    else:
+                        db.add(RemediationQueue(
                             learner_id=learner.id,
                             original_content=detail.original_content or score_data.topic, # Use topic if context missing
                             question=detail.question,
+                            question_hash=hash_key,
                             wrong_answer=detail.user_answer,
                             correct_answer=detail.correct_answer,
                             topic=score_data.topic,
-                            revision_id=score_data.revision_id # Link error to specific revision
-                        )
-                        db.add(remediation_item)
+                            revision_id=score_data.revision_id, # Link error to specific revision
+                            last_seen_at=now,
+                            due_at=now
+                        ))
             # -------------------------
+
+        # Dashboard rollup, after the remediation queue changes above
+        await record_quiz(db, score_data.learner_id, score)
             
     await db.commit()
     await db.refresh(score)
 
     # --- Series Status Update ---
     if score_data.revision_id:
-        from app.modules.quiz.models import Revision
         revision = await db.get(Revision, score_data.revision_id)
         if revision:
             # Mark current series as completed
@@ -253,6 +300,7 @@ async def save_score(
                 await db.commit()
     # ----------------------------
     # ----------------------------
+    await bump_versions(learner_scope(score_data.learner_id, user), account_scope(user))
     
     # Prepare response
     response = ScoreResponse(
@@ -273,36 +321,178 @@ class ProgressUpdate(BaseModel):
     current_index: int
     answers: List[Any]
     score: int
+    client_timestamp: Optional[datetime] = None # When the client captured this state
+
+class ProgressBatch(BaseModel):
+    updates: List[ProgressUpdate]
+
+def _as_naive_utc(dt: datetime) -> datetime:
+    """Normalize to the naive-UTC datetimes stored everywhere else."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _stored_progress(revision) -> dict:
+    if not revision.progress_state:
+        return {}
+    try:
+        state = import_json.loads(revision.progress_state)
+        return state if isinstance(state, dict) else {}
+    except ValueError:
+        return {}
+
+def _progress_timestamp(revision) -> Optional[datetime]:
+    """Timestamp of the progress currently stored on a revision (if any)."""
+    stored = _stored_progress(revision).get("timestamp")
+    try:
+        return _as_naive_utc(datetime.fromisoformat(stored)) if stored else None
+    except (ValueError, TypeError):
+        return None
+
+def _apply_progress(revision, data: ProgressUpdate) -> bool:
+    """
+    Writes progress onto the revision unless a newer state is already stored.
+
+    Last-writer-wins only compares client clocks: it applies when both the
+    update and the stored state carry a client timestamp. A save without one
+    (stamped with server time) always applies, and so does any save over a
+    server-stamped state, as the two clocks cannot be compared.
+    """
+    if data.client_timestamp:
+        timestamp = _as_naive_utc(data.client_timestamp)
+        stored = _stored_progress(revision)
+        stored_timestamp = _progress_timestamp(revision)
+        if stored.get("client_clock") and stored_timestamp and timestamp <= stored_timestamp:
+            return False
+    else:
+        timestamp = datetime.utcnow()
+
+    # Save state as JSON
+    state = {
+        "current_index": data.current_index,
+        "answers": data.answers,
+        "score": data.score,
+        "timestamp": timestamp.isoformat(),
+        "client_clock": data.client_timestamp is not None
+    }
 
-@router.post("/progress/save")
+    revision.progress_state = import_json.dumps(state)
+    revision.status = "IN_PROGRESS"
+    return True
+
+def _progress_etag(versions: dict) -> str:
+    """Weak ETag over the stored progress versions of the given revisions."""
+    digest = hashlib.sha1(import_json.dumps(versions, sort_keys=True).encode()).hexdigest()[:16]
+    return f'W/"{digest}"'
+
+@router.post("/progress/save", response_model=ProgressSaved)
 async def save_progress(
     data: ProgressUpdate,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Saves the current progress of a revision quiz."""
-    from app.modules.quiz.models import Revision
     revision = await db.get(Revision, data.revision_id)
     if not revision:
         raise HTTPException(status_code=404, detail="Revision not found")
-        
-    # Save state as JSON
-    state = {
-        "current_index": data.current_index,
-        "answers": data.answers,
-        "score": data.score,
-        "timestamp": str(datetime.utcnow())
+
+    applied = _apply_progress(revision, data)
+    if applied:
+        db.add(revision)
+        await db.commit()
+        await bump_versions(learner_scope(revision.learner_id, user))
+
+    # applied is False when newer progress (by client timestamp) was already stored
+    return {"status": "success", "applied": applied}
+
+@router.post("/progress/batch", response_model=ProgressBatchResult)
+async def save_progress_batch(
+    data: ProgressBatch,
+    response: Response,
+    user: User = Depends(current_active_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    Saves several progress updates (possibly for several revisions) in one transaction.
+
+    Clients can buffer answers and flush on pause/unload. Updates carrying a
+    client timestamp are applied last-writer-wins, so out-of-order or stale
+    flushes never overwrite newer progress (see _apply_progress).
+    """
+
+    if not data.updates:
+        raise HTTPException(status_code=400, detail="No progress updates provided")
+
+    # 1. Keep only the latest update per revision (by client timestamp when both
+    # have one, else the later one in the batch)
+    latest = {}
+    for update in data.updates:
+        current = latest.get(update.revision_id)
+        if (
+            current is None
+            or not (update.client_timestamp and current.client_timestamp)
+            or _as_naive_utc(update.client_timestamp) >= _as_naive_utc(current.client_timestamp)
+        ):
+            latest[update.revision_id] = update
+
+    # 2. Load all targeted revisions in one query
+    result = await db.execute(select(Revision).where(Revision.id.in_(list(latest.keys()))))
+    revisions = {rev.id: rev for rev in result.scalars().all()}
+
+    applied, skipped, missing = [], [], []
+    for revision_id, update in latest.items():
+        revision = revisions.get(revision_id)
+        if not revision:
+            missing.append(str(revision_id))
+        elif _apply_progress(revision, update):
+            db.add(revision)
+            applied.append(str(revision_id))
+        else:
+            skipped.append(str(revision_id))
+
+    # 3. Single commit for the whole batch
+    if applied:
+        await db.commit()
+        await bump_versions(*{learner_scope(revisions[uuid.UUID(rev_id)].learner_id, user) for rev_id in applied})
+
+    versions = {}
+    for rev_id, rev in revisions.items():
+        stored_timestamp = _progress_timestamp(rev)
+        if stored_timestamp:
+            versions[str(rev_id)] = stored_timestamp.isoformat()
+    response.headers["ETag"] = _progress_etag(versions)
+
+    return {
+        "status": "success",
+        "applied": applied,
+        "skipped": skipped,
+        "missing": missing,
+        "versions": versions
     }
+
+async def _series_quiz(db: AsyncSession, revision, series: int, api_key: str, feature: str, user: User) -> dict:
+    """Quiz for a revision series: drawn from the question bank, else generated (and banked)."""
+    num_questions, _ = quiz_size(len(revision.text_content))
+    banked = await draw_quiz(db, revision.id, series, num_questions)
+    if banked is not None:
+        return {"quiz": banked, "usage": {}}
+
+    # An exhausted bank needs new questions: a cached response would repeat the banked ones
+    data = await generate_quiz(
+        revision.text_content, 
+        api_key, 
+        series_index=series,
+        feature=feature,
+        user_id=user.id,
+        use_cache=not await is_banked(db, revision.id, series)
+    )
+    await bank_questions(db, revision.id, series, data["quiz"].get("topic", revision.topic), data["quiz"].get("questions", []))
     
-    revision.progress_state = import_json.dumps(state)
-    revision.status = "IN_PROGRESS"
-    
-    db.add(revision)
-    await db.commit()
-    
-    return {"status": "success"}
+    # Update usage
+    account_usage(user, data.get("usage", {}))
+    return data
 
-@router.post("/next-series")
+@router.post("/next-series", response_model=QuizResponse)
 async def start_next_series(
     revision_id: uuid.UUID = Body(..., embed=True),
     user: User = Depends(current_active_user),
@@ -313,7 +503,6 @@ async def start_next_series(
     if not api_key:
          raise HTTPException(status_code=401, detail="No API Key")
 
-    from app.modules.quiz.models import Revision
     revision = await db.get(Revision, revision_id)
     if not revision:
         raise HTTPException(status_code=404, detail="Revision not found")
@@ -325,12 +514,8 @@ async def start_next_series(
     next_series = revision.current_series + 1
     
     try:
-        # Generate new quiz for the next series
-        data = await generate_quiz(
-            revision.text_content, 
-            api_key, 
-            series_index=next_series
-        )
+        # Quiz for the next series (from the question bank when possible)
+        data = await _series_quiz(db, revision, next_series, api_key, FEATURE_NEXT_SERIES, user)
         
         # Update Revision
         revision.current_series = next_series
@@ -341,6 +526,7 @@ async def start_next_series(
         db.add(revision)
         await db.commit()
         await db.refresh(revision)
+        await bump_versions(learner_scope(revision.learner_id, user))
         
         # Return new quiz
         response_quiz = data["quiz"]
@@ -354,75 +540,66 @@ async def start_next_series(
         return response_quiz
         
     except Exception as e:
-        import traceback
-        print(f"Error in next_series: {e}")
+        logger.exception("Error in next_series: %s", e)
         raise HTTPException(status_code=500, detail="Failed to generate next series.")
 
-@router.get("/review/{revision_id}")
+@router.get("/review/{revision_id}", response_model=RevisionRead)
 async def get_revision(
     revision_id: uuid.UUID,
+    request: Request,
+    response: Response,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Retrieves a full revision (content + quiz) by ID."""
-    from app.modules.quiz.models import Revision
+    # The owner only (primary key lookup): the lesson text is loaded on a cache miss
+    learner_id = (await db.execute(select(Revision.learner_id).where(Revision.id == revision_id))).first()
+    if learner_id is not None:
+        not_modified = await conditional_response(request, response, user, learner_scope(learner_id[0], user))
+        if not_modified:
+            return not_modified
+
     revision = await db.get(Revision, revision_id)
     if not revision:
         raise HTTPException(status_code=404, detail="Revision not found")
         
     return revision
 
-@router.get("/revisions")
+@router.get("/revisions", response_model=List[RevisionSummary])
 async def list_revisions(
+    request: Request,
+    response: Response,
     learner_id: Optional[uuid.UUID] = None,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Lists all revisions for a learner, with pending error counts."""
-    from app.modules.quiz.models import Revision, RemediationQueue
-    from sqlalchemy import func
+    not_modified = await conditional_response(request, response, user, learner_scope(learner_id, user))
+    if not_modified:
+        return not_modified
     
-    # 1. Base query for revisions
-    stmt = select(Revision).where(Revision.learner_id == learner_id).order_by(Revision.created_at.desc())
-    result = await db.execute(stmt)
-    revisions = result.scalars().all()
+    # 1. Listed columns only: never the lesson text or quiz payloads
+    columns = [getattr(Revision, name) for name in RevisionSummary.model_fields if name != "pending_errors"]
+    stmt = select(*columns).where(Revision.learner_id == learner_id).order_by(Revision.created_at.desc())
+    revisions = (await db.execute(stmt)).mappings().all()
     
-    # 2. Add pending error counts
-    # Fetch all pending error counts in one go for efficiency
-    remed_stmt = select(
-        RemediationQueue.revision_id,
-        func.count(RemediationQueue.id)
-    ).where(
-        RemediationQueue.learner_id == learner_id,
-        RemediationQueue.status == "PENDING",
-        RemediationQueue.revision_id.isnot(None)
-    ).group_by(RemediationQueue.revision_id)
-    
-    remed_result = await db.execute(remed_stmt)
-    remed_map = {row[0]: row[1] for row in remed_result.all()}
+    # 2. Pending error counts from the learner's rollup
+    remed_map = (await get_stats(db, learner_id))["pending"]["revisions"]
     
-    final_list = []
-    for rev in revisions:
-        rev_dict = rev.model_dump() # SQLModel uses model_dump() in newer versions or dict()
-        # For safety across versions
-        if hasattr(rev, "model_dump"):
-            rev_dict = rev.model_dump()
-        else:
-            rev_dict = rev.dict()
-            
-        rev_dict['pending_errors'] = remed_map.get(rev.id, 0)
-        # Ensure dates are serialized if needed, but FastAPI handles this
-        final_list.append(rev_dict)
-        
-    return final_list
+    return [{**rev, "pending_errors": remed_map.get(str(rev["id"]), 0)} for rev in revisions]
 
 @router.get("/history", response_model=List[ScoreResponse])
 async def get_history(
+    request: Request,
+    response: Response,
     learner_id: Optional[uuid.UUID] = None,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Retrieves user score history."""
+    not_modified = await conditional_response(request, response, user, learner_scope(learner_id, user))
+    if not_modified:
+        return not_modified
     # Filter by user_id AND learner_id (if provided or None for main profile)
     statement = select(Score).where(
         Score.user_id == user.id,
@@ -432,24 +609,30 @@ async def get_history(
     result = await db.execute(statement)
     return result.scalars().all()
 
-@router.get("/remediation/count")
+@router.get("/remediation/count", response_model=RemediationCount)
 async def get_remediation_count(
     learner_id: uuid.UUID,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
-    """Returns number of pending remediation items."""
-    from app.modules.quiz.models import RemediationQueue
+    """Returns number of remediation items due for review."""
     # Verify learner belongs to user (or is user) - simple check
     # In full app we'd check if learner_id in user.learner_profiles
     
-    statement = select(RemediationQueue).where(
+    # Count in SQL rather than loading every pending row
+    statement = select(func.count()).select_from(RemediationQueue).where(
         RemediationQueue.learner_id == learner_id,
+        RemediationQueue.due_at <= datetime.utcnow(),
         RemediationQueue.status == "PENDING"
     )
-    result = await db.execute(statement)
-    items = result.scalars().all()
-    return {"count": len(items)}
+    return {"count": (await db.execute(statement)).scalar_one()}
+
+def _error_index(value) -> Optional[int]:
+    """The error number a remediation question echoes, None if missing or malformed."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 @router.post("/remediation/generate", response_model=QuizResponse)
 async def generate_remediation_quiz(
@@ -468,260 +651,185 @@ async def generate_remediation_quiz(
             detail="No OpenRouter API key configured. Please add your API key in Settings or contact your administrator."
         )
 
-    from app.modules.quiz.models import RemediationQueue
     
-    # 1. Fetch pending items
+    # 1. Fetch the errors due for review, most overdue first, then most often failed
+    # (range scan on (learner_id, due_at))
     conditions = [
         RemediationQueue.learner_id == learner_id,
+        RemediationQueue.due_at <= datetime.utcnow(),
         RemediationQueue.status == "PENDING"
     ]
     if revision_id:
         conditions.append(RemediationQueue.revision_id == revision_id)
 
-    # Fetch a pool of recent errors (e.g. 20) then randomize selection
-    statement = select(RemediationQueue).where(*conditions).order_by(RemediationQueue.created_at.desc()).limit(20)
+    statement = select(RemediationQueue).where(*conditions).order_by(RemediationQueue.due_at, RemediationQueue.occurrences.desc()).limit(REMEDIATION_QUIZ_SIZE)
     
     result = await db.execute(statement)
     items = result.scalars().all()
     
-    # Convert to list to shuffle
-    items = list(items)
-    import random
-    random.shuffle(items)
-    
-    # Review ALL fetched items (up to limit), not just 5.
-    # items = items[:5] 
-    
     if len(items) < 1:
         raise HTTPException(status_code=400, detail="Not enough errors to generate a quiz.")
         
-    # 2. Build context
-    remediation_context = [
-        {
-            "question": item.question,
-            "wrong_answer": item.wrong_answer,
-            "correct_answer": item.correct_answer,
-            "context": item.original_content
-        } for item in items
-    ]
-    
-    # 3. Fetch source text if Revision ID is explicitly provided
-    source_text = None
-    if revision_id:
-        from app.modules.quiz.models import Revision
-        rev = await db.get(Revision, revision_id)
-        if rev:
-            source_text = rev.text_content
+    # 2. Reuse banked questions for these errors; only the others go to the LLM
+    banked = await draw_remediation(db, items)
+    missing = [item for item in items if item.id not in banked]
+    quiz_content = {"topic": f"{items[0].topic_key} (Correction)", "questions": []}
 
-    # 4. Generate Quiz
     try:
-        # We need to expose a generic generate function or specific one
-        from app.modules.quiz.service import generate_remediation_quiz_service
-        data = await generate_remediation_quiz_service(remediation_context, api_key, source_text=source_text)
-        
-        # Update usage
-        usage = data.get("usage", {})
-        user.total_tokens_used += usage.get("total_tokens", 0)
-        user.total_cost_usd += usage.get("total_tokens", 0) * 0.0000001
-        
-        db.add(user)
-        await db.commit()
+        if missing:
+            # Build context
+            remediation_context = [
+                {
+                    "question": item.question,
+                    "wrong_answer": item.wrong_answer,
+                    "correct_answer": item.correct_answer,
+                    "context": item.original_content,
+                    "topic": item.topic_key
+                } for item in missing
+            ]
+            
+            # Fetch source text if Revision ID is explicitly provided
+            source_text = None
+            if revision_id:
+                rev = await db.get(Revision, revision_id)
+                if rev:
+                    source_text = rev.text_content
+
+            # Generate Quiz
+            data = await generate_remediation_quiz_service(remediation_context, api_key, source_text=source_text, user_id=user.id)
+            
+            # Update usage
+            account_usage(user, data.get("usage", {}))
+            
+            quiz_content = data["quiz"]
+            generated = quiz_content.get("questions", [])
+
+            # Each question echoes the number of the error it reviews: link them so the score
+            # grades each error and bank each question under it. Questions matching no
+            # error (or one already covered) are dropped.
+            unmatched = dict(enumerate(missing, start=1))
+            linked = []
+            by_revision = defaultdict(list)
+            for question in generated:
+                item = unmatched.pop(_error_index(question.pop("error_index", None)), None)
+                if item is None:
+                    continue
+                question["remediation_id"] = str(item.id)
+                linked.append(question)
+                if item.question_hash: # Banked under it (draw_remediation skips errors without one)
+                    by_revision[item.revision_id].append((question, item.question_hash))
+            if len(linked) < len(generated):
+                logger.warning("Dropped %d remediation questions matching no error", len(generated) - len(linked))
+            quiz_content["questions"] = linked
+            for bank_revision_id, pairs in by_revision.items():
+                await bank_questions(
+                    db, bank_revision_id, REMEDIATION_SERIES, quiz_content.get("topic", missing[0].topic),
+                    [question for question, _ in pairs], concepts=[concept for _, concept in pairs]
+                )
         
-        quiz_content = data["quiz"]
+        # Banked questions first, in the order of the errors
+        quiz_content["questions"] = [banked[item.id] for item in items if item.id in banked] + quiz_content.get("questions", [])
+        if not quiz_content["questions"]:
+            raise Exception("The generated questions matched none of the errors")
+        for index, question in enumerate(quiz_content["questions"], start=1):
+            question["id"] = index
         
         # Force topic to indicate remediation/revision for reliable detection downstream
-        topic_lower = quiz_content.get("topic", "").lower()
-        if "remedia" not in topic_lower and "correct" not in topic_lower:
+        if not is_remediation_topic(quiz_content.get("topic")):
             original_topic = quiz_content.get("topic", "Révision")
             quiz_content["topic"] = f"{original_topic} (Correction)"
 
         # Inject revision_id if present so it persists through the quiz lifecycle
         if revision_id:
             quiz_content["revision_id"] = str(revision_id)
-            
+        
+        await db.commit()
         return quiz_content
     except Exception as e:
-        import traceback
-        print(f"Error in generate_remediation_quiz: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in generate_remediation_quiz: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/stats/mastery")
+@router.get("/stats/mastery", response_model=List[TopicMastery])
 async def get_mastery_stats(
+    request: Request,
+    response: Response,
     learner_id: uuid.UUID,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """Calculates mastery level per topic."""
+    not_modified = await conditional_response(request, response, user, learner_scope(learner_id, user))
+    if not_modified:
+        return not_modified
     try:
-        from app.modules.quiz.models import RemediationQueue
-        
-        # 1. Get all scores
-        scores_stmt = select(Score).where(Score.learner_id == learner_id)
-        result = await db.execute(scores_stmt)
-        scores = result.scalars().all()
-        
-        if not scores:
+        # 1. Per-topic attempt windows and pending errors: one rollup row
+        # ("Maths" and "Maths (Remediation)" are already merged into "Maths")
+        stats = await get_stats(db, learner_id)
+        if not stats["topics"]:
             return []
 
-        # 2. Group by Normalized Topic
-        # We want to merge "Maths" and "Maths (Remediation)" into "Maths"
-        # And we want to prioritize RECENT scores.
-        
-        topic_map = {}
-        
-        for s in scores:
-            if not s.topic: continue
-            # Normalize topic
-            clean_topic = s.topic.replace(" (Remediation)", "").replace(" (Correction)", "").replace(" (Remédiation)", "").replace(" (Révision)", "").strip()
-            
-            if clean_topic not in topic_map:
-                topic_map[clean_topic] = []
-            
-            topic_map[clean_topic].append(s)
-            
-        # 3. Calculate Mastery per Topic using Weighted Average of last 5 attempts
-        mastery_list = []
-        
-        # Pre-fetch errors to avoid N+1 queries
-        errors_stmt = select(RemediationQueue).where(
-            RemediationQueue.learner_id == learner_id, 
-            RemediationQueue.status == "PENDING"
-        )
-        result = await db.execute(errors_stmt)
-        errors = result.scalars().all()
-        
-        error_counts = {}
-        for e in errors:
-            if not e.topic: continue
-            # Also clean topic for errors if needed, or rely on exact match? 
-            # Ideally errors should also be grouped by clean topic.
-            t_key = e.topic.replace(" (Remediation)", "").replace(" (Correction)", "").replace(" (Remédiation)", "").replace(" (Révision)", "").strip()
-            error_counts[t_key] = error_counts.get(t_key, 0) + 1
-
-        for topic, topic_scores in topic_map.items():
-            if not topic_scores: continue
-            
-            # Sort by date asc (oldest first)
-            topic_scores.sort(key=lambda x: x.created_at)
-            
-            # Take last 5 scores
-            recent_scores = topic_scores[-5:]
-            
-            # Calculate Weighted Average
-            # Example: [50, 60, 70] -> (50*1 + 60*2 + 70*3) / (1+2+3)
-            total_weight = 0
-            weighted_sum = 0
-            
-            for i, s in enumerate(recent_scores):
-                weight = i + 1
-                # Percentage for this quiz
-                pct = (s.score / s.total_questions) * 100 if s.total_questions > 0 else 0
-                weighted_sum += pct * weight
-                total_weight += weight
-                
-            base_mastery = weighted_sum / total_weight if total_weight > 0 else 0
-            
-            # Apply penalty for pending errors
-            pending_errors = error_counts.get(topic, 0)
-            penalty = pending_errors * 3 # Reduced penalty from 5 to 3
-            
-            final_mastery = max(0, min(100, base_mastery - penalty))
-            
-            status = "LEARNING"
-            if final_mastery >= 80:
-                status = "MASTERED"
-            elif final_mastery >= 50:
-                status = "REVIEWING"
-                
-            # Safely get last activity
-            last_activity = topic_scores[-1].created_at if topic_scores else datetime.utcnow()
-            
-            # Find the latest revision for this topic to get synthesis and tips
-            latest_revision = None
-            try:
-                from app.modules.quiz.models import Revision
-                rev_stmt = select(Revision).where(
-                    Revision.learner_id == learner_id,
-                    Revision.topic == topic
-                ).order_by(Revision.created_at.desc()).limit(1)
-                rev_result = await db.execute(rev_stmt)
-                latest_revision = rev_result.scalar_one_or_none()
-            except Exception:
-                pass # Ignore revision fetch errors
-
-            mastery_list.append({
-                "topic": topic,
-                "mastery_score": int(final_mastery),
-                "quizzes_count": len(topic_scores),
-                "pending_errors": pending_errors,
-                "status": status,
-                "last_activity": last_activity,
-                "synthesis": latest_revision.synthesis if latest_revision else None,
-                "study_tips": latest_revision.study_tips if latest_revision else None
-            })
-            
-        # Sort by last activity
-        mastery_list.sort(key=lambda x: x['last_activity'], reverse=True)
+        # 2. Latest revision per topic, for synthesis and tips (one query, no lesson text)
+        rev_stmt = select(Revision.topic_key, Revision.synthesis, Revision.study_tips).where(
+            Revision.learner_id == learner_id,
+            Revision.topic_key.in_(list(stats["topics"]))
+        ).order_by(Revision.created_at.desc())
+        latest_revisions = {}
+        for row in (await db.execute(rev_stmt)).all():
+            latest_revisions.setdefault(row.topic_key, row)
+
+        # 3. Mastery per topic: weighted average of the last 5 attempts, minus pending errors
+        # (most recently active first)
+        mastery_list = topic_mastery(stats)
+        for row in mastery_list:
+            latest_revision = latest_revisions.get(row["topic"])
+            row["synthesis"] = latest_revision.synthesis if latest_revision else None
+            row["study_tips"] = latest_revision.study_tips if latest_revision else None
         
         return mastery_list
     except Exception as e:
-        import traceback
-        print(f"ERROR get_mastery_stats: {str(e)}\n{traceback.format_exc()}")
+        logger.exception("Error in get_mastery_stats: %s", e)
         # Return empty list instead of 500 to keep dashboard alive
         return []
 
-@router.get("/stats/activity")
+@router.get("/stats/activity", response_model=ActivityStats)
 async def get_activity_stats(
+    request: Request,
+    response: Response,
     learner_id: Optional[uuid.UUID] = None,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
     """
     Returns aggregated activity stats:
-    - Summary: Total minutes today, this week.
+    - Summary: Total minutes today, this week (from the learner's rollup).
     - History: Daily breakdown of activities (Revisions + Quizzes).
     """
-    from app.modules.quiz.models import Revision
-    from datetime import timedelta
-    
-    # helper to format date
-    def to_date_str(dt):
-        return dt.strftime("%Y-%m-%d")
+    not_modified = await conditional_response(request, response, user, learner_scope(learner_id, user), period=24 * 3600)
+    if not_modified:
+        return not_modified
 
-    # Fetch Revisions
-    revisions_stmt = select(Revision).where(Revision.learner_id == learner_id).order_by(Revision.created_at.desc())
-    revisions = (await db.execute(revisions_stmt)).scalars().all()
-    
-    # Fetch Scores (Quizzes)
-    scores_stmt = select(Score).where(Score.learner_id == learner_id).order_by(Score.created_at.desc())
-    scores = (await db.execute(scores_stmt)).scalars().all()
+    stats = await get_stats(db, learner_id)
     
-    # Fetch Pending Remediation Counts per Revision
-    from app.modules.quiz.models import RemediationQueue
-    from sqlalchemy import func
+    # Fetch Revisions (only the listed columns: never the lesson text)
+    revisions_stmt = select(
+        Revision.id, Revision.topic, Revision.subject, Revision.created_at,
+        Revision.current_series, Revision.total_series, Revision.completed_series, Revision.status
+    ).where(Revision.learner_id == learner_id)
+    revisions = (await db.execute(revisions_stmt)).all()
     
-    remediation_stmt = select(
-        RemediationQueue.revision_id,
-        func.count(RemediationQueue.id)
-    ).where(
-        RemediationQueue.learner_id == learner_id,
-        RemediationQueue.status == "PENDING",
-        RemediationQueue.revision_id.isnot(None)
-    ).group_by(RemediationQueue.revision_id)
+    # Fetch Scores (Quizzes)
+    scores_stmt = select(
+        Score.id, Score.revision_id, Score.topic, Score.created_at, Score.score, Score.total_questions
+    ).where(Score.learner_id == learner_id)
+    scores = (await db.execute(scores_stmt)).all()
     
-    remediation_counts_result = await db.execute(remediation_stmt)
-    remediation_map = {row[0]: row[1] for row in remediation_counts_result.all()}
+    # Pending Remediation Counts per Revision
+    remediation_map = stats["pending"]["revisions"]
     
     activities = []
     
-    # Assumption: 
-    # - 1 Revision = 5 minutes
-    # - 1 Quiz (Score) = 3 minutes
-    TIME_PER_REVISION = 5
-    TIME_PER_QUIZ = 3
-    
     for r in revisions:
-        pending_errors = remediation_map.get(r.id, 0)
+        pending_errors = remediation_map.get(str(r.id), 0)
         activities.append({
             "type": "REVISION",
             "id": r.id,
@@ -748,45 +856,69 @@ async def get_activity_stats(
             "details": f"Quiz ({s.score}/{s.total_questions})"
         })
         
-    # Sort all by date desc
-    activities.sort(key=lambda x: x["created_at"], reverse=True)
-    
-    # Group by Date
-    history = {}
-    today_str = to_date_str(datetime.utcnow())
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    
-    summary = {
-        "today_minutes": 0,
-        "week_minutes": 0,
-        "total_quizzes": len(scores),
-        "total_revisions": len(revisions)
-    }
-    
-    for act in activities:
-        date_key = to_date_str(act["created_at"])
-        if date_key not in history:
-            history[date_key] = {
-                "date": date_key,
-                "total_minutes": 0,
-                "items": []
-            }
-        
-        history[date_key]["items"].append(act)
-        history[date_key]["total_minutes"] += act["minutes"]
-        
-        # Summary Aggregation
-        if date_key == today_str:
-            summary["today_minutes"] += act["minutes"]
-            
-        if act["created_at"] >= week_ago:
-            summary["week_minutes"] += act["minutes"]
+    _, history = bucket_activities(activities)
+    summary = activity_summary(stats)
             
     return {
         "summary": summary,
-        "history": list(history.values())
+        "history": history
     }
 
+@router.get("/stats/dashboard", response_model=List[DashboardEntry])
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    user: User = Depends(current_active_user),
+    db: AsyncSession = Depends(get_async_session)
+):
+    """
+    Summary of every learner of the account in one round-trip: profile,
+    mastery per topic, activity summary and due remediation count.
+    A fixed number of set-based queries, whatever the number of children.
+    """
+    not_modified = await conditional_response(request, response, user, account_scope(user), period=3600)
+    if not_modified:
+        return not_modified
+    # 1. Learner profiles: the parent's children (or the learner's own)
+    owner = User.parent_id == user.id if user.role == UserRole.PARENT else User.id == user.id
+    profiles = (await db.execute(
+        select(LearnerProfile, User.username).join(User, LearnerProfile.user_id == User.id).where(owner).order_by(LearnerProfile.first_name)
+    )).all()
+    if not profiles:
+        return []
+    learner_ids = [profile.id for profile, _ in profiles]
+
+    # 2. Rollups (mastery windows, pending errors, minutes) in one query
+    stats = await get_stats_many(db, learner_ids)
+
+    # 3. Due remediation counts, grouped by learner
+    due_counts = dict((await db.execute(
+        select(RemediationQueue.learner_id, func.count()).where(
+            RemediationQueue.learner_id.in_(learner_ids),
+            RemediationQueue.status == "PENDING",
+            RemediationQueue.due_at <= datetime.utcnow()
+        ).group_by(RemediationQueue.learner_id)
+    )).all())
+
+    return [
+        {
+            "profile": {
+                "id": str(profile.id),
+                "first_name": profile.first_name,
+                "avatar_url": profile.avatar_url,
+                "username": username,
+                "xp": profile.xp,
+                "level": profile.level,
+                "streak_current": profile.streak_current,
+                "streak_max": profile.streak_max,
+            },
+            "mastery": topic_mastery(stats[profile.id]),
+            "activity": activity_summary(stats[profile.id]),
+            "remediation_due": due_counts.get(profile.id, 0),
+        }
+        for profile, username in profiles
+    ]
+
 @router.post("/reset", response_model=QuizResponse)
 async def reset_revision(
     revision_id: uuid.UUID = Body(..., embed=True),
@@ -798,7 +930,6 @@ async def reset_revision(
     if not api_key:
          raise HTTPException(status_code=401, detail="No API Key")
 
-    from app.modules.quiz.models import Revision
     revision = await db.get(Revision, revision_id)
     if not revision:
         raise HTTPException(status_code=404, detail="Revision not found")
@@ -810,12 +941,8 @@ async def reset_revision(
     revision.progress_state = None
     
     try:
-        # Generate new quiz for Series 1
-        data = await generate_quiz(
-            revision.text_content, 
-            api_key, 
-            series_index=1
-        )
+        # Quiz for Series 1 (from the question bank when possible)
+        data = await _series_quiz(db, revision, 1, api_key, FEATURE_RESET, user)
         
         revision.quiz_data = import_json.dumps(data["quiz"])
         revision.updated_at = datetime.utcnow()
@@ -823,6 +950,7 @@ async def reset_revision(
         db.add(revision)
         await db.commit()
         await db.refresh(revision)
+        await bump_versions(learner_scope(revision.learner_id, user))
         
         response_quiz = data["quiz"]
         response_quiz["revision_id"] = revision.id
@@ -834,18 +962,16 @@ async def reset_revision(
         return response_quiz
         
     except Exception as e:
-        import traceback
-        print(f"Error in reset_revision: {e}")
+        logger.exception("Error in reset_revision: %s", e)
         raise HTTPException(status_code=500, detail="Failed to reset revision.")
 
-@router.delete("/revision/{revision_id}")
+@router.delete("/revision/{revision_id}", response_model=RevisionDeleted)
 async def delete_revision(
     revision_id: uuid.UUID,
     user: User = Depends(current_active_user),
     db: AsyncSession = Depends(get_async_session)
 ):
-    """Deletes a revision and its related data (Scores, RemediationQueue)."""
-    from app.modules.quiz.models import Revision, Score, RemediationQueue
+    """Deletes a revision and its related data (Scores, RemediationQueue, banked questions)."""
     
     revision = await db.get(Revision, revision_id)
     if not revision:
@@ -857,8 +983,14 @@ async def delete_revision(
     
     stmt_score = delete(Score).where(Score.revision_id == revision_id)
     await db.execute(stmt_score)
+
+    await db.execute(delete(BankQuestion).where(BankQuestion.revision_id == revision_id))
     
     await db.delete(revision)
+    if revision.learner_id:
+        # Scores and errors are gone: rebuild rather than decrement
+        await rebuild_stats(db, revision.learner_id)
     await db.commit()
+    await bump_versions(learner_scope(revision.learner_id, user), account_scope(user))
     
     return {"status": "success", "deleted_id": str(revision_id)}
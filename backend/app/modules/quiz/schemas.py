@@ -1,7 +1,8 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import uuid
+from app.modules.auth.schemas import ProfileSummary
 
 class QuizRequest(BaseModel):
     text_content: str
@@ -18,11 +19,17 @@ class Question(BaseModel):
     options: List[str]
     correct_answer: int  # Index of the correct option (0-3)
     explanation: str
+    remediation_id: Optional[uuid.UUID] = None # Remediation error this question reviews
+
+class SeriesInfo(BaseModel):
+    current: int
+    total: int
 
 class QuizResponse(BaseModel):
     topic: str
     questions: List[Question]
     revision_id: Optional[uuid.UUID] = None
+    series_info: Optional[SeriesInfo] = None
 
 class QuestionResult(BaseModel):
     question: str
@@ -30,6 +37,7 @@ class QuestionResult(BaseModel):
     correct_answer: str
     is_correct: bool
     original_content: Optional[str] = None # To trace back to source text
+    remediation_id: Optional[uuid.UUID] = None # Echoed from Question, grades that error
 
 class ScoreCreate(BaseModel):
     topic: str
@@ -48,3 +56,102 @@ class ScoreResponse(BaseModel):
     learner_id: Optional[uuid.UUID] = None
     new_badges: List[str] = []
     revision_id: Optional[uuid.UUID] = None
+
+class RevisionRead(BaseModel):
+    """A full revision: lesson text, current quiz and saved progress (JSON strings)."""
+    id: uuid.UUID
+    learner_id: Optional[uuid.UUID] = None
+    topic: str
+    topic_key: str = ""
+    is_remediation: bool = False
+    subject: Optional[str] = None
+    text_content: str
+    synthesis: Optional[str] = None
+    study_tips: Optional[str] = None
+    quiz_data: Optional[str] = None
+    progress_state: Optional[str] = None
+    status: str
+    current_series: int
+    completed_series: int
+    total_series: int
+    created_at: datetime
+    updated_at: datetime
+
+class RevisionSummary(BaseModel):
+    """A revision in lists: no lesson text or quiz payload."""
+    id: uuid.UUID
+    learner_id: Optional[uuid.UUID] = None
+    topic: str
+    subject: Optional[str] = None
+    status: str
+    current_series: int
+    completed_series: int
+    total_series: int
+    created_at: datetime
+    updated_at: datetime
+    pending_errors: int = 0
+
+class RemediationCount(BaseModel):
+    count: int
+
+class ProgressSaved(BaseModel):
+    status: str
+    applied: bool # False when newer progress (by client timestamp) was already stored
+
+class ProgressBatchResult(BaseModel):
+    status: str
+    applied: List[uuid.UUID]
+    skipped: List[uuid.UUID]
+    missing: List[uuid.UUID]
+    versions: Dict[uuid.UUID, datetime] # Timestamp of the progress stored per revision
+
+class RevisionDeleted(BaseModel):
+    status: str
+    deleted_id: uuid.UUID
+
+class TopicMastery(BaseModel):
+    topic: str
+    mastery_score: int
+    quizzes_count: int
+    pending_errors: int
+    status: str
+    last_activity: datetime
+    synthesis: Optional[str] = None
+    study_tips: Optional[str] = None
+
+class ActivitySummary(BaseModel):
+    today_minutes: int
+    week_minutes: int
+    total_quizzes: int
+    total_revisions: int
+
+class ActivityItem(BaseModel):
+    type: str # REVISION | QUIZ
+    id: uuid.UUID
+    topic: str
+    created_at: datetime
+    minutes: int
+    details: str
+    revision_id: Optional[uuid.UUID] = None
+    # Revisions only
+    subject: Optional[str] = None
+    pending_errors: Optional[int] = None
+    current_series: Optional[int] = None
+    total_series: Optional[int] = None
+    completed_series: Optional[int] = None
+    status: Optional[str] = None
+
+class ActivityDay(BaseModel):
+    date: str
+    total_minutes: int
+    items: List[ActivityItem]
+
+class ActivityStats(BaseModel):
+    summary: ActivitySummary
+    history: List[ActivityDay]
+
+class DashboardEntry(BaseModel):
+    profile: ProfileSummary
+    mastery: List[TopicMastery]
+    activity: ActivitySummary
+    remediation_due: int
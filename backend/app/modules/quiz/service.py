@@ -1,153 +1,323 @@
 """Quiz/Flashcard generation service."""
+import logging
+import hashlib
 import json
-import httpx
-from typing import Dict, Any, List
-from app.modules.ingest.service import OPENROUTER_API_URL, DEFAULT_MODEL
-
-SYSTEM_PROMPT = """You are an expert French teacher. 
-Create a multiple-choice quiz (QCM) based on the provided lesson text.
-
-Guidelines:
-1.  **Language**: French.
-2.  **Topic**: Extract the main topic/subject of the text.
-3.  **Target Audience**: Students.
-4.  **Format**: {num_questions} questions.
-5.  **Difficulty**: {difficulty}
-
-Output strictly valid JSON with this structure. Do NOT include markdown formatting (like ```json), introduction, or conclusion. Just the raw JSON object.
-{{
-  "topic": "string",
-  "questions": [
-    {{
-      "id": 1,
-      "question": "The question text",
-      "options": ["Option A", "Option B", "Option C", "Option D"],
-      "correct_answer": 0, // Index 0-3
-      "explanation": "Brief explanation."
-    }}
-  ]
-}}
-"""
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from sqlalchemy import event, inspect, text
+from app.core.math_content import detect_math_content
+from app.core.migrations import register_backfill
+from app.modules.llm.service import cache_response, chat_completion, DEFAULT_MODEL, FEATURE_QUIZ, FEATURE_REMEDIATION
+from app.modules.quiz.models import RemediationQueue, Revision, Score
+from app.modules.quiz.prompts import MATH_SAFE_HINT, build_quiz_messages
 
-async def generate_quiz(text_content: str, api_key: str, difficulty: str = "medium", series_index: int = 1) -> Dict[str, Any]:
-    """Generates a quiz from text content using LLM."""
-    
-    # Determine number of questions based on text length
-    # Smart Quiz Sizing based on "Information Density"
+logger = logging.getLogger(__name__)
+
+# Suffixes added to remediation / revision quiz topics
+TOPIC_SUFFIXES = (" (Remediation)", " (Correction)", " (Remédiation)", " (Révision)")
+
+# Mastery: weighted average of the last attempts, minus a penalty per pending error
+MASTERY_WINDOW = 5
+ERROR_PENALTY = 3
+
+def quiz_size(length: int) -> Tuple[int, int]:
+    """
+    Smart Quiz Sizing based on "Information Density".
+    Returns (number of questions, estimated number of series) for a text length.
+    """
     # Heuristic: ~400 characters (approx 60-80 words) usually contain 1 indexable fact.
-    length = len(text_content)
-    
     # 1. Estimate maximal unique questions possible
     density_factor = 400
     max_unique_questions = max(3, int(length / density_factor))
     
     # 2. Determine session size (Cap at 15 to prevent cognitive overload)
-    target_questions = min(max_unique_questions, 15)
+    num_questions = min(max_unique_questions, 15)
     
     # 3. Adjust for very short texts to avoid hallucinations/redundancy
     if length < 600:
-        target_questions = 3
+        num_questions = 3
     elif length < 1200:
-        target_questions = 5
-        
-    num_questions = target_questions
+        num_questions = 5
     
     # Calculate potential series (Party Mode "Revision Series" concept)
-    # This is just internal logic for now, could be returned in metadata later
     total_series = (int(length / 300) // 15) + 1
+    return num_questions, total_series
+
+def parse_llm_json(content: str, repair: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    Robust JSON parsing of an LLM answer: direct parse, markdown block,
+    outermost braces, then (with `repair`) auto-closing of truncated JSON.
+    None if all fail.
+    """
+    def try_parse_json(text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+    
+    # 1. Direct parse
+    parsed = try_parse_json(content)
+    
+    # 2. Markdown block extraction
+    if not parsed:
+        json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
+        if json_match:
+            parsed = try_parse_json(json_match.group(1))
+    
+    # 3. Brute-force substring extraction (find outer {})
+    if not parsed:
+        start = content.find('{')
+        end = content.rfind('}')
+        if start != -1 and end != -1:
+            parsed = try_parse_json(content[start:end+1])
+            
+    # 4. Repair Truncated JSON (Simple Auto-Close)
+    if not parsed and repair:
+        # Heuristic: If it looks like it ended abruptly, try adding closures
+        start = content.find('{')
+        body = content[start:] if start != -1 else content
+        for closure in ("}", "]}", "}]}", '"}]}', '"]}}'):
+            parsed = try_parse_json(body + closure)
+            if parsed:
+                logger.warning("JSON was truncated but successfully repaired.")
+                break
+    
+    return parsed or None
+
+def normalize_topic(topic: Optional[str]) -> str:
+    """Strips remediation/revision suffixes so "Maths (Correction)" groups with "Maths"."""
+    if not topic:
+        return "General"
+    for suffix in TOPIC_SUFFIXES:
+        topic = topic.replace(suffix, "")
+    return topic.strip()
+
+def is_remediation_topic(topic: Optional[str]) -> bool:
+    """Remediation quizzes are titled "<topic> (Correction)" (or "Remediation")."""
+    topic_lower = (topic or "").lower()
+    return "remedia" in topic_lower or "correct" in topic_lower
+
+def set_topic_fields(row: Any) -> None:
+    """Derives topic_key and is_remediation from the topic of a Score, RemediationQueue or Revision."""
+    row.topic_key = normalize_topic(row.topic)
+    row.is_remediation = is_remediation_topic(row.topic)
+
+def _on_write(mapper, connection, target) -> None:
+    set_topic_fields(target)
+
+# Computed once per write, whichever code path creates or renames the row
+for _model in (Score, RemediationQueue, Revision):
+    event.listen(_model, "before_insert", _on_write)
+    event.listen(_model, "before_update", _on_write)
+
+def score_percentage(score: int, total_questions: int) -> float:
+    return (score / total_questions) * 100 if total_questions > 0 else 0
+
+def weighted_mastery(percentages: Sequence[float], pending_errors: int = 0) -> Tuple[float, str]:
+    """
+    Mastery (0-100) and status from quiz percentages, oldest first.
+    Example: [50, 60, 70] -> (50*1 + 60*2 + 70*3) / (1+2+3)
+    """
+    total_weight = 0
+    weighted_sum = 0
+    for i, pct in enumerate(percentages[-MASTERY_WINDOW:]):
+        weight = i + 1
+        weighted_sum += pct * weight
+        total_weight += weight
+    base_mastery = weighted_sum / total_weight if total_weight > 0 else 0
+    
+    final_mastery = max(0, min(100, base_mastery - pending_errors * ERROR_PENALTY))
+    
+    status = "LEARNING"
+    if final_mastery >= 80:
+        status = "MASTERED"
+    elif final_mastery >= 50:
+        status = "REVIEWING"
+    return final_mastery, status
+
+# Spaced repetition (SM-2) of remediation errors
+REMEDIATION_QUIZ_SIZE = 10 # Due errors per remediation quiz
+SM2_DEFAULT_EASE = 2.5
+SM2_MIN_EASE = 1.3
+QUALITY_CORRECT = 5
+QUALITY_FAILED = 1
+MASTERY_REPETITIONS = 3 # Successful reviews in a row (~1, 6, 15 days apart) before MASTERED
+
+def normalize_question(question: str) -> str:
+    """Case, accent, punctuation and whitespace-insensitive form of a question."""
+    folded = "".join(
+        char for char in unicodedata.normalize("NFKD", question.casefold())
+        if not unicodedata.combining(char)
+    )
+    return " ".join(re.findall(r"\w+", folded))
+
+def question_hash(question: str) -> str:
+    """Dedup key of a failed question in the remediation queue."""
+    return hashlib.sha1(normalize_question(question).encode()).hexdigest()[:16]
+
+def schedule_review(item: Any, quality: int, now: Optional[datetime] = None) -> None:
+    """
+    SM-2 update of a remediation item after a review graded 0-5 (>= 3 is a pass).
+    Passed reviews space the next one out (1 day, 6 days, then interval * ease);
+    a failure starts over tomorrow. MASTERED items leave the schedule (due_at None).
+    """
+    now = now or datetime.utcnow()
+    ease = item.ease or SM2_DEFAULT_EASE
+    if quality >= 3:
+        item.repetitions = (item.repetitions or 0) + 1
+        if item.repetitions == 1:
+            item.interval_days = 1.0
+        elif item.repetitions == 2:
+            item.interval_days = 6.0
+        else:
+            item.interval_days = round((item.interval_days or 1.0) * ease, 1)
+    else:
+        item.repetitions = 0
+        item.interval_days = 1.0
+    item.ease = max(SM2_MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+
+    if item.repetitions >= MASTERY_REPETITIONS:
+        item.status = "MASTERED"
+        item.due_at = None
+    else:
+        item.due_at = now + timedelta(days=item.interval_days)
+
+@register_backfill
+def _backfill_question_hashes(connection) -> None:
+    """Hashes remediation rows created before deduplication."""
+    rows = connection.execute(text("SELECT id, question FROM remediation_queue WHERE question_hash IS NULL")).all()
+    if rows:
+        connection.execute(
+            text("UPDATE remediation_queue SET question_hash = :hash, last_seen_at = COALESCE(last_seen_at, created_at), occurrences = COALESCE(occurrences, 1) WHERE id = :id"),
+            [{"id": row.id, "hash": question_hash(row.question)} for row in rows]
+        )
+
+@register_backfill
+def _backfill_due_dates(connection) -> None:
+    """Pending errors from before scheduling are due from when they were last failed."""
+    connection.execute(text(
+        "UPDATE remediation_queue SET due_at = COALESCE(last_seen_at, created_at)"
+        " WHERE due_at IS NULL AND status = 'PENDING'"
+    ))
+
+@register_backfill
+def _backfill_topic_fields(connection) -> None:
+    """Topic keys and remediation flags of rows written before they existed."""
+    existing_tables = set(inspect(connection).get_table_names())
+    for model in (Score, RemediationQueue, Revision):
+        table = model.__tablename__
+        if table not in existing_tables:
+            continue
+        rows = connection.execute(text(f"SELECT id, topic FROM {table} WHERE topic_key = ''")).all()
+        if rows:
+            connection.execute(
+                text(f"UPDATE {table} SET topic_key = :topic_key, is_remediation = :is_remediation WHERE id = :id"),
+                [{"id": row.id, "topic_key": normalize_topic(row.topic), "is_remediation": is_remediation_topic(row.topic)} for row in rows]
+            )
+
+def bucket_activities(activities: List[Dict[str, Any]], now: Optional[datetime] = None) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """
+    Groups activities (dicts with created_at and minutes) by day, newest first.
+    Returns ({"today_minutes", "week_minutes"}, daily history).
+    """
+    now = now or datetime.utcnow()
+    today_str = now.strftime("%Y-%m-%d")
+    week_ago = now - timedelta(days=7)
     
-    print(f"Smart Sizing: Length={length} chars -> {num_questions} questions (Series estimate: {total_series})")
+    activities.sort(key=lambda x: x["created_at"], reverse=True)
     
-    # Series Context Hint
-    series_hint = ""
-    if total_series > 1:
-        series_hint = f"\n\nCONTEXT: This text is long and is split into {total_series} parts. This is Part {series_index}. Please focus your questions on the section of the text corresponding roughly to part {series_index}/{total_series}."
+    summary = {"today_minutes": 0, "week_minutes": 0}
+    history = {}
+    for act in activities:
+        date_key = act["created_at"].strftime("%Y-%m-%d")
+        day = history.get(date_key)
+        if day is None:
+            day = history[date_key] = {
+                "date": date_key,
+                "total_minutes": 0,
+                "items": []
+            }
+        day["items"].append(act)
+        day["total_minutes"] += act["minutes"]
+        
+        if date_key == today_str:
+            summary["today_minutes"] += act["minutes"]
+        if act["created_at"] >= week_ago:
+            summary["week_minutes"] += act["minutes"]
+    return summary, list(history.values())
 
-    prompt = SYSTEM_PROMPT.format(difficulty=difficulty, num_questions=num_questions) + series_hint
+async def generate_quiz(
+    text_content: str,
+    api_key: str,
+    difficulty: str = "medium",
+    series_index: int = 1,
+    feature: str = FEATURE_QUIZ,
+    user_id: Optional[uuid.UUID] = None,
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    """
+    Generates a quiz from text content using LLM. `feature` labels the call in llm_calls.
+    Identical requests are served from the shared response cache unless `use_cache` is False;
+    only responses that parsed are cached.
+    """
+    
+    length = len(text_content)
+    num_questions, total_series = quiz_size(length)
+    
+    logger.debug("Smart Sizing: Length=%d chars -> %d questions (Series estimate: %d)", length, num_questions, total_series)
     
     payload = {
         "model": DEFAULT_MODEL,
-        "messages": [
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": f"Here is the lesson text:\n\n{text_content}"}
-        ],
+        "messages": build_quiz_messages(
+            text_content,
+            num_questions,
+            difficulty,
+            series_index=series_index,
+            total_series=total_series,
+            math_content=detect_math_content(text_content).is_math
+        ),
         "response_format": {"type": "json_object"},
         "max_tokens": 4000
     }
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://reviflow.app",
-        "X-Title": "Reviflow"
-    }
+    result = await chat_completion(payload, api_key, feature=feature, timeout=60.0, user_id=user_id, cache=use_cache)
+    content = result["choices"][0]["message"]["content"]
+    usage = result.get("usage", {})
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            OPENROUTER_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=60.0
-        )
+    # Strict: a truncated quiz would silently lose questions
+    parsed = parse_llm_json(content, repair=False)
+    if parsed is None:
+        logger.error("Deep Parse Failed - Raw Content: %s", content[:500])
+        raise Exception("Failed to parse AI response as JSON. Content might be truncated or invalid.")
+    if use_cache:
+        await cache_response(payload, result)
 
-        if response.status_code != 200:
-            raise Exception(f"OpenRouter API error ({response.status_code}): {response.text}")
+    return {
+        "quiz": parsed,
+        "usage": usage,
+        "meta": {"total_series": total_series}
+    }
 
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        usage = result.get("usage", {})
-        
-        try:
-            return {
-                "quiz": json.loads(content),
-                "usage": usage,
-                "meta": {"total_series": total_series}
-            }
-        except json.JSONDecodeError:
-            print(f"JSON Parse Error - Raw Content: {content}")
-            # Robust Fallback strategy
-            import re
-            cleaned = content
-            
-            # 1. Try finding a markdown code block
-            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-            if json_match:
-                 cleaned = json_match.group(1)
-            else:
-                 # 2. Try finding the outermost JSON object
-                 # Find first '{'
-                 start = content.find('{')
-                 # Find last '}'
-                 end = content.rfind('}')
-                 
-                 if start != -1 and end != -1:
-                     cleaned = content[start:end+1]
-
-            try:
-                return {
-                    "quiz": json.loads(cleaned),
-                    "usage": usage,
-                    "meta": {"total_series": total_series}
-                }
-            except json.JSONDecodeError as e:
-                print(f"Deep Parse Failed: {e}")
-                raise Exception("Failed to parse AI response as JSON. Content might be truncated or invalid.")
-
-async def generate_remediation_quiz_service(context_items: List[Dict[str, Any]], api_key: str, source_text: str = None) -> Dict[str, Any]:
+async def generate_remediation_quiz_service(
+    context_items: List[Dict[str, Any]],
+    api_key: str,
+    source_text: str = None,
+    user_id: Optional[uuid.UUID] = None
+) -> Dict[str, Any]:
     """Generates a remediation quiz based on errors."""
     
     # Extract topics from context or questions to guide the LLM
     # This prevents it from thinking the topic is "Remediation"
-    def clean_topic_name(t):
-        if not t: return "General"
-        return t.replace(" (Remediation)", "").replace(" (Correction)", "").replace(" (Remédiation)", "").replace(" (Révision)", "").strip()
-
-    topics_context = list(set([clean_topic_name(item['context']) for item in context_items if item['context']]))
+    # (the errors' topic_key when given, else their context)
+    topics_context = list(set([item.get('topic') or normalize_topic(item['context']) for item in context_items if item.get('topic') or item['context']]))
     joined_topics = ", ".join(topics_context)
 
     errors_desc = "\n".join([
-        f"- Failed Question: {item['question']}\n  Student's Wrong Answer: {item['wrong_answer']}\n  Correct Answer: {item['correct_answer']}\n  Subject Context: {item['context']}"
-        for item in context_items
+        f"- Error #{index}:\n  Failed Question: {item['question']}\n  Student's Wrong Answer: {item['wrong_answer']}\n  Correct Answer: {item['correct_answer']}\n  Subject Context: {item['context']}"
+        for index, item in enumerate(context_items, start=1)
     ])
     
     context_injection = ""
@@ -171,6 +341,7 @@ async def generate_remediation_quiz_service(context_items: List[Dict[str, Any]],
     6. **CRITICAL**: The questions must be about the SUBJECT MATTER ({joined_topics}). Do NOT generate questions about "remediation", "learning strategies", or "translation".
     7. **Language**: output MUST be in French.
     8. Provide a clear, helpful "explanation" for the correct answer.
+    9. Set "error_index" of each new question to the number of the error it reviews (Error #N -> N).
 
     Output strictly valid JSON with this EXACT structure:
     {{
@@ -178,6 +349,7 @@ async def generate_remediation_quiz_service(context_items: List[Dict[str, Any]],
       "questions": [
         {{
           "id": 1,
+          "error_index": 1,
           "question": "New question text...",
           "options": ["Option A", "Option B", "Option C", "Option D"],
           "correct_answer": 0,
@@ -187,6 +359,9 @@ async def generate_remediation_quiz_service(context_items: List[Dict[str, Any]],
     }}
     """
 
+    if detect_math_content(f"{source_text or ''}\n{errors_desc}").is_math:
+        REMEDIATION_SYSTEM_PROMPT += MATH_SAFE_HINT
+
     payload = {
         "model": DEFAULT_MODEL,
         "messages": [
@@ -197,75 +372,18 @@ async def generate_remediation_quiz_service(context_items: List[Dict[str, Any]],
         "max_tokens": 8000
     }
     
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://reviflow.app",
-        "X-Title": "Reviflow"
-    }
+    result = await chat_completion(payload, api_key, feature=FEATURE_REMEDIATION, timeout=120.0, user_id=user_id)
+    content = result["choices"][0]["message"]["content"]
+    usage = result.get("usage", {})
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            OPENROUTER_API_URL,
-            json=payload,
-            headers=headers,
-            timeout=120.0
-        )
-
-        if response.status_code != 200:
-            raise Exception(f"OpenRouter API error ({response.status_code}): {response.text}")
-
-        result = response.json()
-        content = result["choices"][0]["message"]["content"]
-        usage = result.get("usage", {})
-        
-        # --- Robust JSON Parsing Strategy ---
-        def try_parse_json(text):
-            try:
-                return json.loads(text)
-            except json.JSONDecodeError:
-                return None
-        
-        # 1. Direct parse
-        parsed = try_parse_json(content)
-        
-        # 2. Markdown block extraction
-        if not parsed:
-            import re
-            json_match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-            if json_match:
-                parsed = try_parse_json(json_match.group(1))
-        
-        # 3. Brute-force substring extraction (find outer {})
-        if not parsed:
-            start = content.find('{')
-            end = content.rfind('}')
-            if start != -1 and end != -1:
-                parsed = try_parse_json(content[start:end+1])
-                
-        # 4. Repair Truncated JSON (Simple Auto-Close)
-        if not parsed:
-            # Heuristic: If it looks like it ended abruptly, try adding closures
-            # Try adding "]}" or "}]}" or just "}"
-            candidates = [content + "}", content + "]}", content + "}]}", content + '"}]}', content + '"]}}' ]
-            for candidate in candidates:
-                # Need to strip potential markdown markers if we are patching the raw content
-                clean_candidate = candidate
-                start = clean_candidate.find('{')
-                if start != -1:
-                     clean_candidate = clean_candidate[start:]
-                
-                parsed = try_parse_json(clean_candidate)
-                if parsed:
-                    print("WARN: JSON was truncated but successfully repaired.")
-                    break
+    parsed = parse_llm_json(content)
+    
+    if parsed:
+        return {
+            "quiz": parsed,
+            "usage": usage
+        }
         
-        if parsed:
-            return {
-                "quiz": parsed,
-                "usage": usage
-            }
-            
-        print(f"FAILED JSON CONTENT (First 500 chars): {content[:500]}...")
-        print(f"FAILED JSON CONTENT (Last 500 chars): {content[-500:]}...")
-        raise Exception("Failed to parse AI response as JSON (Malformed or Truncated)")
+    logger.error("FAILED JSON CONTENT (First 500 chars): %s...", content[:500])
+    logger.error("FAILED JSON CONTENT (Last 500 chars): %s...", content[-500:])
+    raise Exception("Failed to parse AI response as JSON (Malformed or Truncated)")
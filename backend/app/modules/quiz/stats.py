@@ -0,0 +1,189 @@
+"""
+Per-learner dashboard rollup (`learner_stats`), one JSON row per learner:
+- topics: per topic_key, the last MASTERY_WINDOW quiz percentages
+  (oldest first), the quiz count and the last quiz date
+- pending: pending remediation errors per topic and per revision
+- minutes: estimated study minutes per day (last MINUTES_RETENTION_DAYS)
+- quizzes / revisions: totals
+
+Writes update it incrementally (`record_quiz`, `record_revision`, caller
+commits); deletions rebuild it from the raw rows (`rebuild_stats`), as does
+`python -m app.cli rebuild-stats`. Writers lock the row (SELECT ... FOR
+UPDATE) until their commit, so concurrent updates of a learner apply one
+after the other; a missing row is created with an insert that yields to a
+concurrent one. Dashboard reads are a single row lookup and never write:
+learners without a row yet are computed from the raw rows until their next
+write creates it.
+"""
+import json
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from app.core.db import dialect_insert
+from app.modules.quiz.models import LearnerStats, RemediationQueue, Revision, Score
+from app.modules.quiz.service import MASTERY_WINDOW, score_percentage, weighted_mastery
+
+# Estimated study time per activity
+TIME_PER_REVISION = 5
+TIME_PER_QUIZ = 3
+MINUTES_RETENTION_DAYS = 31
+
+def empty_stats() -> Dict[str, Any]:
+    return {"topics": {}, "pending": {"topics": {}, "revisions": {}}, "minutes": {}, "quizzes": 0, "revisions": 0}
+
+def _add_minutes(stats: Dict[str, Any], at: datetime, minutes: int) -> None:
+    day = at.strftime("%Y-%m-%d")
+    stats["minutes"][day] = stats["minutes"].get(day, 0) + minutes
+
+def add_quiz(stats: Dict[str, Any], topic_key: str, percentage: float, at: datetime) -> None:
+    stats["quizzes"] += 1
+    _add_minutes(stats, at, TIME_PER_QUIZ)
+    if not topic_key:
+        return
+    entry = stats["topics"].setdefault(topic_key, {"window": [], "quizzes": 0, "last_activity": None})
+    entry["window"] = (entry["window"] + [percentage])[-MASTERY_WINDOW:]
+    entry["quizzes"] += 1
+    entry["last_activity"] = at.isoformat()
+
+def add_revision(stats: Dict[str, Any], at: datetime) -> None:
+    stats["revisions"] += 1
+    _add_minutes(stats, at, TIME_PER_REVISION)
+
+def minutes_summary(stats: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, int]:
+    """Minutes today and over the last 7 days (at day granularity)."""
+    now = now or datetime.utcnow()
+    today = now.strftime("%Y-%m-%d")
+    week_start = (now - timedelta(days=7)).strftime("%Y-%m-%d")
+    return {
+        "today_minutes": stats["minutes"].get(today, 0),
+        "week_minutes": sum(minutes for day, minutes in stats["minutes"].items() if day >= week_start)
+    }
+
+def activity_summary(stats: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, int]:
+    return {**minutes_summary(stats, now), "total_quizzes": stats["quizzes"], "total_revisions": stats["revisions"]}
+
+def topic_mastery(stats: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Mastery per topic (weighted last attempts minus pending errors), most recently active first."""
+    rows = []
+    for topic, entry in stats["topics"].items():
+        pending_errors = stats["pending"]["topics"].get(topic, 0)
+        final_mastery, status = weighted_mastery(entry["window"], pending_errors)
+        rows.append({
+            "topic": topic,
+            "mastery_score": int(final_mastery),
+            "quizzes_count": entry["quizzes"],
+            "pending_errors": pending_errors,
+            "status": status,
+            "last_activity": datetime.fromisoformat(entry["last_activity"]),
+        })
+    rows.sort(key=lambda row: row["last_activity"], reverse=True)
+    return rows
+
+async def pending_counts(db: AsyncSession, learner_id: uuid.UUID) -> Dict[str, Dict[str, int]]:
+    """Pending remediation errors per topic_key and per revision (one GROUP BY query)."""
+    rows = (await db.execute(
+        select(RemediationQueue.topic_key, RemediationQueue.revision_id, func.count())
+        .where(RemediationQueue.learner_id == learner_id, RemediationQueue.status == "PENDING")
+        .group_by(RemediationQueue.topic_key, RemediationQueue.revision_id)
+    )).all()
+    counts: Dict[str, Dict[str, int]] = {"topics": {}, "revisions": {}}
+    for topic_key, revision_id, count in rows:
+        if topic_key:
+            counts["topics"][topic_key] = counts["topics"].get(topic_key, 0) + count
+        if revision_id:
+            counts["revisions"][str(revision_id)] = counts["revisions"].get(str(revision_id), 0) + count
+    return counts
+
+async def compute_stats(db: AsyncSession, learner_id: Optional[uuid.UUID]) -> Dict[str, Any]:
+    """The rollup computed from the raw rows."""
+    stats = empty_stats()
+    scores = (await db.execute(
+        select(Score.topic_key, Score.score, Score.total_questions, Score.created_at)
+        .where(Score.learner_id == learner_id).order_by(Score.created_at)
+    )).all()
+    for topic_key, score, total_questions, created_at in scores:
+        add_quiz(stats, topic_key, score_percentage(score, total_questions), created_at)
+    for (created_at,) in (await db.execute(select(Revision.created_at).where(Revision.learner_id == learner_id))).all():
+        add_revision(stats, created_at)
+    if learner_id is not None:
+        stats["pending"] = await pending_counts(db, learner_id)
+    return stats
+
+async def _create(db: AsyncSession, learner_id: uuid.UUID, stats: Dict[str, Any]) -> bool:
+    """Inserts a learner's missing row; False if a concurrent writer created it first."""
+    statement = dialect_insert(db, LearnerStats.__table__).values(
+        learner_id=learner_id, data=_serialize(stats), updated_at=datetime.utcnow()
+    ).on_conflict_do_nothing(index_elements=["learner_id"])
+    return (await db.execute(statement)).rowcount == 1
+
+async def _load(db: AsyncSession, learner_id: uuid.UUID) -> Optional[Tuple[LearnerStats, Dict[str, Any]]]:
+    """
+    The learner's rollup row, locked until the caller commits, and its data.
+    None when the row was missing: it is then created from the raw rows, which
+    already include the caller's pending writes.
+    """
+    row = await db.get(LearnerStats, learner_id, with_for_update=True)
+    if row is None:
+        if await _create(db, learner_id, await compute_stats(db, learner_id)):
+            return None
+        row = await db.get(LearnerStats, learner_id, with_for_update=True)
+    return row, json.loads(row.data)
+
+def _serialize(stats: Dict[str, Any]) -> str:
+    oldest = (datetime.utcnow() - timedelta(days=MINUTES_RETENTION_DAYS)).strftime("%Y-%m-%d")
+    stats["minutes"] = {day: minutes for day, minutes in stats["minutes"].items() if day >= oldest}
+    return json.dumps(stats)
+
+def _store(db: AsyncSession, row: LearnerStats, stats: Dict[str, Any]) -> None:
+    row.data = _serialize(stats)
+    row.updated_at = datetime.utcnow()
+    db.add(row)
+
+async def record_quiz(db: AsyncSession, learner_id: uuid.UUID, score: Score) -> None:
+    """Adds a quiz score and refreshes the pending error counts (after the remediation queue changes)."""
+    loaded = await _load(db, learner_id)
+    if loaded:
+        row, stats = loaded
+        add_quiz(stats, score.topic_key, score_percentage(score.score, score.total_questions), score.created_at)
+        stats["pending"] = await pending_counts(db, learner_id)
+        _store(db, row, stats)
+
+async def record_revision(db: AsyncSession, learner_id: uuid.UUID, at: datetime) -> None:
+    loaded = await _load(db, learner_id)
+    if loaded:
+        row, stats = loaded
+        add_revision(stats, at)
+        _store(db, row, stats)
+
+async def rebuild_stats(db: AsyncSession, learner_id: uuid.UUID) -> Dict[str, Any]:
+    """Recomputes a learner's rollup from the raw rows. Written in the session; the caller commits."""
+    row = await db.get(LearnerStats, learner_id, with_for_update=True)
+    stats = await compute_stats(db, learner_id)
+    if row is None:
+        if await _create(db, learner_id, stats):
+            return stats
+        row = await db.get(LearnerStats, learner_id, with_for_update=True)
+    _store(db, row, stats)
+    return stats
+
+async def get_stats(db: AsyncSession, learner_id: Optional[uuid.UUID]) -> Dict[str, Any]:
+    """The learner's rollup; computed (not saved) for learners without a row yet."""
+    if learner_id is None:
+        # Main profile activity: not rolled up
+        return await compute_stats(db, None)
+    row = await db.get(LearnerStats, learner_id)
+    if row is not None:
+        return json.loads(row.data)
+    return await compute_stats(db, learner_id)
+
+async def get_stats_many(db: AsyncSession, learner_ids: Sequence[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """Rollups of several learners in one query (missing ones are computed, not saved)."""
+    rows = (await db.execute(select(LearnerStats).where(LearnerStats.learner_id.in_(list(learner_ids))))).scalars().all()
+    stats = {row.learner_id: json.loads(row.data) for row in rows}
+    for learner_id in learner_ids:
+        if learner_id not in stats:
+            stats[learner_id] = await compute_stats(db, learner_id)
+    return stats
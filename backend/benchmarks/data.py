@@ -0,0 +1,76 @@
+"""
+Synthetic data generators for the microbenchmarks.
+
+Sizes match the worst cases seen in production: learners with ~10k scores,
+~500 KB of OCR text from long uploads, and ~8000-token LLM answers cut off
+mid-JSON by max_tokens.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+TOPICS = ["Maths", "Histoire", "Sciences", "Français", "Anglais", "Géographie", "Physique", "SVT"]
+SUFFIXES = ["", " (Correction)", " (Remediation)", " (Révision)", " (Remédiation)"]
+
+LESSON_SENTENCES = [
+    "La Révolution française commence en 1789 avec la prise de la Bastille.",
+    "Les plantes produisent leur matière organique grâce à la photosynthèse.",
+    "Le verbe s'accorde avec son sujet en genre et en nombre.",
+    "Le Nil est le plus long fleuve d'Afrique et traverse onze pays.",
+    "Un triangle rectangle possède un angle droit.",
+]
+
+def scores(count: int = 10_000, days: int = 365, seed: int = 0) -> List[SimpleNamespace]:
+    """Score-like rows (topic, score, total_questions, created_at) spread over `days`."""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    rows = []
+    for _ in range(count):
+        total = rng.choice([3, 5, 10, 15])
+        rows.append(SimpleNamespace(
+            topic=rng.choice(TOPICS) + rng.choice(SUFFIXES),
+            score=rng.randint(0, total),
+            total_questions=total,
+            created_at=now - timedelta(seconds=rng.randint(0, days * 86400)),
+        ))
+    return rows
+
+def activities(count: int = 10_000, days: int = 365, seed: int = 0) -> List[Dict[str, Any]]:
+    """Activity dicts as built by get_activity_stats."""
+    return [
+        {"type": "QUIZ", "topic": row.topic, "created_at": row.created_at, "minutes": 3, "details": f"Quiz ({row.score}/{row.total_questions})"}
+        for row in scores(count, days, seed)
+    ]
+
+def ocr_text(size: int = 500_000, seed: int = 0) -> str:
+    """French lesson text of about `size` characters, with no math keywords (the worst case for the scan)."""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        sentence = rng.choice(LESSON_SENTENCES)
+        parts.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(parts)
+
+def quiz_json(questions: int = 60) -> str:
+    """A quiz answer as the LLM returns it (~130 tokens per question)."""
+    return json.dumps({
+        "topic": "Histoire",
+        "questions": [
+            {
+                "id": index,
+                "question": f"Question {index} : " + LESSON_SENTENCES[index % len(LESSON_SENTENCES)],
+                "options": ["Première réponse possible", "Deuxième réponse possible", "Troisième réponse possible", "Quatrième réponse possible"],
+                "correct_answer": index % 4,
+                "explanation": " ".join(LESSON_SENTENCES),
+            }
+            for index in range(1, questions + 1)
+        ],
+    }, ensure_ascii=False)
+
+def truncated_quiz_json(questions: int = 60) -> str:
+    """An ~8000-token quiz answer cut off by max_tokens inside the last question's explanation."""
+    content = quiz_json(questions)
+    return content[:content.rindex('"explanation"') + 40]
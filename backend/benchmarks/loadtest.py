@@ -0,0 +1,185 @@
+"""
+End-to-end load test against a mocked OpenRouter.
+
+Each virtual user walks the full Reviflow flow through the ASGI app:
+register -> login -> create child -> analyze -> generate -> progress saves
+-> score -> remediation -> stats. Users run with bounded concurrency and
+latency percentiles are reported per endpoint, so performance changes can
+be measured offline without spending real money.
+
+Usage (from backend/):
+    python -m benchmarks.loadtest --users 50 --concurrency 10 --latency 0.8 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import base64
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List
+
+sys.path.append(os.getcwd())
+
+# Isolated database so the load test never touches reviflow.db
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/loadtest.db")
+
+from httpx import AsyncClient
+from app.config import settings
+from app.core.db import create_db_and_tables
+from app.main import app
+from app.modules.llm import service as llm_service
+from benchmarks.mock_openrouter import MockConfig, MockOpenRouter
+
+PASSWORD = "loadPassword123!"
+PROGRESS_SAVES = 5
+# A few bytes are enough: the mock never decodes the image
+FAKE_IMAGE = base64.b64encode(b"\xff\xd8\xff\xe0 mock jpeg").decode()
+
+class Recorder:
+    """Latencies and failures per endpoint label."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: AsyncClient, label: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies[label].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.failures[label] += 1
+            return None
+        return response.json()
+
+    def report(self) -> List[dict]:
+        rows = []
+        for label, values in self.latencies.items():
+            values = sorted(values)
+            rows.append({
+                "endpoint": label,
+                "count": len(values),
+                "errors": self.failures[label],
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            })
+        return rows
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+async def user_flow(client: AsyncClient, recorder: Recorder) -> None:
+    email = f"load-{uuid.uuid4().hex[:12]}@example.com"
+    if await recorder.call(client, "POST /auth/register", "POST", "/api/auth/register", json={"email": email, "password": PASSWORD, "role": "parent"}) is None:
+        return
+    token = await recorder.call(client, "POST /auth/jwt/login", "POST", "/api/auth/jwt/login", data={"username": email, "password": PASSWORD})
+    if token is None:
+        return
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+    child = await recorder.call(client, "POST /auth/profiles", "POST", "/api/auth/profiles", headers=headers, json={
+        "username": f"kid-{uuid.uuid4().hex[:12]}", "password": "1234", "first_name": "Kid"
+    })
+    if child is None:
+        return
+    learner_id = child["user"]["profile_id"]
+
+    analysis = await recorder.call(client, "POST /ingest/analyze", "POST", "/api/ingest/analyze", headers=headers, json={"images_base64": [FAKE_IMAGE] * 2})
+    if analysis is None:
+        return
+
+    quiz = await recorder.call(client, "POST /quiz/generate", "POST", "/api/quiz/generate", headers=headers, json={
+        "text_content": analysis["raw_text"], "title": analysis["title"], "subject": analysis["subject"],
+        "synthesis": analysis["synthesis"], "learner_id": learner_id
+    })
+    if quiz is None:
+        return
+    revision_id = quiz["revision_id"]
+    questions = quiz["questions"]
+
+    # Answer one question per save; every other answer is wrong
+    answers = []
+    for index, question in enumerate(questions[:PROGRESS_SAVES]):
+        answers.append(question["correct_answer"] if index % 2 == 0 else (question["correct_answer"] + 1) % 4)
+        await recorder.call(client, "POST /quiz/progress/save", "POST", "/api/quiz/progress/save", headers=headers, json={
+            "revision_id": revision_id, "current_index": index + 1, "answers": answers, "score": 0,
+            "client_timestamp": datetime.now(timezone.utc).isoformat()
+        })
+
+    details = [
+        {
+            "question": question["question"],
+            "user_answer": question["options"][(question["correct_answer"] + index % 2) % 4],
+            "correct_answer": question["options"][question["correct_answer"]],
+            "is_correct": index % 2 == 0,
+        }
+        for index, question in enumerate(questions)
+    ]
+    await recorder.call(client, "POST /quiz/score", "POST", "/api/quiz/score", headers=headers, json={
+        "topic": quiz["topic"], "score": sum(detail["is_correct"] for detail in details), "total_questions": len(questions),
+        "learner_id": learner_id, "revision_id": revision_id, "details": details
+    })
+
+    await recorder.call(client, "POST /quiz/remediation/generate", "POST", "/api/quiz/remediation/generate", headers=headers, json={"learner_id": learner_id})
+    await recorder.call(client, "GET /quiz/stats/mastery", "GET", "/api/quiz/stats/mastery", headers=headers, params={"learner_id": learner_id})
+    await recorder.call(client, "GET /quiz/stats/activity", "GET", "/api/quiz/stats/activity", headers=headers, params={"learner_id": learner_id})
+
+async def run(users: int, concurrency: int, config: MockConfig, retry_backoff: float = llm_service.RETRY_BACKOFF_SECONDS) -> List[dict]:
+    """Runs `users` full flows and returns the per-endpoint report rows."""
+    await create_db_and_tables()
+    mock = MockOpenRouter(config)
+    mock.install()
+    settings.OPENROUTER_API_KEY = settings.OPENROUTER_API_KEY or "mock-key"
+    llm_service.RETRY_BACKOFF_SECONDS = retry_backoff
+
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded_flow():
+        async with semaphore:
+            await user_flow(client, recorder)
+
+    async with AsyncClient(app=app, base_url="http://loadtest", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(bounded_flow() for _ in range(users)))
+        elapsed = time.perf_counter() - started
+
+    await llm_service.close_http_client()
+    rows = recorder.report()
+    print(f"Users: {users} (concurrency {concurrency}) in {elapsed:.1f}s, upstream calls: {mock.requests} ({mock.errors} injected errors)")
+    print(f"{'endpoint':34} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in rows:
+        print(f"{row['endpoint']:34} {row['count']:>6} {row['errors']:>6} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock upstream latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Extra random upstream latency (s)")
+    parser.add_argument("--stream-seconds", type=float, default=0.0, help="Time to stream each upstream body (s)")
+    parser.add_argument("--prompt-tokens", type=int, default=1500)
+    parser.add_argument("--completion-tokens", type=int, default=600)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    asyncio.run(run(args.users, args.concurrency, MockConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        stream_seconds=args.stream_seconds,
+        prompt_tokens=args.prompt_tokens,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+    )))
@@ -0,0 +1,77 @@
+"""
+Login throughput benchmark.
+
+Drives concurrent logins through the ASGI app and measures logins/second,
+latency percentiles and the worst event-loop stall seen meanwhile (a stalled
+loop is what freezes SSE streams and quiz requests during logins).
+
+Usage (from backend/):
+    python -m benchmarks.login_throughput --logins 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.append(os.getcwd())
+
+# Isolated database so the benchmark never touches reviflow.db
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/bench.db")
+
+from httpx import AsyncClient
+from app.main import app
+from app.core.db import create_db_and_tables
+
+EMAIL = "bench@example.com"
+PASSWORD = "benchPassword123!"
+
+async def _watch_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    """Returns the largest delay between scheduled and actual wake-ups."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+async def run(logins: int, concurrency: int) -> None:
+    await create_db_and_tables()
+
+    async with AsyncClient(app=app, base_url="http://bench") as client:
+        await client.post("/api/auth/register", json={"email": EMAIL, "password": PASSWORD, "role": "parent"})
+
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def login():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/auth/jwt/login", data={"username": EMAIL, "password": PASSWORD})
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.text
+
+        stop = asyncio.Event()
+        watcher = asyncio.create_task(_watch_loop_lag(stop))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+
+        stop.set()
+        worst_lag = await watcher
+
+    latencies.sort()
+    print(f"Logins:          {logins} (concurrency {concurrency})")
+    print(f"Throughput:      {logins / elapsed:.1f} logins/s")
+    print(f"Latency p50/p95: {statistics.median(latencies) * 1000:.1f} ms / {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"Worst loop lag:  {worst_lag * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.concurrency))
@@ -0,0 +1,148 @@
+"""
+Local OpenRouter stand-in for benchmarks and tests.
+
+MockOpenRouter is an httpx transport answering chat completions the way
+OpenRouter does, with a configurable behaviour:
+- latency: base delay (+ random jitter) before the response headers
+- streaming: the body is delivered in chunks spread over `stream_seconds`
+  (as SSE `data:` events when the payload asks for `"stream": true`)
+- token counts reported in `usage`
+- error rate (e.g. 503s, which the client retries) and truncated JSON
+
+Responses are shaped after the request: the ingest prompt gets a lesson
+analysis, quiz / remediation prompts get a quiz with the requested number
+of questions.
+
+Usage:
+    mock = MockOpenRouter(MockConfig(latency=0.5, error_rate=0.05))
+    mock.install()  # routes app.modules.llm.service through the mock
+"""
+import asyncio
+import json
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from app.modules.llm import service as llm_service
+
+@dataclass
+class MockConfig:
+    latency: float = 0.0 # Seconds before the response headers
+    jitter: float = 0.0 # Extra uniform random delay, in seconds
+    stream_seconds: float = 0.0 # Time taken to deliver the body after the headers
+    stream_chunks: int = 8
+    prompt_tokens: int = 1500
+    completion_tokens: int = 600
+    cached_tokens: int = 0
+    cost: Optional[float] = None # Reported billed cost; None lets the app price tokens
+    error_rate: float = 0.0
+    error_status: int = 503
+    truncate_rate: float = 0.0 # Share of responses whose JSON content is cut in half
+    seed: Optional[int] = None
+
+class MockOpenRouter(httpx.AsyncBaseTransport):
+    def __init__(self, config: Optional[MockConfig] = None):
+        self.config = config or MockConfig()
+        self.random = random.Random(self.config.seed)
+        self.requests = 0
+        self.errors = 0
+
+    def install(self) -> httpx.AsyncClient:
+        """Replaces the shared OpenRouter client with one backed by this transport."""
+        client = httpx.AsyncClient(transport=self, timeout=120.0)
+        llm_service._client = client
+        return client
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        config = self.config
+        await asyncio.sleep(config.latency + self.random.uniform(0, config.jitter))
+
+        if self.random.random() < config.error_rate:
+            self.errors += 1
+            return httpx.Response(config.error_status, json={"error": {"message": "Mock upstream error", "code": config.error_status}})
+
+        payload = json.loads(request.content)
+        content = json.dumps(_content_for(payload), ensure_ascii=False)
+        if self.random.random() < config.truncate_rate:
+            content = content[:len(content) // 2]
+
+        usage: Dict[str, Any] = {
+            "prompt_tokens": config.prompt_tokens,
+            "completion_tokens": config.completion_tokens,
+            "total_tokens": config.prompt_tokens + config.completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": config.cached_tokens},
+        }
+        if config.cost is not None:
+            usage["cost"] = config.cost
+
+        model = payload.get("model", llm_service.DEFAULT_MODEL)
+        if payload.get("stream"):
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._sse(model, content, usage))
+
+        body = json.dumps({
+            "id": f"gen-mock-{self.requests}",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }).encode()
+        return httpx.Response(200, headers={"content-type": "application/json"}, content=self._chunked(body))
+
+    async def _chunked(self, body: bytes) -> AsyncIterator[bytes]:
+        chunks = max(1, self.config.stream_chunks)
+        size = -(-len(body) // chunks)
+        for start in range(0, len(body), size):
+            if self.config.stream_seconds:
+                await asyncio.sleep(self.config.stream_seconds / chunks)
+            yield body[start:start + size]
+
+    async def _sse(self, model: str, content: str, usage: Dict[str, Any]) -> AsyncIterator[bytes]:
+        chunks = max(1, self.config.stream_chunks)
+        size = -(-len(content) // chunks) or 1
+        for start in range(0, len(content), size):
+            if self.config.stream_seconds:
+                await asyncio.sleep(self.config.stream_seconds / chunks)
+            delta = {"model": model, "choices": [{"index": 0, "delta": {"content": content[start:start + size]}}]}
+            yield f"data: {json.dumps(delta)}\n\n".encode()
+        yield f"data: {json.dumps({'model': model, 'choices': [], 'usage': usage})}\n\n".encode()
+        yield b"data: [DONE]\n\n"
+
+def _text(message: Dict[str, Any]) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list): # Multimodal: keep the text parts
+        return " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+    return content
+
+def _content_for(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Plausible JSON answer for one of the app's prompts."""
+    messages: List[Dict[str, Any]] = payload.get("messages", [])
+    prompt = "\n".join(_text(message) for message in messages)
+
+    if "raw_text" in prompt: # Ingest analysis
+        return {
+            "title": "La photosynthèse",
+            "subject": "Sciences",
+            "raw_text": "La photosynthèse permet aux plantes de produire leur matière organique. " * 20,
+            "synthesis": "- Les plantes captent la lumière\n- Elles absorbent le CO2\n- Elles rejettent du dioxygène",
+            "study_tips": ["Relis le schéma", "Explique-le à voix haute", "Fais une fiche"],
+            "is_math_content": False,
+        }
+
+    match = re.search(r"Generate exactly (\d+) questions", prompt) or re.search(r"Format\*\*: (\d+) questions", prompt)
+    count = int(match.group(1)) if match else 5
+    topic = "Sciences (Correction)" if "Correction" in prompt else "Sciences"
+    questions = [
+        {
+            "id": index,
+            "question": f"Question {index} sur la photosynthèse ?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "correct_answer": index % 4,
+            "explanation": "Les plantes utilisent la lumière pour produire du glucose.",
+        }
+        for index in range(1, count + 1)
+    ]
+    if "error_index" in prompt: # Remediation: each question echoes its error
+        for question in questions:
+            question["error_index"] = question["id"]
+    return {"topic": topic, "questions": questions}
@@ -0,0 +1,71 @@
+"""
+Cold-start benchmark: what a freshly scaled-up worker pays before and while
+serving its first requests.
+
+Each run is a new Python process (nothing cached in sys.modules) that times:
+- import: importing app.main (routers, models, static index)
+- startup: the lifespan startup (DB init, warm-up of DB and HTTP pools)
+- first_request / second_request: two authenticated requests, the first
+  one paying for anything still lazily initialized
+
+Usage (from backend/):
+    python -m benchmarks.startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+PHASES = ("import", "startup", "first_request", "second_request")
+
+# Runs inside the child process
+_CHILD = """
+import asyncio, json, time
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+from httpx import AsyncClient
+
+async def main():
+    timings = {"import": imported - started}
+    async with app.router.lifespan_context(app):
+        timings["startup"] = time.perf_counter() - imported
+        async with AsyncClient(app=app, base_url="http://startup") as client:
+            await client.post("/api/auth/register", json={"email": "cold@example.com", "password": "coldStart123!", "role": "parent"})
+            token = (await client.post("/api/auth/jwt/login", data={"username": "cold@example.com", "password": "coldStart123!"})).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            for phase in ("first_request", "second_request"):
+                phase_start = time.perf_counter()
+                response = await client.get("/api/quiz/stats/activity", headers=headers)
+                assert response.status_code == 200, response.text
+                timings[phase] = time.perf_counter() - phase_start
+    print(json.dumps(timings))
+
+asyncio.run(main())
+"""
+
+def measure_once() -> Dict[str, float]:
+    """One cold start, in a child process with its own empty database."""
+    env = dict(os.environ, DATABASE_URL=f"sqlite+aiosqlite:///{tempfile.mkdtemp()}/startup.db", LOG_LEVEL="WARNING")
+    output = subprocess.run([sys.executable, "-c", _CHILD], env=env, cwd=os.getcwd(), capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def run(runs: int) -> Dict[str, float]:
+    """Median seconds per phase over `runs` cold starts."""
+    samples: List[Dict[str, float]] = [measure_once() for _ in range(runs)]
+    medians = {phase: statistics.median(sample[phase] for sample in samples) for phase in PHASES}
+    print(f"Cold starts: {runs} (median)")
+    for phase in PHASES:
+        print(f"{phase:16} {medians[phase] * 1000:9.1f} ms")
+    return medians
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
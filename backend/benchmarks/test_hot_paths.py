@@ -0,0 +1,73 @@
+"""
+Microbenchmarks for the pure-Python hot paths of the request cycle.
+
+Requires pytest-benchmark (dev dependency). From backend/:
+
+    # Record a baseline on this machine
+    python -m pytest benchmarks --benchmark-save=baseline
+    # Compare against it; fails when a mean regresses by more than 20%
+    python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:20%
+
+Baselines are stored in backend/.benchmarks/ (machine-specific, not committed).
+"""
+import json
+import pytest
+from app.core.math_content import detect_math_content
+from app.modules.quiz.service import bucket_activities, normalize_topic, parse_llm_json, quiz_size, score_percentage, weighted_mastery
+from benchmarks import data
+
+pytest.importorskip("pytest_benchmark")
+
+@pytest.fixture(scope="module")
+def learner_scores():
+    return data.scores(10_000)
+
+@pytest.fixture(scope="module")
+def ocr_text():
+    return data.ocr_text(500_000)
+
+def test_quiz_sizing(benchmark):
+    lengths = range(0, 500_000, 500)
+    result = benchmark(lambda: [quiz_size(length) for length in lengths])
+    assert result[0] == (3, 1)
+
+def test_parse_valid_json(benchmark):
+    content = data.quiz_json()
+    assert benchmark(parse_llm_json, content) == json.loads(content)
+
+def test_parse_markdown_wrapped_json(benchmark):
+    content = f"Voici le quiz :\n```json\n{data.quiz_json()}\n```"
+    assert benchmark(parse_llm_json, content)["topic"] == "Histoire"
+
+def test_parse_truncated_json(benchmark):
+    # Worst case: every stage fails before the auto-close repair
+    content = data.truncated_quiz_json()
+    assert benchmark(parse_llm_json, content)["topic"] == "Histoire"
+
+def test_normalize_topics(benchmark, learner_scores):
+    topics = [score.topic for score in learner_scores]
+    result = benchmark(lambda: {normalize_topic(topic) for topic in topics})
+    assert result == set(data.TOPICS)
+
+def test_mastery_per_topic(benchmark, learner_scores):
+    def mastery():
+        topic_map = {}
+        for score in learner_scores:
+            topic_map.setdefault(normalize_topic(score.topic), []).append(score)
+        results = {}
+        for topic, topic_scores in topic_map.items():
+            topic_scores.sort(key=lambda x: x.created_at)
+            percentages = [score_percentage(score.score, score.total_questions) for score in topic_scores]
+            results[topic] = weighted_mastery(percentages, pending_errors=2)
+        return results
+
+    assert len(benchmark(mastery)) == len(data.TOPICS)
+
+def test_activity_bucketing(benchmark):
+    # bucket_activities sorts in place: give each round a fresh list
+    activities = data.activities(10_000)
+    summary, history = benchmark.pedantic(bucket_activities, setup=lambda: ((list(activities),), {}), rounds=20)
+    assert sum(day["total_minutes"] for day in history) == 30_000
+
+def test_math_detection(benchmark, ocr_text):
+    assert benchmark(detect_math_content, ocr_text).is_math is False
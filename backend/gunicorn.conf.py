@@ -0,0 +1,46 @@
+"""
+Multi-worker deployment: gunicorn -c gunicorn.conf.py app.main:app
+
+Tables and migrations are created once, in the master, before the workers
+fork; workers then skip that startup step. Anything workers must share
+(caches, locks, rate limits) goes through app.core.state: with more than one
+worker, STATE_BACKEND=memory is replaced by sql (set a redis:// URL to use
+Redis instead).
+"""
+import asyncio
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+# LLM calls routinely take 30-60s (up to 120s)
+timeout = int(os.getenv("WORKER_TIMEOUT", 180))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None # Requests are logged (sampled) by the app itself
+
+# Workers import the app themselves, after on_starting
+preload_app = False
+
+def on_starting(server):
+    from app.config import settings
+    if workers > 1 and settings.STATE_BACKEND == "memory":
+        # Per-process caches, locks and rate limits would silently diverge between workers
+        server.log.warning("STATE_BACKEND=memory cannot be shared by %d workers: using sql", workers)
+        settings.STATE_BACKEND = "sql"
+        os.environ["STATE_BACKEND"] = "sql"
+
+    # create_db_and_tables imports every module declaring tables or backfills (SCHEMA_MODULES)
+    from app.core.db import create_db_and_tables, engine
+
+    async def init_db():
+        await create_db_and_tables()
+        # No connection may cross the fork
+        await engine.dispose()
+
+    asyncio.run(init_db())
+    # Workers are forked from here: they inherit the settings object (and the env for re-execs)
+    settings.DB_INIT_ON_STARTUP = False
+    os.environ["DB_INIT_ON_STARTUP"] = "false"
+    server.log.info("Database ready; starting %d workers", workers)
@@ -1,12 +1,53 @@
+import os
+import tempfile
+
 import pytest
 from httpx import AsyncClient
+
+# Point the app at a throwaway SQLite file before it is imported
+_db_dir = tempfile.mkdtemp(prefix="reviflow-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.db")
+
+# ...and at a fixture build rather than whatever the frontend last produced
+_static_dir = os.path.join(_db_dir, "static")
+os.makedirs(os.path.join(_static_dir, "assets"))
+with open(os.path.join(_static_dir, "index.html"), "w") as f:
+    f.write('<!doctype html><html><head><script type="module" src="/assets/index-F1xture0.js"></script></head><body></body></html>')
+with open(os.path.join(_static_dir, "assets", "index-F1xture0.js"), "w") as f:
+    f.write("console.log('reviflow');\n" * 100)
+with open(os.path.join(_static_dir, "vite.svg"), "w") as f:
+    f.write('<svg xmlns="http://www.w3.org/2000/svg"/>')
+os.environ.setdefault("STATIC_DIR", _static_dir)
+
 from app.main import app
+from app.core.db import create_db_and_tables
 
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
 
+@pytest.fixture(scope="session", autouse=True)
+async def setup_db(anyio_backend):
+    await create_db_and_tables()
+
 @pytest.fixture(scope="module")
 async def client():
     async with AsyncClient(app=app, base_url="http://test") as c:
         yield c
+
+@pytest.fixture(scope="module")
+async def auth_headers(client):
+    """Registers (once) and logs in a parent account, returning bearer headers."""
+    credentials = {"email": "parent@example.com", "password": "strongPassword123!"}
+    await client.post("/api/auth/register", json={**credentials, "role": "parent"})
+    response = await client.post(
+        "/api/auth/jwt/login",
+        data={"username": credentials["email"], "password": credentials["password"]}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(autouse=True)
+def clear_shared_state():
+    """Tests count upstream calls: never let one test answer another's prompt from cache."""
+    from app.core.state import shared_state
+    shared_state.clear()
@@ -1,4 +1,9 @@
+import uuid
 import pytest
+from app.core.db import async_session_maker
+from app.core.state import shared_state
+from app.modules.auth import service as auth_service
+from app.modules.auth.models import User
 
 @pytest.mark.anyio
 async def test_health_check(client):
@@ -36,3 +41,90 @@ async def test_login_flow(client, anyio_backend):
     else:
         # 400/401 acceptable if user creation failed or db issue
         assert response.status_code in [400, 401]
+
+@pytest.mark.anyio
+async def test_login_by_username(client, auth_headers):
+    child = {"username": "leo", "password": "1234", "first_name": "Léo"}
+    response = await client.post("/api/auth/profiles", json=child, headers=auth_headers)
+    assert response.status_code == 200
+
+    response = await client.post("/api/auth/jwt/login", data={"username": "leo", "password": "1234"})
+    assert response.status_code == 200
+    assert "access_token" in response.json()
+
+    response = await client.post("/api/auth/jwt/login", data={"username": "leo", "password": "wrong"})
+    assert response.status_code == 400
+
+@pytest.mark.anyio
+async def test_cached_principal_sees_updates(client, auth_headers):
+    # Warm the principal cache, then update the user through the API
+    response = await client.get("/api/auth/users/me", headers=auth_headers)
+    assert response.status_code == 200
+
+    response = await client.patch("/api/auth/users/me", json={"first_name": "Camille"}, headers=auth_headers)
+    assert response.status_code == 200
+
+    response = await client.get("/api/auth/users/me", headers=auth_headers)
+    assert response.json()["first_name"] == "Camille"
+
+@pytest.mark.anyio
+async def test_invalidation_by_another_worker_reaches_this_one(client, auth_headers):
+    me = (await client.get("/api/auth/users/me", headers=auth_headers)).json() # Cached here
+    async with async_session_maker() as session:
+        user = await session.get(User, uuid.UUID(me["id"]))
+        user.first_name = "Dominique"
+        await session.commit()
+    # What invalidate_user_cache leaves in shared_state, without touching this process' cache
+    await shared_state.set(auth_service._principal_version_key(me["id"]), uuid.uuid4().hex, ttl=60)
+
+    response = await client.get("/api/auth/users/me", headers=auth_headers)
+    assert response.json()["first_name"] == "Dominique"
+
+@pytest.mark.anyio
+async def test_learner_me_includes_profile(client, auth_headers):
+    await client.post("/api/auth/profiles", json={"username": "mia", "password": "1234", "first_name": "Mia"}, headers=auth_headers)
+    login = await client.post("/api/auth/jwt/login", data={"username": "mia", "password": "1234"})
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    for _ in range(2): # Second call is served from the principal cache
+        response = await client.get("/api/auth/users/me", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["learner_profile"]["first_name"] == "Mia"
+
+@pytest.mark.anyio
+async def test_bulk_child_provisioning_reports_each_row(client, auth_headers):
+    await client.post("/api/auth/profiles", json={"username": "taken-kid", "password": "1234"}, headers=auth_headers)
+    children = [
+        {"username": "class-a", "password": "1111", "first_name": "Ana"},
+        {"username": "class-b", "password": "2222"},
+        {"username": "taken-kid", "password": "3333"},
+        {"username": "class-a", "password": "4444"},
+        {"username": "class-c", "password": "12"},
+    ]
+    response = await client.post("/api/auth/profiles/bulk", json={"children": children}, headers=auth_headers)
+    assert response.status_code == 200
+    results = response.json()
+    assert [row["success"] for row in results] == [True, True, False, False, False]
+    assert "taken" in results[2]["error"] and "repeated" in results[3]["error"] and "at least" in results[4]["error"]
+
+    # Created accounts can log in and appear among the parent's profiles
+    response = await client.post("/api/auth/jwt/login", data={"username": "class-b", "password": "2222"})
+    assert response.status_code == 200
+    profiles = (await client.get("/api/auth/profiles", headers=auth_headers)).json()
+    by_username = {profile["username"]: profile for profile in profiles}
+    assert by_username["class-a"]["first_name"] == "Ana" and by_username["class-b"]["first_name"] == "class-b"
+    assert by_username["class-a"]["id"] == results[0]["profile_id"]
+
+@pytest.mark.anyio
+async def test_profile_endpoints_return_their_response_models(client, auth_headers):
+    response = await client.post("/api/auth/profiles", json={"username": "noah", "password": "1234", "first_name": "Noah"}, headers=auth_headers)
+    assert response.status_code == 200
+    created = response.json()
+    assert created["success"] and set(created["user"]) == {"id", "username", "profile_id"}
+
+    response = await client.post(f"/api/auth/select-profile/{created['user']['profile_id']}", headers=auth_headers)
+    assert response.json() == {"success": True, "profile": {"id": created["user"]["profile_id"], "first_name": "Noah", "avatar_url": None}}
+
+    schema = (await client.get("/openapi.json")).json()
+    for path, method in [("/api/auth/profiles", "post"), ("/api/quiz/progress/save", "post"), ("/api/quiz/progress/batch", "post"), ("/api/quiz/revision/{revision_id}", "delete")]:
+        assert "$ref" in schema["paths"][path][method]["responses"]["200"]["content"]["application/json"]["schema"]
@@ -0,0 +1,59 @@
+import base64
+import struct
+import zlib
+from app.modules.ingest.batching import (
+    BatchSizeTuner, EXPLORE_EVERY, MIN_SAMPLES, UNKNOWN_IMAGE_TOKENS, image_cost, image_dimensions, plan_batches, vision_tokens
+)
+
+def _png(width: int, height: int, padding: int = 0) -> str:
+    header = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR" + struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return base64.b64encode(header + struct.pack(">I", zlib.crc32(header[12:])) + b"\0" * padding).decode()
+
+def _jpeg(width: int, height: int, exif: int = 0) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\0" + b"\0" * 9
+    app1 = b"\xff\xe1" + struct.pack(">H", 2 + exif) + b"\0" * exif if exif else b""
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app0 + app1 + sof + b"\xff\xd9"
+
+def test_image_costs_come_from_the_headers():
+    assert image_dimensions(_jpeg(3024, 4032)) == (3024, 4032)
+    assert image_dimensions(base64.b64decode(_png(640, 480))) == (640, 480)
+    # 1024x1024 -> 768x768: 2x2 tiles
+    assert vision_tokens(1024, 1024) == 85 + 4 * 170
+    assert image_cost("data:image/png;base64," + _png(256, 256)).tokens == 85 + 170
+    assert image_cost("not an image").tokens == UNKNOWN_IMAGE_TOKENS
+
+def test_image_cost_decodes_only_the_header_prefix():
+    # Large scans: only the first HEADER_PREFIX_CHARS are decoded
+    cost = image_cost(_png(256, 256, padding=5_000_000))
+    assert cost.tokens == 85 + 170 and cost.payload_bytes > 6_000_000
+    assert image_cost(base64.b64encode(_jpeg(256, 256, exif=40_000) + b"\0" * 1_000_000).decode()).tokens == 85 + 170
+    # Start-of-frame past the prefix (e.g. a huge EXIF segment): unknown size
+    assert image_cost(base64.b64encode(_jpeg(256, 256, exif=60_000)).decode()).tokens == UNKNOWN_IMAGE_TOKENS
+
+def test_batches_are_packed_under_every_ceiling():
+    small, large = _png(256, 256), _png(256, 256, padding=6000)
+    assert plan_batches([small] * 12, max_images=5, max_bytes=10**9, max_tokens=10**9) == [5, 5, 2]
+    # Bytes: two large images never share a call; a lone oversized one still gets its own
+    assert plan_batches([small, large, large, small, small], max_images=10, max_bytes=10000, max_tokens=10**9) == [2, 3]
+    assert plan_batches([small, large, small], max_images=10, max_bytes=5000, max_tokens=10**9) == [1, 1, 1]
+    assert plan_batches([_png(4000, 3000)] * 3, max_images=10, max_bytes=10**9, max_tokens=1000) == [1, 1, 1] # 765 tokens each
+    assert plan_batches([small] * 3, max_images=10, max_bytes=10**9, max_tokens=2 * (85 + 170)) == [2, 1]
+
+def test_tuner_learns_the_fastest_size_per_image():
+    tuner = BatchSizeTuner(max_images=8)
+    assert tuner.target() == 5
+    for _ in range(MIN_SAMPLES):
+        tuner.record(5, 10.0) # 2 s per image
+
+    # Now and then, one size up is tried...
+    targets = [tuner.target() for _ in range(EXPLORE_EVERY)]
+    assert targets.count(6) == 1 and targets.count(5) == EXPLORE_EVERY - 1
+    # ...and kept when it is faster per image
+    for _ in range(MIN_SAMPLES):
+        tuner.record(6, 9.0)
+    assert tuner.best_size() == 6
+
+    # Failures count as timeouts: the size is backed away from
+    tuner.record_failure(6)
+    assert tuner.best_size() == 5
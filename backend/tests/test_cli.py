@@ -0,0 +1,32 @@
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import select
+from app.cli import reschedule
+from app.core.db import async_session_maker
+from app.modules.quiz.models import RemediationQueue
+
+def _error(learner_id, status="PENDING", seen=None) -> RemediationQueue:
+    seen = seen or datetime.utcnow() - timedelta(days=30)
+    return RemediationQueue(
+        learner_id=learner_id, original_content="", question=f"q-{uuid.uuid4()}", wrong_answer="a", correct_answer="b",
+        topic="t", status=status, last_seen_at=seen, due_at=None if status != "PENDING" else seen
+    )
+
+@pytest.mark.anyio
+async def test_reschedule_spreads_backlog_and_revives_reviewed():
+    learner_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        session.add_all([_error(learner_id) for _ in range(5)] + [_error(learner_id, "REVIEWED", datetime.utcnow())])
+        await session.commit()
+
+    assert await reschedule(daily_limit=2) >= 6
+
+    async with async_session_maker() as session:
+        items = (await session.execute(select(RemediationQueue).where(RemediationQueue.learner_id == learner_id))).scalars().all()
+    assert all(item.status == "PENDING" for item in items)
+    today = datetime.utcnow().date()
+    due_days = sorted((item.due_at.date() - today).days for item in items if item.repetitions == 0)
+    assert due_days == [0, 0, 1, 1, 2]
+    revived = [item for item in items if item.repetitions == 1]
+    assert len(revived) == 1 and revived[0].due_at > datetime.utcnow()
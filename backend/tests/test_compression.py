@@ -0,0 +1,52 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from httpx import AsyncClient
+from app.core.compression import CompressionMiddleware
+
+PAYLOAD = {"revisions": [{"topic": "Histoire", "text_content": "La Révolution française. " * 20}] * 20}
+
+def _app() -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+    app.add_middleware(CompressionMiddleware, min_size=1024)
+
+    @app.get("/large")
+    async def large():
+        return PAYLOAD
+
+    @app.get("/small")
+    async def small():
+        return {"status": "ok"}
+
+    @app.get("/events")
+    async def events():
+        async def stream():
+            for step in range(3):
+                yield f"data: {json.dumps({'step': step, 'padding': 'x' * 1024})}\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+@pytest.mark.anyio
+async def test_large_json_is_compressed_for_clients_that_accept_it():
+    async with AsyncClient(app=_app(), base_url="http://test") as client:
+        response = await client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert int(response.headers["content-length"]) < len(json.dumps(PAYLOAD)) // 10
+        assert response.json() == PAYLOAD # httpx decodes it
+
+        plain = await client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in plain.headers and plain.json() == PAYLOAD
+
+        small = await client.get("/small", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in small.headers
+
+@pytest.mark.anyio
+async def test_event_streams_are_never_compressed():
+    async with AsyncClient(app=_app(), base_url="http://test") as client:
+        async with client.stream("GET", "/events", headers={"Accept-Encoding": "gzip"}) as response:
+            assert "content-encoding" not in response.headers
+            body = b"".join([chunk async for chunk in response.aiter_raw()])
+    assert body.count(b"data: ") == 3
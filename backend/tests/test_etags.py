@@ -0,0 +1,61 @@
+import uuid
+from types import SimpleNamespace
+import pytest
+from app.cli import rebuild_learner_stats
+from app.core.db import async_session_maker
+from app.core.etags import get_version, learner_scope
+from app.modules.quiz.models import Revision
+
+async def _get(client, path, headers, etag=None, **params):
+    if etag:
+        headers = {**headers, "If-None-Match": etag}
+    return await client.get(path, params=params, headers=headers)
+
+@pytest.mark.anyio
+async def test_unchanged_reads_are_not_modified_until_a_write(client, auth_headers):
+    child = await client.post("/api/auth/profiles", json={"username": f"etag-{uuid.uuid4().hex[:8]}", "password": "1234", "first_name": "Inès"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+    async with async_session_maker() as session:
+        revision = Revision(learner_id=uuid.UUID(learner_id), topic="Sciences", text_content="La photosynthèse.")
+        session.add(revision)
+        await session.commit()
+        revision_id = str(revision.id)
+
+    paths = ["/api/quiz/revisions", "/api/quiz/history", "/api/quiz/stats/activity", f"/api/quiz/review/{revision_id}"]
+    etags = {}
+    for path in paths:
+        response = await _get(client, path, auth_headers, learner_id=learner_id)
+        assert response.status_code == 200
+        etags[path] = response.headers["ETag"]
+        assert etags[path].startswith('W/"') and "no-cache" in response.headers["Cache-Control"]
+
+        not_modified = await _get(client, path, auth_headers, etags[path], learner_id=learner_id)
+        assert not_modified.status_code == 304 and not_modified.content == b""
+
+    # Another learner (another URL) never matches
+    assert (await _get(client, "/api/quiz/revisions", auth_headers, etags["/api/quiz/revisions"], learner_id=str(uuid.uuid4()))).status_code == 200
+
+    # A write for the learner invalidates every view of that learner
+    await client.post("/api/quiz/progress/save", json={"revision_id": revision_id, "current_index": 1, "answers": [0], "score": 1}, headers=auth_headers)
+    for path in paths:
+        response = await _get(client, path, auth_headers, etags[path], learner_id=learner_id)
+        assert response.status_code == 200 and response.headers["ETag"] != etags[path]
+
+    # Profiles follow the account: creating a child changes the list
+    profiles = await _get(client, "/api/auth/profiles", auth_headers)
+    assert (await _get(client, "/api/auth/profiles", auth_headers, profiles.headers["ETag"])).status_code == 304
+    await client.post("/api/auth/profiles", json={"username": f"etag-{uuid.uuid4().hex[:8]}", "password": "1234", "first_name": "Noé"}, headers=auth_headers)
+    refreshed = await _get(client, "/api/auth/profiles", auth_headers, profiles.headers["ETag"])
+    assert refreshed.status_code == 200 and len(refreshed.json()) == len(profiles.json()) + 1
+
+def test_main_profiles_are_scoped_per_account():
+    parent, other = SimpleNamespace(id=uuid.uuid4(), parent_id=None), SimpleNamespace(id=uuid.uuid4(), parent_id=None)
+    child = SimpleNamespace(id=uuid.uuid4(), parent_id=parent.id)
+    assert learner_scope(None, parent) == learner_scope(None, child) != learner_scope(None, other)
+
+@pytest.mark.anyio
+async def test_maintenance_commands_invalidate_learner_etags():
+    learner_id = uuid.uuid4()
+    before = await get_version(learner_scope(learner_id))
+    assert await rebuild_learner_stats([learner_id]) == 1
+    assert await get_version(learner_scope(learner_id)) != before
@@ -0,0 +1,70 @@
+import uuid
+import pytest
+from sqlmodel import select
+from app.cli import purge_uploads
+from app.config import settings
+from app.core.db import async_session_maker
+from app.core.state import shared_state
+from app.modules.ingest import batching, service as ingest_service
+from app.modules.ingest.models import IngestPage
+from app.modules.llm.ledger import usage_ledger
+
+@pytest.mark.anyio
+async def test_failed_pages_are_retried_alone(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    analyzed, failing = [], {"page-7"}
+
+    async def fake_analyze_batch(batch_images, api_key, user_id=None):
+        analyzed.append(list(batch_images))
+        if failing & set(batch_images):
+            raise RuntimeError("Upstream timeout")
+        text = " ".join(batch_images)
+        return {"title": "Cours", "subject": "Sciences", "raw_text": text, "synthesis": f"- {text}"}, {"total_tokens": 10}
+
+    monkeypatch.setattr(ingest_service, "_analyze_batch", fake_analyze_batch)
+    monkeypatch.setattr(batching, "batch_tuner", batching.BatchSizeTuner(max_images=10)) # Starts at 5 images per call
+    images = [f"page-{number}" for number in range(1, 12)] # Batches: 1-5, 6-10, 11
+
+    response = await client.post("/api/ingest/analyze", json={"images_base64": images}, headers=auth_headers)
+    assert response.status_code == 502
+    detail = response.json()["detail"]
+    assert detail["failed_pages"] == [6, 7, 8, 9, 10]
+    assert len(analyzed) == 3 # One failing batch does not stop the others
+
+    async with async_session_maker() as session:
+        rows = (await session.execute(select(IngestPage).where(IngestPage.upload_id == detail["upload_id"]).order_by(IngestPage.batch_index))).scalars().all()
+    assert [(row.first_page, row.status) for row in rows] == [(1, "DONE"), (6, "FAILED"), (11, "DONE")]
+
+    # Resuming only pays for the failed batch, then merges every page in order
+    failing.clear()
+    analyzed.clear()
+    response = await client.post("/api/ingest/analyze", json={"images_base64": images, "upload_id": detail["upload_id"]}, headers=auth_headers)
+    assert response.status_code == 200
+    assert analyzed == [images[5:10]]
+    result = response.json()
+    assert result["upload_id"] == detail["upload_id"] and result["usage"]["total_tokens"] == 10
+    assert result["raw_text"].index("page-1") < result["raw_text"].index("page-6") < result["raw_text"].index("page-11")
+    assert "--- Partie 3 ---" in result["raw_text"]
+    assert await purge_uploads(days=0) >= 3
+    await usage_ledger.flush() # Leave no pending usage to other tests
+
+@pytest.mark.anyio
+async def test_an_upload_is_analyzed_by_one_request_at_a_time(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    analyzed = []
+
+    async def fake_analyze_batch(batch_images, api_key, user_id=None):
+        analyzed.append(list(batch_images))
+        return {"title": "Cours", "subject": "Sciences", "raw_text": "texte", "synthesis": "- texte"}, {}
+
+    monkeypatch.setattr(ingest_service, "_analyze_batch", fake_analyze_batch)
+    upload_id = str(uuid.uuid4())
+    request = {"images_base64": ["page-1"], "upload_id": upload_id}
+
+    # Another request (worker) holds the upload: this one is turned away before paying
+    async with shared_state.lock(f"upload:{upload_id}"):
+        response = await client.post("/api/ingest/analyze", json=request, headers=auth_headers)
+    assert response.status_code == 409 and analyzed == []
+
+    assert (await client.post("/api/ingest/analyze", json=request, headers=auth_headers)).status_code == 200
+    assert analyzed == [["page-1"]]
@@ -0,0 +1,131 @@
+import uuid
+import httpx
+import pytest
+from sqlmodel import select
+from app.core.db import async_session_maker
+from app.modules.llm import service as llm_service
+from app.modules.auth.models import User
+from app.modules.llm.ledger import usage_ledger
+from app.modules.llm.models import LLMCall
+from app.modules.quiz.service import generate_quiz
+
+def _completion(usage: dict, content: str = '{"ok": true}', finish_reason: str = "stop") -> dict:
+    return {"choices": [{"message": {"content": content}, "finish_reason": finish_reason}], "usage": usage}
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Routes the shared OpenRouter client to a scripted list of responses."""
+    responses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return responses.pop(0)
+
+    monkeypatch.setattr(llm_service, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(llm_service, "RETRY_BACKOFF_SECONDS", 0)
+    return responses
+
+@pytest.mark.anyio
+async def test_chat_completion_records_telemetry(upstream):
+    upstream.append(httpx.Response(503, text="busy"))
+    upstream.append(httpx.Response(200, json=_completion({"prompt_tokens": 1000, "completion_tokens": 200, "total_tokens": 1200})))
+
+    payload = {"model": "google/gemini-2.5-flash", "messages": []}
+    result = await llm_service.chat_completion(payload, "key", feature="quiz-test")
+
+    # Priced per model: 1000 * 0.30/1M + 200 * 2.50/1M
+    assert result["usage"]["cost_usd"] == pytest.approx(0.0008)
+
+    async with async_session_maker() as session:
+        call = (await session.execute(select(LLMCall).where(LLMCall.feature == "quiz-test"))).scalar_one()
+    assert call.success and call.retries == 1 and call.status_code == 200
+    assert call.prompt_tokens == 1000 and call.completion_tokens == 200
+    assert call.ttfb_ms is not None and call.wall_ms >= call.ttfb_ms
+
+    summary = [row for row in llm_service.llm_stats.summary() if row["feature"] == "quiz-test"]
+    assert summary[0]["calls"] == 1 and summary[0]["retries"] == 1
+
+@pytest.mark.anyio
+async def test_ttfb_excludes_earlier_attempts(upstream, monkeypatch):
+    monkeypatch.setattr(llm_service, "RETRY_BACKOFF_SECONDS", 0.2)
+    upstream.append(httpx.Response(503, text="busy"))
+    upstream.append(httpx.Response(200, json=_completion({"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})))
+    await llm_service.chat_completion({"messages": []}, "key", feature="ttfb-test")
+
+    async with async_session_maker() as session:
+        call = (await session.execute(select(LLMCall).where(LLMCall.feature == "ttfb-test"))).scalar_one()
+    # The backoff sleep counts in the wall time only
+    assert call.wall_ms >= 200 and call.ttfb_ms < 200
+
+@pytest.mark.anyio
+async def test_reported_cost_wins_and_failures_are_recorded(upstream):
+    upstream.append(httpx.Response(200, json=_completion({"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "cost": 0.0123})))
+    result = await llm_service.chat_completion({"messages": []}, "key", feature="reset-test")
+    assert result["usage"]["cost_usd"] == 0.0123
+
+    upstream.append(httpx.Response(401, text="bad key"))
+    with pytest.raises(Exception, match="OpenRouter API error \\(401\\)"):
+        await llm_service.chat_completion({"messages": []}, "key", feature="reset-test")
+
+    async with async_session_maker() as session:
+        calls = (await session.execute(select(LLMCall).where(LLMCall.feature == "reset-test"))).scalars().all()
+    assert sorted(call.success for call in calls) == [False, True]
+
+@pytest.mark.anyio
+async def test_identical_payloads_are_answered_from_cache(upstream):
+    upstream.append(httpx.Response(200, json=_completion({"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "cost": 0.01})))
+    payload = {"model": "google/gemini-2.5-flash", "messages": [{"role": "user", "content": "same lesson"}]}
+
+    first = await llm_service.chat_completion(payload, "key", feature="cache-test", cache=True)
+    await llm_service.cache_response(payload, first)
+    second = await llm_service.chat_completion(payload, "key", feature="cache-test", cache=True)
+
+    # Only one scripted response: the second call never reached upstream
+    assert second["choices"] == first["choices"]
+    assert first["usage"]["cost_usd"] == 0.01
+    assert second["usage"]["cost_usd"] == 0.0 and second["usage"]["cache_hit"]
+
+    async with async_session_maker() as session:
+        calls = (await session.execute(select(LLMCall).where(LLMCall.feature == "cache-test"))).scalars().all()
+    assert sorted(call.cache_hit for call in calls) == [False, True]
+
+@pytest.mark.anyio
+async def test_only_parsed_quizzes_are_cached(upstream):
+    usage = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    quiz = '{"topic": "Histoire", "questions": []}'
+    upstream.append(httpx.Response(200, json=_completion(usage, content='{"topic": "Histoire", "questions": [')))
+    upstream.append(httpx.Response(200, json=_completion(usage, content=quiz, finish_reason="length")))
+    upstream.append(httpx.Response(200, json=_completion(usage, content=quiz)))
+    lesson = f"Lesson {uuid.uuid4()}"
+
+    with pytest.raises(Exception, match="Failed to parse"):
+        await generate_quiz(lesson, "key")
+    # The bad answer was not cached: the retry reaches upstream, as does a cut-off answer
+    assert (await generate_quiz(lesson, "key"))["quiz"]["topic"] == "Histoire"
+    assert not (await generate_quiz(lesson, "key"))["usage"].get("cache_hit")
+    # The complete answer is cached
+    assert (await generate_quiz(lesson, "key"))["usage"]["cache_hit"]
+    assert upstream == []
+
+@pytest.mark.anyio
+async def test_usage_ledger_batches_increments(client, auth_headers):
+    me = (await client.get("/api/auth/users/me", headers=auth_headers)).json()
+    user = await get_user(me["id"])
+    base_tokens = user.total_tokens_used
+
+    llm_service.account_usage(user, {"total_tokens": 100, "cost_usd": 0.5})
+    llm_service.account_usage(user, {"total_tokens": 20, "cost_usd": 0.25})
+
+    # Pending deltas are visible before they reach the database
+    me = (await client.get("/api/auth/users/me", headers=auth_headers)).json()
+    assert me["total_tokens_used"] == base_tokens + 120
+    assert (await get_user(user.id)).total_tokens_used == base_tokens
+
+    assert await usage_ledger.flush() == 1
+    stored = await get_user(user.id)
+    assert stored.total_tokens_used == base_tokens + 120
+    assert stored.total_cost_usd == pytest.approx(user.total_cost_usd + 0.75)
+    assert usage_ledger.pending(user.id) == (0, 0.0)
+
+async def get_user(user_id) -> User:
+    async with async_session_maker() as session:
+        return await session.get(User, uuid.UUID(str(user_id)))
@@ -0,0 +1,19 @@
+import pytest
+from app.config import settings
+from app.modules.llm import service as llm_service
+from benchmarks import loadtest
+from benchmarks.mock_openrouter import MockConfig
+
+@pytest.mark.anyio
+async def test_loadtest_runs_full_flow_against_mock(monkeypatch):
+    # run() installs the mock client and a key; restore both afterwards
+    monkeypatch.setattr(llm_service, "_client", None)
+    monkeypatch.setattr(llm_service, "RETRY_BACKOFF_SECONDS", llm_service.RETRY_BACKOFF_SECONDS)
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", settings.OPENROUTER_API_KEY)
+
+    rows = await loadtest.run(users=2, concurrency=2, config=MockConfig(seed=0), retry_backoff=0)
+
+    report = {row["endpoint"]: row for row in rows}
+    for endpoint in ("POST /ingest/analyze", "POST /quiz/generate", "POST /quiz/score", "POST /quiz/remediation/generate", "GET /quiz/stats/activity"):
+        assert report[endpoint]["count"] == 2 and report[endpoint]["errors"] == 0
+    assert report["POST /quiz/generate"]["p50_ms"] <= report["POST /quiz/generate"]["p99_ms"]
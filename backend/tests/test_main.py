@@ -0,0 +1,13 @@
+import pytest
+from app.main import app
+from app.modules.llm import service as llm_service
+from app.modules.llm.ledger import usage_ledger
+
+@pytest.mark.anyio
+async def test_lifespan_sets_up_and_releases_process_resources():
+    async with app.router.lifespan_context(app):
+        # Warmed up before the first request
+        assert llm_service._client is not None and not llm_service._client.is_closed
+        assert usage_ledger._task is not None and not usage_ledger._task.done()
+    assert llm_service._client is None
+    assert usage_ledger._task is None
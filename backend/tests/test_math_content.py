@@ -0,0 +1,32 @@
+from app.core.math_content import detect_math_content
+
+def test_keywords_match_across_case_and_accents():
+    for text in ("Résoudre l'ÉQUATION", "resoudre l'equation", "Les Mathématiques", "MATHEMATIQUES"):
+        assert detect_math_content(text).is_math, text
+    assert detect_math_content("Calculer puis calculate").keyword_hits == 2
+
+def test_symbols_and_operator_density_raise_confidence():
+    assert detect_math_content("∫ f(x) dx").is_math
+    dense = detect_math_content("x + 3 = 7 ; 2 × 4 = 8 ; 10 ÷ 2 = 5 ; 3^2 = 9")
+    assert dense.is_math and dense.keyword_hits == 0
+
+    one_keyword = detect_math_content("Une équation simple.")
+    more = detect_math_content("Une équation : 2x + 3 = 7, puis une formule √2.")
+    assert more.confidence > one_keyword.confidence
+
+def test_prose_with_numbers_is_not_math():
+    detection = detect_math_content("La Révolution française commence en 1789 avec la prise de la Bastille. " * 50)
+    assert detection.confidence == 0 and not detection.is_math
+
+def test_markdown_prose_is_not_math():
+    lesson = (
+        "La Révolution française\n=======================\n\n"
+        "> « La liberté consiste à pouvoir faire tout ce qui ne nuit pas à autrui. »\n\n"
+        "* **14 juillet 1789** : prise de la *Bastille*\n"
+        "* **26 août 1789** : Déclaration des droits de l'homme\n"
+        "+ Les **États généraux** se réunissent à Versailles.\n"
+    ) * 5
+    detection = detect_math_content(lesson)
+    assert detection.density <= 0.02 and not detection.is_math
+    # Operators between numbers still count
+    assert detect_math_content("3 * 4 > 10 ; 2*5 < 11 ; 1 + 1 = 2 ; 6 * 7 = 42 ; 9 > 8").is_math
@@ -0,0 +1,32 @@
+import pytest
+from app.config import settings
+
+@pytest.mark.anyio
+async def test_metrics_exposes_route_histograms(client):
+    await client.get("/api/health")
+    response = await client.get("/api/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+
+    body = response.text
+    assert 'http_requests_total{method="GET",route="/api/health",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/health",le="+Inf"}' in body
+    # The scrape itself is still in flight while rendering
+    assert 'http_requests_in_flight{method="GET",route="/api/metrics"} 1' in body
+
+@pytest.mark.anyio
+async def test_metrics_use_route_templates(client, auth_headers):
+    await client.get("/api/quiz/review/00000000-0000-0000-0000-000000000000", headers=auth_headers)
+    body = (await client.get("/api/metrics")).text
+    assert 'route="/api/quiz/review/{revision_id}",status="404"' in body
+
+@pytest.mark.anyio
+async def test_llm_counters_need_the_metrics_token(client, monkeypatch):
+    assert "llm_calls_total" not in (await client.get("/api/metrics")).text
+    assert (await client.get("/api/llm/metrics")).status_code == 404 # No token configured
+
+    monkeypatch.setattr(settings, "LLM_METRICS_TOKEN", "scrape-secret")
+    assert (await client.get("/api/llm/metrics")).status_code == 401
+    assert (await client.get("/api/llm/metrics", headers={"Authorization": "Bearer wrong"})).status_code == 401
+    response = await client.get("/api/llm/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200 and "# TYPE llm_calls_total counter" in response.text
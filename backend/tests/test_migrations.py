@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+from sqlalchemy import create_engine, inspect, text
+from app.core.migrations import upgrade_schema
+import app.main # noqa: F401 (registers every model and backfill)
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+def test_upgrade_adds_missing_columns_and_backfills():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        # remediation_queue as it was before deduplication
+        connection.execute(text(
+            "CREATE TABLE remediation_queue (id CHAR(32) PRIMARY KEY, learner_id CHAR(32) NOT NULL, original_content VARCHAR NOT NULL,"
+            " question VARCHAR NOT NULL, wrong_answer VARCHAR NOT NULL, correct_answer VARCHAR NOT NULL, topic VARCHAR NOT NULL,"
+            " created_at DATETIME NOT NULL, status VARCHAR NOT NULL, revision_id CHAR(32))"
+        ))
+        connection.execute(text(
+            "INSERT INTO remediation_queue VALUES ('a1', 'l1', 'ctx', 'Quelle année ?', '1792', '1789', 'Histoire', '2026-01-01 10:00:00', 'PENDING', NULL)"
+        ))
+
+        upgrade_schema(connection)
+        upgrade_schema(connection) # Idempotent
+
+        columns = {column["name"] for column in inspect(connection).get_columns("remediation_queue")}
+        assert {"question_hash", "occurrences", "last_seen_at"} <= columns
+        indexes = {index["name"] for index in inspect(connection).get_indexes("remediation_queue")}
+        assert "ix_remediation_queue_dedup" in indexes
+
+        row = connection.execute(text("SELECT question_hash, occurrences, last_seen_at FROM remediation_queue")).one()
+        assert row.question_hash and row.occurrences == 1 and row.last_seen_at is not None
+
+        row = connection.execute(text("SELECT topic_key, is_remediation FROM remediation_queue")).one()
+        assert row.topic_key == "Histoire" and not row.is_remediation
+
+GUNICORN_START = """
+import importlib.util, logging
+spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(conf)
+conf.on_starting(type("Server", (), {"log": logging.getLogger("gunicorn")})())
+"""
+
+def test_gunicorn_master_migrates_and_backfills(tmp_path):
+    path = tmp_path / "old.db"
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        # remediation_queue as it was before deduplication and scheduling
+        connection.execute(text(
+            "CREATE TABLE remediation_queue (id CHAR(32) PRIMARY KEY, learner_id CHAR(32) NOT NULL, original_content VARCHAR NOT NULL,"
+            " question VARCHAR NOT NULL, wrong_answer VARCHAR NOT NULL, correct_answer VARCHAR NOT NULL, topic VARCHAR NOT NULL,"
+            " created_at DATETIME NOT NULL, status VARCHAR NOT NULL, revision_id CHAR(32))"
+        ))
+        connection.execute(text(
+            "INSERT INTO remediation_queue VALUES ('a1', 'l1', 'ctx', 'Quelle année ?', '1792', '1789', 'Maths (Correction)', '2026-01-01 10:00:00', 'PENDING', NULL)"
+        ))
+    engine.dispose()
+
+    # A fresh interpreter, like the gunicorn master: nothing imported beforehand
+    env = {**os.environ, "DATABASE_URL": f"sqlite+aiosqlite:///{path}", "WEB_CONCURRENCY": "2", "STATE_BACKEND": "memory"}
+    subprocess.run([sys.executable, "-c", GUNICORN_START], cwd=BACKEND_DIR, env=env, check=True)
+
+    with engine.begin() as connection:
+        row = connection.execute(text("SELECT question_hash, due_at, topic_key, is_remediation FROM remediation_queue")).one()
+        tables = set(inspect(connection).get_table_names())
+    assert row.question_hash and row.due_at is not None
+    assert row.topic_key == "Maths" and row.is_remediation
+    assert {"shared_state", "question_bank", "learner_stats", "ingest_pages"} <= tables
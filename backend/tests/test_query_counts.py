@@ -0,0 +1,47 @@
+"""Guards against relationship cascades creeping back into hot endpoints."""
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from app.core.db import engine
+from app.modules.auth.service import principal_cache
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+@pytest.fixture(scope="module")
+async def family_headers(client, auth_headers):
+    for name in ("ana", "ben", "cleo"):
+        await client.post("/api/auth/profiles", json={"username": f"qc_{name}", "password": "1234", "first_name": name}, headers=auth_headers)
+    return auth_headers
+
+@pytest.mark.anyio
+# Budgets: warm = the view's own queries, cold = the same plus one principal SELECT
+@pytest.mark.parametrize("path, cold_budget, warm_budget", [
+    ("/api/auth/users/me", 4, 3),        # user + profile + badges
+    ("/api/auth/profiles", 4, 3),        # user + children + their profiles
+    ("/api/auth/children", 5, 4),        # user + children + profiles + badges
+    ("/api/quiz/history", 2, 1),         # scores only
+])
+async def test_statement_budget(client, family_headers, path, cold_budget, warm_budget):
+    # Cold: the principal has to be loaded (a single SELECT, no cascades)
+    principal_cache.clear()
+    with count_queries() as statements:
+        response = await client.get(path, headers=family_headers)
+    assert response.status_code == 200
+    assert len(statements) <= cold_budget, statements
+
+    # Warm: the principal comes from the cache
+    with count_queries() as statements:
+        response = await client.get(path, headers=family_headers)
+    assert response.status_code == 200
+    assert len(statements) <= warm_budget, statements
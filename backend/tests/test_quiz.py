@@ -0,0 +1,261 @@
+import json
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import select
+from app.config import settings
+from app.core.db import async_session_maker
+from app.modules.llm import service as llm_service
+from app.modules.quiz import router as quiz_router
+from app.modules.quiz.bank import bank_questions
+from app.modules.quiz.models import BankQuestion, RemediationQueue, Revision
+from app.modules.quiz.service import MASTERY_REPETITIONS, QUALITY_CORRECT, QUALITY_FAILED, parse_llm_json, schedule_review
+from benchmarks.mock_openrouter import MockConfig, MockOpenRouter
+
+async def _create_revision() -> str:
+    async with async_session_maker() as session:
+        revision = Revision(learner_id=None, topic="Histoire", text_content="La Révolution française.")
+        session.add(revision)
+        await session.commit()
+        return str(revision.id)
+
+@pytest.mark.anyio
+async def test_progress_batch_last_writer_wins(client, auth_headers):
+    rev_a = await _create_revision()
+    rev_b = await _create_revision()
+
+    payload = {"updates": [
+        {"revision_id": rev_a, "current_index": 2, "answers": [0, 1], "score": 1, "client_timestamp": "2026-01-01T10:00:05Z"},
+        {"revision_id": rev_a, "current_index": 1, "answers": [0], "score": 1, "client_timestamp": "2026-01-01T10:00:01Z"},
+        {"revision_id": rev_b, "current_index": 4, "answers": [0, 1, 2, 3], "score": 3, "client_timestamp": "2026-01-01T10:00:03Z"},
+    ]}
+    response = await client.post("/api/quiz/progress/batch", json=payload, headers=auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert sorted(body["applied"]) == sorted([rev_a, rev_b])
+    assert response.headers["ETag"].startswith('W/"')
+
+    async with async_session_maker() as session:
+        state = json.loads((await session.get(Revision, rev_a)).progress_state)
+    assert state["current_index"] == 2
+
+    # A stale flush (older than what is stored) is ignored
+    stale = {"updates": [
+        {"revision_id": rev_a, "current_index": 0, "answers": [], "score": 0, "client_timestamp": "2026-01-01T09:59:00Z"},
+    ]}
+    response = await client.post("/api/quiz/progress/batch", json=stale, headers=auth_headers)
+    assert response.json()["skipped"] == [rev_a]
+    assert response.json()["versions"][rev_a] == "2026-01-01T10:00:05"
+
+@pytest.mark.anyio
+async def test_progress_clocks_are_only_compared_between_clients(client, auth_headers):
+    revision_id = await _create_revision()
+
+    async def save(current_index: int, client_timestamp=None) -> dict:
+        body = {"revision_id": revision_id, "current_index": current_index, "answers": [], "score": 0}
+        if client_timestamp:
+            body["client_timestamp"] = client_timestamp
+        return (await client.post("/api/quiz/progress/save", json=body, headers=auth_headers)).json()
+
+    # A client clock far behind the server still overwrites a server-stamped save
+    assert (await save(1))["applied"]
+    assert (await save(2, "2020-01-01T00:00:00Z"))["applied"]
+    # Between client clocks, a stale save is reported as skipped
+    assert not (await save(3, "2019-12-31T23:00:00Z"))["applied"]
+    # A save without a timestamp always applies
+    assert (await save(4))["applied"]
+
+    async with async_session_maker() as session:
+        state = json.loads((await session.get(Revision, uuid.UUID(revision_id))).progress_state)
+    assert state["current_index"] == 4 and not state["client_clock"]
+
+@pytest.mark.anyio
+async def test_repeated_errors_are_deduplicated(client, auth_headers):
+    child = await client.post("/api/auth/profiles", json={"username": "noe", "password": "1234", "first_name": "Noé"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+    revision_id = await _create_revision()
+
+    def attempt(question: str) -> dict:
+        wrong = {"question": question, "user_answer": "1792", "correct_answer": "1789", "is_correct": False}
+        right = {"question": "Qui était roi en 1789 ?", "user_answer": "Louis XVI", "correct_answer": "Louis XVI", "is_correct": True}
+        return {"topic": "Histoire", "score": 1, "total_questions": 2, "learner_id": learner_id, "revision_id": revision_id, "details": [wrong, right]}
+
+    # The same question, differently cased / accented / punctuated
+    for question in ("En quelle année commence la Révolution ?", "en quelle annee commence la revolution", "EN QUELLE ANNÉE commence la Révolution?!"):
+        response = await client.post("/api/quiz/score", json=attempt(question), headers=auth_headers)
+        assert response.status_code == 200
+
+    response = await client.get("/api/quiz/remediation/count", params={"learner_id": learner_id}, headers=auth_headers)
+    assert response.json() == {"count": 1}
+
+    async with async_session_maker() as session:
+        item = (await session.execute(select(RemediationQueue).where(RemediationQueue.learner_id == uuid.UUID(learner_id)))).scalar_one()
+    assert item.occurrences == 3 and item.question_hash is not None
+
+def test_sm2_schedule_reaches_mastered():
+    item = RemediationQueue(learner_id=uuid.uuid4(), original_content="", question="q", wrong_answer="a", correct_answer="b", topic="t")
+    now = datetime(2026, 1, 1)
+
+    schedule_review(item, QUALITY_FAILED, now)
+    assert item.repetitions == 0 and item.due_at == now + timedelta(days=1) and item.ease < 2.5
+
+    intervals = []
+    for _ in range(MASTERY_REPETITIONS):
+        schedule_review(item, QUALITY_CORRECT, now)
+        intervals.append(item.interval_days)
+    assert intervals[:2] == [1.0, 6.0] and intervals[2] > 6.0
+    assert item.status == "MASTERED" and item.due_at is None
+
+@pytest.mark.anyio
+async def test_remediation_quiz_grades_each_error(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(llm_service, "_client", None) # Restored after the mock is installed
+    MockOpenRouter(MockConfig()).install()
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    child = await client.post("/api/auth/profiles", json={"username": "lou", "password": "1234", "first_name": "Lou"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+    revision_id = await _create_revision()
+
+    details = [
+        {"question": f"Question {index} ?", "user_answer": "faux", "correct_answer": "vrai", "is_correct": False}
+        for index in range(2)
+    ]
+    await client.post("/api/quiz/score", json={
+        "topic": "Histoire", "score": 0, "total_questions": 2, "learner_id": learner_id, "revision_id": revision_id, "details": details
+    }, headers=auth_headers)
+    assert (await client.get("/api/quiz/remediation/count", params={"learner_id": learner_id}, headers=auth_headers)).json() == {"count": 2}
+
+    quiz = (await client.post("/api/quiz/remediation/generate", json={"learner_id": learner_id}, headers=auth_headers)).json()
+    first, second = quiz["questions"]
+    assert first["remediation_id"] and second["remediation_id"]
+
+    answers = [
+        {"question": first["question"], "user_answer": "x", "correct_answer": "x", "is_correct": True, "remediation_id": first["remediation_id"]},
+        {"question": second["question"], "user_answer": "x", "correct_answer": "y", "is_correct": False, "remediation_id": second["remediation_id"]},
+    ]
+    await client.post("/api/quiz/score", json={
+        "topic": quiz["topic"], "score": 1, "total_questions": 2, "learner_id": learner_id, "details": answers
+    }, headers=auth_headers)
+
+    async with async_session_maker() as session:
+        items = {str(item.id): item for item in (await session.execute(select(RemediationQueue).where(RemediationQueue.learner_id == uuid.UUID(learner_id)))).scalars()}
+    assert len(items) == 2 # The failed remediation question did not add an error
+    assert items[first["remediation_id"]].repetitions == 1
+    assert items[second["remediation_id"]].repetitions == 0
+    assert all(item.due_at > datetime.utcnow() for item in items.values())
+    assert (await client.get("/api/quiz/remediation/count", params={"learner_id": learner_id}, headers=auth_headers)).json() == {"count": 0}
+
+@pytest.mark.anyio
+async def test_remediation_questions_are_linked_by_echoed_error(client, auth_headers, monkeypatch):
+    child = await client.post("/api/auth/profiles", json={"username": "noa", "password": "1234", "first_name": "Noa"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+    details = [
+        {"question": f"Erreur {index} ?", "user_answer": "faux", "correct_answer": "vrai", "is_correct": False}
+        for index in range(1, 3)
+    ]
+    await client.post("/api/quiz/score", json={
+        "topic": "Histoire", "score": 0, "total_questions": 2, "learner_id": learner_id, "details": details
+    }, headers=auth_headers)
+
+    async def generate(context_items, api_key, source_text=None, user_id=None):
+        # Out of order, plus one question echoing no known error
+        questions = [
+            {"error_index": 2, "question": f"Sur : {context_items[1]['question']}", "options": ["a", "b"], "correct_answer": 0, "explanation": "..."},
+            {"error_index": 7, "question": "Hors sujet ?", "options": ["a", "b"], "correct_answer": 0, "explanation": "..."},
+            {"error_index": "1", "question": f"Sur : {context_items[0]['question']}", "options": ["a", "b"], "correct_answer": 0, "explanation": "..."},
+        ]
+        return {"quiz": {"topic": "Histoire (Correction)", "questions": questions}, "usage": {}}
+
+    monkeypatch.setattr(quiz_router, "generate_remediation_quiz_service", generate)
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    quiz = (await client.post("/api/quiz/remediation/generate", json={"learner_id": learner_id}, headers=auth_headers)).json()
+
+    assert len(quiz["questions"]) == 2
+    async with async_session_maker() as session:
+        for question in quiz["questions"]:
+            item = await session.get(RemediationQueue, uuid.UUID(question["remediation_id"]))
+            assert question["question"] == f"Sur : {item.question}"
+            assert "error_index" not in question
+
+@pytest.mark.anyio
+async def test_errors_due_together_are_reviewed_most_failed_first(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(llm_service, "_client", None)
+    MockOpenRouter(MockConfig()).install()
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    learner_id = uuid.uuid4()
+    due_at = datetime.utcnow() - timedelta(days=1)
+    async with async_session_maker() as session:
+        items = [
+            RemediationQueue(
+                learner_id=learner_id, original_content="Histoire", question=f"Question {index} ?", wrong_answer="a",
+                correct_answer="b", topic="Histoire", occurrences=occurrences, due_at=due_at
+            )
+            for index, occurrences in enumerate((1, 4, 2))
+        ]
+        session.add_all(items)
+        await session.commit()
+
+    quiz = (await client.post("/api/quiz/remediation/generate", json={"learner_id": str(learner_id)}, headers=auth_headers)).json()
+    assert [question["remediation_id"] for question in quiz["questions"]] == [str(items[index].id) for index in (1, 2, 0)]
+
+@pytest.mark.anyio
+async def test_reset_and_remediation_reuse_banked_questions(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(llm_service, "_client", None)
+    mock = MockOpenRouter(MockConfig())
+    mock.install()
+    monkeypatch.setattr(settings, "OPENROUTER_API_KEY", "mock-key")
+    child = await client.post("/api/auth/profiles", json={"username": "eve", "password": "1234", "first_name": "Ève"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+
+    quiz = (await client.post("/api/quiz/generate", json={"text_content": "La photosynthèse.", "learner_id": learner_id}, headers=auth_headers)).json()
+    assert mock.requests == 1
+
+    # First reset: served from the bank; second: every question was served twice, so regenerate
+    reset = (await client.post("/api/quiz/reset", json={"revision_id": quiz["revision_id"]}, headers=auth_headers)).json()
+    assert mock.requests == 1
+    assert sorted(q["question"] for q in reset["questions"]) == sorted(q["question"] for q in quiz["questions"])
+    await client.post("/api/quiz/reset", json={"revision_id": quiz["revision_id"]}, headers=auth_headers)
+    assert mock.requests == 2
+
+    await client.post("/api/quiz/score", json={
+        "topic": "Sciences", "score": 0, "total_questions": 1, "learner_id": learner_id, "revision_id": quiz["revision_id"],
+        "details": [{"question": "Que produit la photosynthèse ?", "user_answer": "CO2", "correct_answer": "O2", "is_correct": False}]
+    }, headers=auth_headers)
+    first = (await client.post("/api/quiz/remediation/generate", json={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert mock.requests == 3
+    second = (await client.post("/api/quiz/remediation/generate", json={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert mock.requests == 3
+    assert second["questions"][0]["remediation_id"] == first["questions"][0]["remediation_id"]
+
+@pytest.mark.anyio
+async def test_banking_skips_duplicates_and_delete_clears_the_bank(client, auth_headers):
+    revision_id = uuid.UUID(await _create_revision())
+    question = {"question": "Quand a eu lieu la prise de la Bastille ?", "options": ["1789", "1793"], "correct_answer": 0, "explanation": "En 1789."}
+    async with async_session_maker() as session:
+        await bank_questions(session, revision_id, 1, "Histoire", [question, dict(question)])
+        await session.commit()
+        # Banked again (e.g. by a concurrent generation): a no-op rather than an IntegrityError
+        await bank_questions(session, revision_id, 1, "Histoire", [question])
+        await session.commit()
+        rows = (await session.execute(select(BankQuestion).where(BankQuestion.revision_id == revision_id))).scalars().all()
+    assert len(rows) == 1
+
+    assert (await client.delete(f"/api/quiz/revision/{revision_id}", headers=auth_headers)).status_code == 200
+    async with async_session_maker() as session:
+        assert not (await session.execute(select(BankQuestion).where(BankQuestion.revision_id == revision_id))).scalars().all()
+
+@pytest.mark.anyio
+async def test_topic_fields_are_set_on_write():
+    async with async_session_maker() as session:
+        revision = Revision(learner_id=None, topic="Maths (Correction)", text_content="1 + 1 = 2")
+        session.add(revision)
+        await session.commit()
+        assert revision.topic_key == "Maths" and revision.is_remediation
+
+        revision.topic = "Maths"
+        await session.commit()
+        assert revision.topic_key == "Maths" and not revision.is_remediation
+
+def test_truncated_quizzes_are_not_repaired():
+    truncated = '{"topic": "Histoire", "questions": [{"id": 1, "question": "Qui ?"}, {"id": 2, "question": "Quand ?"'
+    assert parse_llm_json(truncated)["questions"][0]["id"] == 1 # Lenient (remediation)
+    assert parse_llm_json(truncated, repair=False) is None # Strict (quiz generation)
@@ -0,0 +1,99 @@
+import asyncio
+import time
+import uuid
+import pytest
+from app.core.db import engine
+from app.core.state import LockTimeout, MemoryStateBackend, RedisStateBackend, SQLStateBackend
+
+class FakeRedis:
+    """The subset of the redis.asyncio API (decode_responses=True) used by RedisStateBackend."""
+
+    def __init__(self):
+        self.data = {}
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry and entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+    async def get(self, key):
+        entry = self._live(key)
+        return entry[0] if entry else None
+
+    async def set(self, key, value, px=None, nx=False):
+        if nx and self._live(key):
+            return None
+        self.data[key] = (str(value), time.monotonic() + px / 1000 if px else None)
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def incrby(self, key, amount):
+        entry = self._live(key)
+        value = int(entry[0]) + amount if entry else amount
+        self.data[key] = (str(value), entry[1] if entry else None)
+        return value
+
+    async def pexpire(self, key, ms):
+        entry = self._live(key)
+        if entry:
+            self.data[key] = (entry[0], time.monotonic() + ms / 1000)
+
+    async def eval(self, script, numkeys, key, token):
+        # Only the compare-and-delete release script
+        if await self.get(key) == token:
+            return await self.delete(key)
+        return 0
+
+@pytest.fixture(params=["memory", "sql", "redis"])
+def backend(request):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "sql":
+        return SQLStateBackend(engine)
+    return RedisStateBackend(FakeRedis())
+
+@pytest.mark.anyio
+async def test_values_expire_and_round_trip_as_json(backend):
+    key = f"test:{uuid.uuid4()}"
+    await backend.set(key, {"questions": [1, 2]}, ttl=60)
+    assert await backend.get(key) == {"questions": [1, 2]}
+
+    await backend.set(key, "short", ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await backend.get(key) is None
+
+    await backend.set(key, 1, ttl=60)
+    await backend.delete(key)
+    assert await backend.get(key) is None
+
+@pytest.mark.anyio
+async def test_counters_and_rate_limits_use_fixed_windows(backend):
+    key = f"test:{uuid.uuid4()}"
+    assert [await backend.incr(key, ttl=0.2) for _ in range(3)] == [1, 2, 3]
+    await asyncio.sleep(0.3)
+    assert await backend.incr(key, 5, ttl=0.2) == 5
+
+    assert [await backend.hit(key, limit=2, window=60) for _ in range(3)] == [True, True, False]
+
+@pytest.mark.anyio
+async def test_lock_is_exclusive(backend):
+    name = f"test-{uuid.uuid4()}"
+    order = []
+
+    async def worker(label):
+        async with backend.lock(name, ttl=5, timeout=5, poll=0.01):
+            order.append(f"{label}-in")
+            await asyncio.sleep(0.05)
+            order.append(f"{label}-out")
+
+    await asyncio.gather(worker("a"), worker("b"))
+    assert order in (["a-in", "a-out", "b-in", "b-out"], ["b-in", "b-out", "a-in", "a-out"])
+
+    async with backend.lock(name, ttl=5):
+        with pytest.raises(LockTimeout):
+            async with backend.lock(name, timeout=0.05, poll=0.01):
+                pass
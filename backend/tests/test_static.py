@@ -0,0 +1,49 @@
+import re
+import pytest
+
+async def _hashed_script(client) -> str:
+    """The fingerprinted bundle referenced by the served index.html."""
+    return re.search(r'src="(/assets/[^"]+\.js)"', (await client.get("/")).text).group(1)
+
+@pytest.mark.anyio
+async def test_hashed_asset_is_precompressed_and_immutable(client):
+    asset = await _hashed_script(client)
+    response = await client.get(asset, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "immutable" in response.headers["cache-control"]
+    assert "javascript" in response.headers["content-type"]
+
+    # Revalidation with the ETag (any encoding variant) is a 304
+    response = await client.get(asset, headers={"If-None-Match": response.headers["etag"]})
+    assert response.status_code == 304
+
+@pytest.mark.anyio
+async def test_spa_routes_serve_index_with_revalidation(client):
+    response = await client.get("/dashboard/history")
+    assert response.status_code == 200
+    assert "<html" in response.text.lower()
+    assert response.headers["cache-control"] == "no-cache"
+
+    response = await client.get("/dashboard", headers={"If-Modified-Since": response.headers["last-modified"]})
+    assert response.status_code == 304
+
+@pytest.mark.anyio
+async def test_missing_files_are_404(client):
+    assert (await client.get("/assets/missing-123.js")).status_code == 404
+    assert (await client.get("/logo-missing.png")).status_code == 404
+    assert (await client.get("/api/does-not-exist")).status_code == 404
+
+def test_precompressed_variants_are_reused(tmp_path):
+    import gzip
+    from app.core.static import StaticIndex, precompress
+
+    (tmp_path / "app.js").write_text("console.log('reviflow');\n" * 100)
+    assert precompress(str(tmp_path)) >= 1
+    assert precompress(str(tmp_path)) == 0 # Up to date
+
+    # Indexing reads the sibling instead of compressing, and never serves it as a file
+    (tmp_path / "app.js.gz").write_bytes(gzip.compress(b"prebuilt"))
+    index = StaticIndex(str(tmp_path))
+    assert gzip.decompress(index.get("app.js").variants["gzip"]) == b"prebuilt"
+    assert "app.js.gz" not in index
@@ -0,0 +1,94 @@
+import json
+import uuid
+from datetime import datetime
+import pytest
+from app.cli import rebuild_learner_stats
+from app.core.db import async_session_maker
+from app.modules.quiz.models import LearnerStats, Revision
+from app.modules.quiz import stats as stats_module
+from app.modules.quiz.stats import (
+    TIME_PER_QUIZ, TIME_PER_REVISION, compute_stats, empty_stats, get_stats, get_stats_many, record_revision
+)
+
+@pytest.mark.anyio
+async def test_rollup_is_maintained_on_write(client, auth_headers):
+    child = await client.post("/api/auth/profiles", json={"username": f"kid-{uuid.uuid4().hex[:8]}", "password": "1234", "first_name": "Léa"}, headers=auth_headers)
+    learner_id = child.json()["user"]["profile_id"]
+    async with async_session_maker() as session:
+        revision = Revision(learner_id=uuid.UUID(learner_id), topic="Géographie", text_content="Les fleuves de France.")
+        session.add(revision)
+        await session.commit()
+        revision_id = str(revision.id)
+
+    wrong = {"question": "Quel est le plus long fleuve de France ?", "user_answer": "La Seine", "correct_answer": "La Loire", "is_correct": False}
+    for topic, score in (("Géographie", 1), ("Géographie (Correction)", 2)):
+        response = await client.post("/api/quiz/score", json={
+            "topic": topic, "score": score, "total_questions": 2, "learner_id": learner_id, "revision_id": revision_id,
+            "details": [wrong] if score == 1 else []
+        }, headers=auth_headers)
+        assert response.status_code == 200
+
+    mastery = (await client.get("/api/quiz/stats/mastery", params={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert [(row["topic"], row["quizzes_count"], row["pending_errors"]) for row in mastery] == [("Géographie", 2, 1)]
+    # (50*1 + 100*2) / 3 - 1 pending error * 3
+    assert mastery[0]["mastery_score"] == 80
+
+    activity = (await client.get("/api/quiz/stats/activity", params={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert activity["summary"]["today_minutes"] == TIME_PER_REVISION + 2 * TIME_PER_QUIZ
+    assert activity["summary"]["total_quizzes"] == 2
+    revisions = (await client.get("/api/quiz/revisions", params={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert revisions[0]["pending_errors"] == 1
+
+    # The incremental rollup matches a rebuild from the raw rows
+    async with async_session_maker() as session:
+        stored = json.loads((await session.get(LearnerStats, uuid.UUID(learner_id))).data)
+        assert stored == await compute_stats(session, uuid.UUID(learner_id))
+
+    await client.delete(f"/api/quiz/revision/{revision_id}", headers=auth_headers)
+    activity = (await client.get("/api/quiz/stats/activity", params={"learner_id": learner_id}, headers=auth_headers)).json()
+    assert activity["summary"] == {"today_minutes": 0, "week_minutes": 0, "total_quizzes": 0, "total_revisions": 0}
+
+    assert await rebuild_learner_stats([uuid.UUID(learner_id)]) == 1
+
+@pytest.mark.anyio
+async def test_reads_do_not_create_the_rollup_and_writes_yield_to_a_concurrent_one():
+    learner_id = uuid.uuid4()
+    async with async_session_maker() as session:
+        session.add(Revision(learner_id=learner_id, topic="Sciences", text_content="Les volcans."))
+        await session.commit()
+        assert (await get_stats(session, learner_id))["revisions"] == 1
+        assert (await get_stats_many(session, [learner_id]))[learner_id]["revisions"] == 1
+        assert await session.get(LearnerStats, learner_id) is None
+
+    # Another request created the row after this one found it missing
+    async with async_session_maker() as session:
+        session.add(LearnerStats(learner_id=learner_id, data=json.dumps(empty_stats())))
+        await session.commit()
+    async with async_session_maker() as session:
+        created = await stats_module._create(session, learner_id, empty_stats())
+        await record_revision(session, learner_id, datetime.utcnow())
+        await session.commit()
+        assert not created
+        assert json.loads((await session.get(LearnerStats, learner_id)).data)["revisions"] == 1
+
+@pytest.mark.anyio
+async def test_dashboard_summarizes_every_child(client, auth_headers):
+    learner_ids = []
+    for name in ("Zoé", "Yanis"):
+        child = await client.post("/api/auth/profiles", json={"username": f"dash-{uuid.uuid4().hex[:8]}", "password": "1234", "first_name": name}, headers=auth_headers)
+        learner_ids.append(child.json()["user"]["profile_id"])
+
+    wrong = {"question": "7 x 8 ?", "user_answer": "54", "correct_answer": "56", "is_correct": False}
+    await client.post("/api/quiz/score", json={
+        "topic": "Maths", "score": 3, "total_questions": 4, "learner_id": learner_ids[0], "details": [wrong]
+    }, headers=auth_headers)
+
+    response = await client.get("/api/quiz/stats/dashboard", headers=auth_headers)
+    assert response.status_code == 200
+    by_learner = {row["profile"]["id"]: row for row in response.json()}
+    assert set(learner_ids) <= set(by_learner)
+
+    zoe, yanis = by_learner[learner_ids[0]], by_learner[learner_ids[1]]
+    assert [(row["topic"], row["pending_errors"]) for row in zoe["mastery"]] == [("Maths", 1)]
+    assert zoe["activity"]["total_quizzes"] == 1 and zoe["remediation_due"] == 1
+    assert yanis["mastery"] == [] and yanis["activity"]["today_minutes"] == 0 and yanis["remediation_due"] == 0
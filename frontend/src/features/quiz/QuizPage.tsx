@@ -17,6 +17,7 @@ interface Question {
     options: string[];
     correct_answer: number;
     explanation: string;
+    remediation_id?: string; // Remediation quizzes: the error this question reviews
 }
 
 interface QuizResponse {
@@ -161,7 +162,8 @@ export function QuizPage() {
             user_answer: currentQ.options[selectedOption],
             correct_answer: currentQ.options[currentQ.correct_answer],
             is_correct: isCorrect,
-            original_content: null
+            original_content: null,
+            remediation_id: currentQ.remediation_id ?? null
         }]);
     };
 